@@ -0,0 +1,503 @@
+import os
+import atexit
+import json
+import Queue
+import numpy
+import BackgroundWriter
+
+# record of a threshold crossing in the event column (the step is stored in the step index column)
+EVENT_DTYPE = numpy.dtype([("node", numpy.int32), ("direction", numpy.int8), ("value", numpy.float64)])
+
+class ActivationRecorder:
+    """Records the activation of dynamic fields into one chunked binary store.
+    The store is a directory with a manifest (manifest.json) that holds the
+    schema of each recorded column (shape, dtype, and file names) and two
+    files per column: <column>.dat contains the recorded activations back to
+    back in binary form, <column>.steps the step index (int64) of each of
+    them. While recording, activations are only copied into a chunk buffer
+    per column; full chunks are appended to the files. A chunk holds
+    chunk_size records, but at most as many as fit into chunk_bytes bytes
+    (and at least one), so that large fields do not take large buffers.
+    If a background writer is given, the chunks are written in its thread.
+    Each column then has up to two chunk buffers (the second one is only
+    allocated when needed): one is filled, while the other one is written. If the writer falls behind and drops chunks (or there
+    is no free buffer), the records are dropped, which shows as a gap in
+    the step indices. With the "block" policy of the writer, recording
+    waits instead.
+    Besides the columns of activations, a recorder has one event column, in
+    which fields record threshold crossings (node ID, direction, and value).
+    The manifest maps the IDs of the event sources to their names."""
+
+    def __init__(self, directory="logs/recording", chunk_size=256, writer=None, chunk_bytes=4194304):
+        self._directory = directory
+        self._chunk_size = chunk_size
+        self._chunk_bytes = chunk_bytes
+        # background writer for the chunks (None to write in the calling thread)
+        self._writer = writer
+        # columns by their name
+        self._columns = {}
+        # column for threshold crossing events (created on first use) and
+        # the names of the event sources by their ID
+        self._event_column = None
+        self._event_sources = {}
+
+        if (not os.path.isdir(self._directory)):
+            os.makedirs(self._directory)
+
+        self._write_manifest()
+
+    def get_directory(self):
+        return self._directory
+
+    def get_chunk_size(self):
+        return self._chunk_size
+
+    def get_chunk_bytes(self):
+        return self._chunk_bytes
+
+    def get_writer(self):
+        return self._writer
+
+    def get_columns(self):
+        return list(self._columns.values())
+
+    def add_column(self, name, shape, dtype=numpy.float64):
+        """Creates a new column for the activation of a field with the given
+        shape. If there already is a column of that name, a number is appended."""
+        name = name.replace(" ", "_")
+        column_name = name
+        suffix = 1
+        while (column_name in self._columns):
+            column_name = name + "_" + str(suffix)
+            suffix += 1
+
+        column = ActivationColumn(self, column_name, shape, dtype)
+        self._columns[column_name] = column
+        self._write_manifest()
+
+        return column
+
+    def get_event_column(self):
+        "Returns the column that threshold crossing events are recorded in."
+        if (self._event_column is None or self._event_column.is_closed()):
+            self._event_column = self.add_column("events", (), EVENT_DTYPE)
+
+        return self._event_column
+
+    def add_event_source(self, source_id, name):
+        "Sets the name under which events with the given source ID appear in the manifest."
+        self._event_sources[source_id] = name
+        self._write_manifest()
+
+    def _remove_column(self, column):
+        del self._columns[column.get_name()]
+        if (column is self._event_column):
+            self._event_column = None
+        self._write_manifest()
+
+    def get_number_of_dropped_records(self):
+        number_of_dropped_records = 0
+        for column in self._columns.values():
+            number_of_dropped_records += column.get_number_of_dropped_records()
+
+        return number_of_dropped_records
+
+    def flush(self):
+        "Writes the buffered records of all columns to their files and waits until they are written."
+        for column in self._columns.values():
+            column.flush()
+
+        if (self._writer is not None):
+            self._writer.flush()
+
+    def close(self):
+        "Writes all buffered records and closes all columns."
+        for column in list(self._columns.values()):
+            column.close()
+
+        if (self._writer is not None):
+            self._writer.flush()
+
+    def _write_manifest(self):
+        manifest = {"version": 1, "columns": {}, "event_sources": {}}
+        for column in self._columns.values():
+            manifest["columns"][column.get_name()] = column.get_schema()
+
+        if (self._event_column is not None):
+            manifest["events"] = self._event_column.get_name()
+        for source_id, name in self._event_sources.items():
+            manifest["event_sources"][str(source_id)] = name
+
+        manifest_file = open(os.path.join(self._directory, "manifest.json"), 'w')
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        manifest_file.close()
+
+
+class ActivationColumn:
+    "Recorded activation of a single field. Created by ActivationRecorder.add_column()."
+
+    def __init__(self, recorder, name, shape, dtype):
+        self._recorder = recorder
+        self._name = name
+        self._shape = tuple(shape)
+        self._dtype = numpy.dtype(dtype)
+
+        # step index of the next record
+        self._step = 0
+        # number of records (buffered or written) and of dropped records
+        self._number_of_records = 0
+        self._number_of_dropped_records = 0
+
+        # number of records per chunk, limited by the size of the chunk in bytes
+        record_bytes = self._dtype.itemsize
+        for size in self._shape:
+            record_bytes *= size
+        self._chunk_size = max(1, min(recorder.get_chunk_size(), recorder.get_chunk_bytes() // max(1, record_bytes)))
+
+        # chunk buffers (data and step indices); the buffers that are
+        # currently filled are taken from the free buffers, handed to the
+        # writer when they are full, and put back after they have been
+        # written (the second buffer is only allocated when the first one
+        # is still being written)
+        self._free_buffers = Queue.Queue()
+        self._number_of_buffers = 0
+        self._data_buffer = None
+        self._step_buffer = None
+        self._buffered = 0
+
+        directory = recorder.get_directory()
+        self._data_file = open(os.path.join(directory, self._name + ".dat"), 'wb')
+        self._step_file = open(os.path.join(directory, self._name + ".steps"), 'wb')
+
+    def get_name(self):
+        return self._name
+
+    def get_shape(self):
+        return self._shape
+
+    def get_dtype(self):
+        return self._dtype
+
+    def get_number_of_records(self):
+        return self._number_of_records
+
+    def get_number_of_dropped_records(self):
+        return self._number_of_dropped_records
+
+    def get_schema(self):
+        # structured types (e.g., events) are stored with their fields
+        dtype = self._dtype.str
+        if (self._dtype.names is not None):
+            dtype = self._dtype.descr
+
+        return {"shape": list(self._shape),
+                "dtype": dtype,
+                "data": self._name + ".dat",
+                "steps": self._name + ".steps"}
+
+    def is_closed(self):
+        return self._data_file is None
+
+    def record(self, activation, step=None):
+        """Copies the activation into the chunk buffer and advances the step
+        index. If a step index is given, the record gets that index and later
+        records continue from there."""
+        if (step is not None):
+            self._step = step
+
+        if (self._data_buffer is None and not self._acquire_buffers()):
+            self._number_of_dropped_records += 1
+            self._step += 1
+            return
+
+        self._data_buffer[self._buffered] = activation
+        self._step_buffer[self._buffered] = self._step
+        self._buffered += 1
+        self._number_of_records += 1
+        self._step += 1
+
+        if (self._buffered == len(self._step_buffer)):
+            self._submit_chunk()
+
+    def flush(self):
+        "Hands the buffered records over to be appended to the files of the column."
+        if (self._buffered > 0 and self._data_file is not None):
+            self._submit_chunk(block=True)
+
+    def close(self):
+        """Writes the buffered records and closes the files. Columns without
+        any records are removed from the store."""
+        if (self._data_file is None):
+            return
+
+        data_file = self._data_file
+        step_file = self._step_file
+        self.flush()
+        self._data_file = None
+        self._step_file = None
+
+        if (self._number_of_records == 0):
+            # nothing has been handed to the writer, so the files can be removed right away
+            data_file.close()
+            step_file.close()
+            directory = self._recorder.get_directory()
+            os.remove(os.path.join(directory, self._name + ".dat"))
+            os.remove(os.path.join(directory, self._name + ".steps"))
+            self._recorder._remove_column(self)
+        else:
+            self._run(self._close_files, (data_file, step_file), block=True)
+
+    def _acquire_buffers(self):
+        if (self._free_buffers.empty() and self._number_of_buffers < 2):
+            self._number_of_buffers += 1
+            self._free_buffers.put((numpy.empty((self._chunk_size,) + self._shape, dtype=self._dtype),
+                                    numpy.empty(self._chunk_size, dtype=numpy.int64)))
+
+        writer = self._recorder.get_writer()
+        block = (writer is None or writer.get_policy() == "block")
+        try:
+            self._data_buffer, self._step_buffer = self._free_buffers.get(block)
+        except Queue.Empty:
+            return False
+
+        return True
+
+    def _submit_chunk(self, block=None):
+        chunk = (self._data_file, self._step_file, self._data_buffer, self._step_buffer, self._buffered)
+        self._data_buffer = None
+        self._step_buffer = None
+        self._buffered = 0
+
+        if (not self._run(self._write_chunk, chunk, block)):
+            self._number_of_records -= chunk[4]
+            self._number_of_dropped_records += chunk[4]
+            self._free_buffers.put((chunk[2], chunk[3]))
+
+    def _run(self, job, arguments, block=None):
+        "Runs the job in the thread of the writer of the recorder (if there is one)."
+        writer = self._recorder.get_writer()
+        if (writer is None or writer.is_closed()):
+            job(*arguments)
+            return True
+
+        return writer.submit(job, arguments, block)
+
+    def _write_chunk(self, data_file, step_file, data_buffer, step_buffer, number_of_records):
+        data_buffer[:number_of_records].tofile(data_file)
+        step_buffer[:number_of_records].tofile(step_file)
+        data_file.flush()
+        step_file.flush()
+        self._free_buffers.put((data_buffer, step_buffer))
+
+    def _close_files(self, data_file, step_file):
+        data_file.close()
+        step_file.close()
+
+
+class RecordingReader:
+    """Reads a store written by an ActivationRecorder. The columns are memory
+    mapped, so only the pages that are actually accessed are read from disk.
+    Columns are indexed by the name of the field (spaces may be used instead
+    of underscores), optionally followed by a range of steps and a spatial
+    slice, e.g., reader["eb0 intention field", 100:200, :, 5]."""
+
+    def __init__(self, directory="logs/recording"):
+        self._directory = directory
+
+        manifest_file = open(os.path.join(self._directory, "manifest.json"), 'r')
+        manifest = json.load(manifest_file)
+        manifest_file.close()
+        columns = manifest["columns"]
+
+        # name of the event column and the names of the event sources by their ID
+        self._event_column_name = None
+        if ("events" in manifest):
+            self._event_column_name = str(manifest["events"])
+        self._event_sources = {}
+        for source_id, name in manifest.get("event_sources", {}).items():
+            self._event_sources[int(source_id)] = str(name)
+
+        # schemas of the columns by their name
+        self._schemas = {}
+        for name in columns:
+            self._schemas[str(name)] = columns[name]
+
+        # columns that have been opened so far
+        self._columns = {}
+
+    def get_directory(self):
+        return self._directory
+
+    def get_names(self):
+        return sorted(self._schemas.keys())
+
+    def get_column(self, name):
+        name = name.replace(" ", "_")
+        if (name not in self._schemas):
+            raise KeyError("The recording contains no column \"" + name + "\".")
+
+        if (name not in self._columns):
+            self._columns[name] = RecordedColumn(self._directory, name, self._schemas[name])
+
+        return self._columns[name]
+
+    def get_event_sources(self):
+        "Returns the names of the event sources by their ID."
+        return self._event_sources
+
+    def get_events(self, name=None):
+        """Returns the recorded threshold crossings as a structured array with
+        the fields step, node, direction, and value. If a name is given, only
+        the events of the field(s) with that name are returned."""
+        dtype = [("step", numpy.int64)] + EVENT_DTYPE.descr
+        if (self._event_column_name is None or self._event_column_name not in self._schemas):
+            return numpy.zeros(0, dtype=dtype)
+
+        column = self.get_column(self._event_column_name)
+        records = column.get_records()
+        events = numpy.zeros(len(records), dtype=dtype)
+        events["step"] = column.get_steps()
+        for field in EVENT_DTYPE.names:
+            events[field] = records[field]
+
+        if (name is not None):
+            source_ids = [source_id for source_id in self._event_sources
+                          if self._event_sources[source_id].replace(" ", "_") == name.replace(" ", "_")]
+            events = events[numpy.in1d(events["node"], source_ids)]
+
+        return events
+
+    def __getitem__(self, key):
+        if (not isinstance(key, tuple)):
+            return self.get_column(key).get_records()
+
+        return self.get_column(key[0])[key[1:]]
+
+
+class RecordedColumn:
+    """Memory mapped column of a recording. Indexing with a step (or a slice
+    of steps) as the first index selects records by their step index, all
+    further indices select a part of the recorded activation."""
+
+    def __init__(self, directory, name, schema):
+        self._name = name
+        self._shape = tuple(schema["shape"])
+        if (isinstance(schema["dtype"], list)):
+            self._dtype = numpy.dtype([(str(field), str(dtype)) for field, dtype in schema["dtype"]])
+        else:
+            self._dtype = numpy.dtype(str(schema["dtype"]))
+
+        data_file_name = os.path.join(directory, schema["data"])
+        step_file_name = os.path.join(directory, schema["steps"])
+
+        # a recording that is still being written may end with an incomplete record
+        record_size = self._dtype.itemsize * int(numpy.prod(self._shape))
+        number_of_records = min(os.path.getsize(data_file_name) // record_size,
+                                os.path.getsize(step_file_name) // 8)
+
+        if (number_of_records == 0):
+            self._records = numpy.zeros((0,) + self._shape, dtype=self._dtype)
+            self._steps = numpy.zeros(0, dtype=numpy.int64)
+        else:
+            self._records = numpy.memmap(data_file_name, dtype=self._dtype, mode='r',
+                                         shape=(number_of_records,) + self._shape)
+            self._steps = numpy.memmap(step_file_name, dtype=numpy.int64, mode='r',
+                                       shape=(number_of_records,))
+
+    def get_name(self):
+        return self._name
+
+    def get_shape(self):
+        return self._shape
+
+    def get_dtype(self):
+        return self._dtype
+
+    def get_records(self):
+        "Returns all records (memory mapped) in the order they were recorded."
+        return self._records
+
+    def get_steps(self):
+        "Returns the step index of each record (memory mapped)."
+        return self._steps
+
+    def get_record_range(self, first_step=None, last_step=None):
+        """Returns the range of records (as a slice) whose steps lie in
+        [first_step, last_step). None means the beginning or end of the recording."""
+        start = 0
+        stop = len(self._steps)
+        if (first_step is not None):
+            start = int(numpy.searchsorted(self._steps, first_step, 'left'))
+        if (last_step is not None):
+            stop = int(numpy.searchsorted(self._steps, last_step, 'left'))
+
+        return slice(start, stop)
+
+    def __getitem__(self, key):
+        if (not isinstance(key, tuple)):
+            key = (key,)
+        if (len(key) == 0):
+            return self._records
+
+        time_index = key[0]
+        if (isinstance(time_index, slice)):
+            record_range = self.get_record_range(time_index.start, time_index.stop)
+            records = self._records[record_range][::time_index.step]
+            return records[(slice(None),) + key[1:]]
+
+        record_index = int(numpy.searchsorted(self._steps, time_index, 'left'))
+        if (record_index == len(self._steps) or self._steps[record_index] != time_index):
+            raise KeyError("Step " + str(time_index) + " has not been recorded in column \"" + self._name + "\".")
+
+        return self._records[(record_index,) + key[1:]]
+
+
+def save_snapshot(activation, file_name):
+    "Saves a single activation in binary form (numpy format), so that it can be memory mapped."
+    numpy.save(file_name, activation)
+
+def load_snapshot(file_name, shape=None):
+    """Returns the memory mapped activation of a snapshot. Snapshots in the old
+    text format (comma separated, e.g., snapshots/camera_field.txt) are parsed
+    once and converted to a binary file next to them (file name + ".npy"),
+    which is used from then on. The shape is only needed for text snapshots."""
+    if (file_name.endswith(".npy")):
+        return numpy.load(file_name, mmap_mode='r')
+
+    binary_file_name = file_name + ".npy"
+    if (not os.path.exists(binary_file_name) or
+        os.path.getmtime(binary_file_name) < os.path.getmtime(file_name)):
+        text_file = open(file_name, 'r')
+        activation = numpy.fromfile(text_file, sep=', ')
+        text_file.close()
+
+        if (shape is not None):
+            activation = activation.reshape(shape)
+
+        numpy.save(binary_file_name, activation)
+
+    activation = numpy.load(binary_file_name, mmap_mode='r')
+    if (shape is not None and activation.shape != tuple(shape)):
+        activation = activation.reshape(shape)
+
+    return activation
+
+
+# recorder that dynamic fields record into by default
+_default_recorder = None
+
+def get_default_recorder():
+    "Returns the default recorder (created on first use, closed on exit)."
+    global _default_recorder
+    if (_default_recorder is None):
+        _default_recorder = ActivationRecorder(writer=BackgroundWriter.get_default_writer())
+        atexit.register(_default_recorder.close)
+
+    return _default_recorder
+
+def set_default_recorder(recorder):
+    """Replaces the default recorder (e.g., to record into a different
+    directory in each process). The given recorder is closed on exit."""
+    global _default_recorder
+    _default_recorder = recorder
+    atexit.register(recorder.close)
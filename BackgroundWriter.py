@@ -0,0 +1,141 @@
+import atexit
+import threading
+import Queue
+
+class BackgroundWriter:
+    """Runs write jobs (serialization, file output, flushing) in a dedicated
+    thread, so that slow disks never extend a step of the architecture. The
+    step thread only enqueues jobs together with references to the data they
+    write. The queue is bounded; when it is full, the policy decides what
+    happens: "drop" discards the job (and counts it), "block" waits until the
+    writer has caught up (backpressure)."""
+
+    def __init__(self, max_queue_size=256, policy="drop"):
+        if (policy not in ("drop", "block")):
+            raise ValueError("Unknown policy \"" + str(policy) + "\" for the background writer.")
+
+        self._policy = policy
+        self._queue = Queue.Queue(max_queue_size)
+        self._number_of_dropped_jobs = 0
+        self._number_of_failed_jobs = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="background writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_policy(self):
+        return self._policy
+
+    def set_policy(self, policy):
+        if (policy not in ("drop", "block")):
+            raise ValueError("Unknown policy \"" + str(policy) + "\" for the background writer.")
+
+        self._policy = policy
+
+    def get_number_of_dropped_jobs(self):
+        return self._number_of_dropped_jobs
+
+    def get_number_of_failed_jobs(self):
+        return self._number_of_failed_jobs
+
+    def is_closed(self):
+        return self._closed
+
+    def get_number_of_queued_jobs(self):
+        return self._queue.qsize()
+
+    def submit(self, job, arguments=(), block=None):
+        """Enqueues the job (a callable) to be called with the given arguments
+        in the writer thread. If block is None, the policy of the writer decides
+        what happens when the queue is full. Returns False if the job was dropped."""
+        if (self._closed):
+            raise ValueError("The background writer has been closed.")
+
+        if (block is None):
+            block = (self._policy == "block")
+
+        try:
+            self._queue.put((job, arguments), block)
+        except Queue.Full:
+            self._number_of_dropped_jobs += 1
+            return False
+
+        return True
+
+    def flush(self):
+        "Waits until all enqueued jobs are done."
+        self._queue.join()
+
+    def close(self):
+        "Finishes all enqueued jobs and stops the writer thread."
+        if (self._closed):
+            return
+
+        self._queue.put((None, ()))
+        self._closed = True
+        self._thread.join()
+
+    def _run(self):
+        while (True):
+            job, arguments = self._queue.get()
+            if (job is None):
+                self._queue.task_done()
+                return
+
+            try:
+                job(*arguments)
+            except Exception as exception:
+                self._number_of_failed_jobs += 1
+                print("Error. A job of the background writer failed: " + str(exception))
+
+            self._queue.task_done()
+
+
+class TextLog:
+    """Text file that is written line by line by a background writer. The
+    values of a line are handed over as they are and are only converted to
+    text in the writer thread."""
+
+    def __init__(self, file_name, writer=None, separator="\t"):
+        if (writer is None):
+            writer = get_default_writer()
+
+        self._writer = writer
+        self._separator = separator
+        self._file = open(file_name, 'w')
+        self._closed = False
+
+    def write(self, *values):
+        "Enqueues a line with the given values. Returns False if it was dropped."
+        if (self._closed):
+            return False
+
+        return self._writer.submit(self._write_line, (values,))
+
+    def close(self):
+        "Closes the file after all enqueued lines have been written."
+        if (self._closed):
+            return
+
+        if (self._writer.is_closed()):
+            self._file.close()
+        else:
+            self._writer.submit(self._file.close, block=True)
+        self._closed = True
+
+    def _write_line(self, values):
+        self._file.write(self._separator.join([str(value) for value in values]) + "\n")
+
+
+# writer that is used by default (e.g., by the default activation recorder)
+_default_writer = None
+
+def get_default_writer():
+    "Returns the default background writer (created on first use, closed on exit)."
+    global _default_writer
+    if (_default_writer is None):
+        _default_writer = BackgroundWriter()
+        atexit.register(_default_writer.close)
+
+    return _default_writer
@@ -4,6 +4,7 @@ import Kernel
 import numpy
 import copy
 import DynamicField
+import Checkpoint
 import math_tools
 import CameraField
 import HeadSensorField
@@ -11,13 +12,42 @@ import HeadControl
 import EndEffectorControl
 import GripperControl
 import GripperSensor
+import MotionIO
 
 
 class GraspArchitecture():
-
-    def __init__(self):
+    """Architecture that finds a colored object and grasps or points at it.
+    Chains of processing steps between its fields are fused into single
+    connections (see DynamicField.connect()).
+
+    With use_node_bank, the nodes of the architecture (95 of them) are
+    stepped together by one DynamicField.NodeBank, which takes about a
+    tenth of the time of stepping them one by one (a step of the whole
+    architecture took 16 ms instead of 26 ms in a benchmark). The bank
+    updates all nodes from the outputs of the previous step, however, so
+    competitions and preconditions may be decided a step later than with
+    the default schedule (see DynamicField.StepSchedule). The bank is
+    therefore off by default; enable it where the timing of the decisions
+    does not need to match the original architecture.
+
+    With quiescence, fields and nodes (unless they are stepped by a node
+    bank) that have converged sleep until their input changes (see
+    DynamicField.set_quiescence()). Sleeping fields freeze within the
+    quiescence tolerance of their attractor, which shifts the trajectories
+    slightly, so quiescence is off by default as well.
+
+    The architecture talks to the robot through motion_io (the default
+    MotionIO if None) and video_proxy (a connection to ALVideoDevice of the
+    robot if None). Both may also connect to a MockNaoqi.MockNaoqiServer."""
+
+    def __init__(self, number_of_threads=1, synchronous=False, seed=None, use_node_bank=False, quiescence=False, motion_io=None, video_proxy=None):
         self.fields = []
 
+        # connection to the motion module, shared by all modules that talk to the robot
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
+
         ###############################################################################################################
         ########## ELEMENTARY BEHAVIORS
         ###############################################################################################################
@@ -36,7 +66,8 @@ class GraspArchitecture():
                                                     field_resolutions=[],
                                                     int_node_to_int_field_weight=find_color_int_weight,
                                                     cos_field_to_cos_node_weight=0,# NEEDS TO BE CHANGED BACK
-                                                    name="find color obj")
+                                                    name="find color obj",
+                                                    fuse_connections=True)
         find_color_intention_field = self._find_color.get_intention_field()
         find_color_intention_field.set_global_inhibition(30.)
         find_color_cos_field = self._find_color.get_intention_field()
@@ -59,7 +90,8 @@ class GraspArchitecture():
                                                     field_resolutions=[],
                                                     int_node_to_int_field_weight=find_color_ee_int_weight,
                                                     cos_field_to_cos_node_weight=0,# NEEDS TO BE CHANGED BACK
-                                                    name="find color ee")
+                                                    name="find color ee",
+                                                    fuse_connections=True)
 
         find_color_ee_intention_field = self._find_color_ee.get_intention_field()
         find_color_ee_intention_field.set_global_inhibition(15.)
@@ -97,7 +129,8 @@ class GraspArchitecture():
                                              int_node_to_int_field_weight=move_head_int_weight,
                                              name="move head",
                                              step_fields=True,
-                                             reactivating=True)
+                                             reactivating=True,
+                                             fuse_connections=True)
         self._move_head.get_cos_node().set_relaxation_time(10.0)
 
         # connect move head intention node to its cos field, so that the peak
@@ -105,7 +138,7 @@ class GraspArchitecture():
         int_node_to_cos_field_projection = DynamicField.Projection(0, move_head_field_dimensionality, set([]), [])
         weight = math_tools.gauss_2d(self._move_head_field_sizes, amplitude=4.2, sigmas=[1.0, 1.0], shifts=[self._move_head_field_sizes[0]/2., self._move_head_field_sizes[1]/2.])
         int_node_to_cos_field_weight = DynamicField.Weight(weight)
-        DynamicField.connect(self._move_head.get_intention_node(), self._move_head_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight])
+        DynamicField.connect(self._move_head.get_intention_node(), self._move_head_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight], fuse=True)
 
 
         ###############################################################################################################
@@ -139,7 +172,8 @@ class GraspArchitecture():
                                              cos_field=self._move_arm_cos_field,
                                              int_node_to_int_field_weight=move_right_arm_int_weight,
                                              name="move right arm",
-                                             step_fields=True)
+                                             step_fields=True,
+                                             fuse_connections=True)
 
         move_right_arm_cos_node = self._move_right_arm.get_cos_node()
         move_right_arm_cos_node.set_resting_level(-3.0)
@@ -149,7 +183,7 @@ class GraspArchitecture():
         # forms in the center of the cos field (cos for the move-right-arm behavior)
         int_node_to_cos_field_projection = DynamicField.Projection(0, move_head_field_dimensionality, set([]), [])
         int_node_to_cos_field_weight = DynamicField.Weight(3.0)
-        DynamicField.connect(self._move_right_arm.get_intention_node(), self._move_arm_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight])
+        DynamicField.connect(self._move_right_arm.get_intention_node(), self._move_arm_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight], fuse=True)
 
 
 
@@ -171,7 +205,8 @@ class GraspArchitecture():
                                              cos_field=self._move_arm_cos_field,
                                              int_node_to_int_field_weight=move_left_arm_int_weight,
                                              name="move left arm",
-                                             step_fields=True)
+                                             step_fields=True,
+                                             fuse_connections=True)
 
         move_left_arm_cos_node = self._move_left_arm.get_cos_node()
         move_left_arm_cos_node.set_resting_level(-3.0)
@@ -181,7 +216,7 @@ class GraspArchitecture():
         # forms in the center of the cos field (cos for the move-left-arm behavior)
         int_node_to_cos_field_projection = DynamicField.Projection(0, move_head_field_dimensionality, set([]), [])
         int_node_to_cos_field_weight = DynamicField.Weight(3.0)
-        DynamicField.connect(self._move_left_arm.get_intention_node(), self._move_arm_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight])
+        DynamicField.connect(self._move_left_arm.get_intention_node(), self._move_arm_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight], fuse=True)
 
 
         ###############################################################################################################
@@ -214,14 +249,15 @@ class GraspArchitecture():
                                              cos_field=self._visual_servoing_cos_field,
                                              int_node_to_int_field_weight=visual_servoing_right_int_weight,
                                              name="visual servoing right",
-                                             step_fields=True)
+                                             step_fields=True,
+                                             fuse_connections=True)
 
         # connect move right arm intention node to its cos field, so that the peak
         # forms in the center of the cos field (cos for the move-right-arm behavior)
         int_node_to_cos_field_projection = DynamicField.Projection(0, move_head_field_dimensionality, set([]), [])
         weight = math_tools.gauss_2d(self._visual_servoing_field_sizes, amplitude=4.0, sigmas=[2.0, 2.0], shifts=[self._visual_servoing_field_sizes[0]/2., self._visual_servoing_field_sizes[1]/2. - 3.0])
         int_node_to_cos_field_weight = DynamicField.Weight(weight)
-        DynamicField.connect(self._visual_servoing_right.get_intention_node(), self._visual_servoing_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight])
+        DynamicField.connect(self._visual_servoing_right.get_intention_node(), self._visual_servoing_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight], fuse=True)
 
 
         ###############################################################################################################
@@ -245,14 +281,15 @@ class GraspArchitecture():
                                              cos_field=self._visual_servoing_cos_field,
                                              int_node_to_int_field_weight=visual_servoing_left_int_weight,
                                              name="visual servoing left",
-                                             step_fields=True)
+                                             step_fields=True,
+                                             fuse_connections=True)
 
         # connect move left arm intention node to its cos field, so that the peak
         # forms in the center of the cos field (cos for the move-left-arm behavior)
         int_node_to_cos_field_projection = DynamicField.Projection(0, move_head_field_dimensionality, set([]), [])
         weight = math_tools.gauss_2d(self._visual_servoing_field_sizes, amplitude=3.0, sigmas=[3.5, 3.5], shifts=[self._visual_servoing_field_sizes[0]/2., self._visual_servoing_field_sizes[1]/2.])
         int_node_to_cos_field_weight = DynamicField.Weight(weight)
-        DynamicField.connect(self._visual_servoing_left.get_intention_node(), self._visual_servoing_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight])
+        DynamicField.connect(self._visual_servoing_left.get_intention_node(), self._visual_servoing_cos_field, [int_node_to_cos_field_projection, int_node_to_cos_field_weight], fuse=True)
 
 
         ###############################################################################################################
@@ -282,14 +319,16 @@ class GraspArchitecture():
         self._gripper_left_close = ElementaryBehavior(intention_field=self._gripper_left_intention_field,
                                                   cos_field=self._gripper_left_cos_field,
                                                   int_node_to_int_field_weight=gripper_left_close_int_weight,
-                                                  name="gripper left close")
+                                                  name="gripper left close",
+                                                  fuse_connections=True)
 
         # create elementary behavior: gripper open
         gripper_left_open_int_weight = math_tools.gauss_1d(self._gripper_field_size, amplitude=10, sigma=0.5, shift=self._gripper_field_size-1.0)
         self._gripper_left_open = ElementaryBehavior(intention_field=self._gripper_left_intention_field,
                                                   cos_field=self._gripper_left_cos_field,
                                                   int_node_to_int_field_weight=gripper_left_open_int_weight,
-                                                  name="gripper left open")
+                                                  name="gripper left open",
+                                                  fuse_connections=True)
 
         self.fields.append(self._gripper_left_intention_field)
         self.fields.append(self._gripper_left_cos_field)
@@ -319,14 +358,16 @@ class GraspArchitecture():
         self._gripper_right_close = ElementaryBehavior(intention_field=self._gripper_right_intention_field,
                                                   cos_field=self._gripper_right_cos_field,
                                                   int_node_to_int_field_weight=gripper_right_close_int_weight,
-                                                  name="gripper right close")
+                                                  name="gripper right close",
+                                                  fuse_connections=True)
 
         # create elementary behavior: gripper open
         gripper_right_open_int_weight = math_tools.gauss_1d(self._gripper_field_size, amplitude=10, sigma=0.5, shift=self._gripper_field_size-1.0)
         self._gripper_right_open = ElementaryBehavior(intention_field=self._gripper_right_intention_field,
                                                   cos_field=self._gripper_right_cos_field,
                                                   int_node_to_int_field_weight=gripper_right_open_int_weight,
-                                                  name="gripper right open")
+                                                  name="gripper right open",
+                                                  fuse_connections=True)
 
         self.fields.append(self._gripper_right_intention_field)
         self.fields.append(self._gripper_right_cos_field)
@@ -353,11 +394,11 @@ class GraspArchitecture():
 
         fc_int_to_color_space_projection = DynamicField.Projection(self._find_color.get_intention_field().get_dimensionality(), color_space_field_dimensionality, set([0]), [2])
         fc_int_to_color_space_weight = DynamicField.Weight(4.0)
-        DynamicField.connect(self._find_color.get_intention_field(), self._color_space_field, [fc_int_to_color_space_weight, fc_int_to_color_space_projection])
+        DynamicField.connect(self._find_color.get_intention_field(), self._color_space_field, [fc_int_to_color_space_weight, fc_int_to_color_space_projection], fuse=True)
 
         color_space_to_fc_cos_projection = DynamicField.Projection(color_space_field_dimensionality, self._find_color.get_cos_field().get_dimensionality(), set([2]), [0])
         color_space_to_fc_cos_weight = DynamicField.Weight(8.0)
-        DynamicField.connect(self._color_space_field, self._find_color.get_cos_field(), [color_space_to_fc_cos_projection, color_space_to_fc_cos_weight])
+        DynamicField.connect(self._color_space_field, self._find_color.get_cos_field(), [color_space_to_fc_cos_projection, color_space_to_fc_cos_weight], fuse=True)
 
 
         ###############################################################################################################
@@ -376,29 +417,29 @@ class GraspArchitecture():
 
         fc_int_to_color_space_ee_projection = DynamicField.Projection(self._find_color_ee.get_intention_field().get_dimensionality(), color_space_ee_field_dimensionality, set([0]), [2])
         fc_int_to_color_space_ee_weight = DynamicField.Weight(4.0)
-        DynamicField.connect(self._find_color_ee.get_intention_field(), self._color_space_ee_field, [fc_int_to_color_space_ee_weight, fc_int_to_color_space_ee_projection])
+        DynamicField.connect(self._find_color_ee.get_intention_field(), self._color_space_ee_field, [fc_int_to_color_space_ee_weight, fc_int_to_color_space_ee_projection], fuse=True)
 
         color_space_ee_to_fc_cos_projection = DynamicField.Projection(color_space_ee_field_dimensionality, self._find_color_ee.get_cos_field().get_dimensionality(), set([2]), [0])
         color_space_ee_to_fc_cos_weight = DynamicField.Weight(8.0)
-        DynamicField.connect(self._color_space_ee_field, self._find_color_ee.get_cos_field(), [color_space_ee_to_fc_cos_projection, color_space_ee_to_fc_cos_weight])
+        DynamicField.connect(self._color_space_ee_field, self._find_color_ee.get_cos_field(), [color_space_ee_to_fc_cos_projection, color_space_ee_to_fc_cos_weight], fuse=True)
 
 
         color_space_ee_to_move_arm_cos_projection = DynamicField.Projection(color_space_ee_field_dimensionality, self._move_left_arm.get_cos_field().get_dimensionality(), set([0,1]), [0,1])
         color_space_ee_to_move_arm_cos_weight = DynamicField.Weight(3.0)
-        DynamicField.connect(self._color_space_ee_field, self._move_left_arm.get_cos_field(), [color_space_ee_to_move_arm_cos_weight, color_space_ee_to_move_arm_cos_projection])
+        DynamicField.connect(self._color_space_ee_field, self._move_left_arm.get_cos_field(), [color_space_ee_to_move_arm_cos_weight, color_space_ee_to_move_arm_cos_projection], fuse=True)
 
 
         color_space_ee_to_visual_servoing_right_int_projection = DynamicField.Projection(color_space_ee_field_dimensionality, visual_servoing_field_dimensionality, set([0,1]), [0,1])
         color_space_ee_to_visual_servoing_right_int_weight = DynamicField.Weight(4.0)
-        DynamicField.connect(self._color_space_ee_field, self._visual_servoing_right.get_intention_field(), [color_space_ee_to_visual_servoing_right_int_weight, color_space_ee_to_visual_servoing_right_int_projection])
+        DynamicField.connect(self._color_space_ee_field, self._visual_servoing_right.get_intention_field(), [color_space_ee_to_visual_servoing_right_int_weight, color_space_ee_to_visual_servoing_right_int_projection], fuse=True)
 
         color_space_ee_to_visual_servoing_right_cos_projection = DynamicField.Projection(color_space_ee_field_dimensionality, visual_servoing_field_dimensionality, set([0,1]), [0,1])
         color_space_ee_to_visual_servoing_right_cos_weight = DynamicField.Weight(4.0)
-        DynamicField.connect(self._color_space_ee_field, self._visual_servoing_right.get_cos_field(), [color_space_ee_to_visual_servoing_right_cos_weight, color_space_ee_to_visual_servoing_right_cos_projection])
+        DynamicField.connect(self._color_space_ee_field, self._visual_servoing_right.get_cos_field(), [color_space_ee_to_visual_servoing_right_cos_weight, color_space_ee_to_visual_servoing_right_cos_projection], fuse=True)
 
         color_space_ee_to_visual_servoing_left_int_projection = DynamicField.Projection(color_space_ee_field_dimensionality, visual_servoing_field_dimensionality, set([0,1]), [0,1])
         color_space_ee_to_visual_servoing_left_int_weight = DynamicField.Weight(4.0)
-        DynamicField.connect(self._color_space_ee_field, self._visual_servoing_left.get_intention_field(), [color_space_ee_to_visual_servoing_left_int_weight, color_space_ee_to_visual_servoing_left_int_projection])
+        DynamicField.connect(self._color_space_ee_field, self._visual_servoing_left.get_intention_field(), [color_space_ee_to_visual_servoing_left_int_weight, color_space_ee_to_visual_servoing_left_int_projection], fuse=True)
 
 
         ###############################################################################################################
@@ -417,7 +458,7 @@ class GraspArchitecture():
 
         color_space_to_spatial_target_projection = DynamicField.Projection(color_space_field_dimensionality, spatial_target_field_dimensionality, set([0, 1]), [0, 1])
         color_space_to_spatial_target_weight = DynamicField.Weight(5.6)
-        DynamicField.connect(self._color_space_field, self._spatial_target_field, [color_space_to_spatial_target_projection, color_space_to_spatial_target_weight])
+        DynamicField.connect(self._color_space_field, self._spatial_target_field, [color_space_to_spatial_target_projection, color_space_to_spatial_target_weight], fuse=True)
 
         spatial_target_to_move_head_int_weight = DynamicField.Weight(4.0)
         DynamicField.connect(self._spatial_target_field, self._move_head.get_intention_field(), [spatial_target_to_move_head_int_weight])
@@ -436,7 +477,7 @@ class GraspArchitecture():
         ###############################################################################################################
 
         # create "camera" field
-        self._camera_field = CameraField.NaoCameraField()
+        self._camera_field = CameraField.NaoCameraField(video_proxy=video_proxy)
         self._camera_field.set_name("camera_field")
         self.fields.append(self._camera_field)
         self._camera_field_sizes = self._camera_field.get_output_dimension_sizes()
@@ -452,7 +493,7 @@ class GraspArchitecture():
         ###############################################################################################################
 
         # create head control connectable
-        self._head_control = HeadControl.HeadControl(self._move_head_field_sizes, head_speed_fraction = 0.01)
+        self._head_control = HeadControl.HeadControl(self._move_head_field_sizes, head_speed_fraction = 0.01, motion_io = self._motion_io)
         DynamicField.connect(self._move_head.get_intention_field(), self._head_control)
 
 
@@ -461,7 +502,7 @@ class GraspArchitecture():
         ###############################################################################################################
 
         # create head sensor field
-        self._head_sensor_field = HeadSensorField.NaoHeadSensorField()
+        self._head_sensor_field = HeadSensorField.NaoHeadSensorField(motion_io=self._motion_io)
         self._head_sensor_field.set_name("head_sensor_field")
         self.fields.append(self._head_sensor_field)
         self._head_sensor_field_sizes = self._head_sensor_field.get_output_dimension_sizes()
@@ -484,7 +525,7 @@ class GraspArchitecture():
         weight_left = numpy.tanh(20 * grid_h) * 5.2
         head_sensor_field_to_side_left_weight = DynamicField.Weight(weight_left)
 
-        DynamicField.connect(self._head_sensor_field, self._side_left, [head_sensor_field_to_side_left_weight, head_sensor_field_to_side_left_projection])
+        DynamicField.connect(self._head_sensor_field, self._side_left, [head_sensor_field_to_side_left_weight, head_sensor_field_to_side_left_projection], fuse=True)
 
         # node that represents the right side
         self._side_right = DynamicField.DynamicField([], [], None)
@@ -494,7 +535,7 @@ class GraspArchitecture():
         weight_right = numpy.tanh(20 * grid_h) * 5.2
         head_sensor_field_to_side_right_weight = DynamicField.Weight(weight_right)
 
-        DynamicField.connect(self._head_sensor_field, self._side_right, [head_sensor_field_to_side_right_weight, head_sensor_field_to_side_right_projection])
+        DynamicField.connect(self._head_sensor_field, self._side_right, [head_sensor_field_to_side_right_weight, head_sensor_field_to_side_right_projection], fuse=True)
 
 
         ###############################################################################################################
@@ -502,8 +543,8 @@ class GraspArchitecture():
         ###############################################################################################################
 
         # create end effector control connectable
-        self._end_effector_control_right = EndEffectorControl.EndEffectorControlRight(self._head_sensor_field, self._move_right_arm.get_intention_field(), self._visual_servoing_right.get_intention_field(), self._move_arm_field_sizes)
-        self._end_effector_control_left = EndEffectorControl.EndEffectorControlLeft(self._head_sensor_field, self._move_left_arm.get_intention_field(), self._visual_servoing_left.get_intention_field(), self._move_arm_field_sizes)
+        self._end_effector_control_right = EndEffectorControl.EndEffectorControlRight(self._head_sensor_field, self._move_right_arm.get_intention_field(), self._visual_servoing_right.get_intention_field(), self._move_arm_field_sizes, motion_io = self._motion_io)
+        self._end_effector_control_left = EndEffectorControl.EndEffectorControlLeft(self._head_sensor_field, self._move_left_arm.get_intention_field(), self._visual_servoing_left.get_intention_field(), self._move_arm_field_sizes, motion_io = self._motion_io)
 
 
         ###############################################################################################################
@@ -511,11 +552,11 @@ class GraspArchitecture():
         ###############################################################################################################
 
         # create gripper control for the right hand
-        self._gripper_control_right = GripperControl.NaoGripperControlRight(self._gripper_field_size, gripper_speed_fraction = 1.0)
+        self._gripper_control_right = GripperControl.NaoGripperControlRight(self._gripper_field_size, gripper_speed_fraction = 1.0, motion_io = self._motion_io)
         DynamicField.connect(self._gripper_right_open.get_intention_field(), self._gripper_control_right)
 
         # create gripper control for the left hand
-        self._gripper_control_left = GripperControl.NaoGripperControlLeft(self._gripper_field_size, gripper_speed_fraction = 1.0)
+        self._gripper_control_left = GripperControl.NaoGripperControlLeft(self._gripper_field_size, gripper_speed_fraction = 1.0, motion_io = self._motion_io)
         DynamicField.connect(self._gripper_left_open.get_intention_field(), self._gripper_control_left)
 
 
@@ -524,12 +565,12 @@ class GraspArchitecture():
         ###############################################################################################################
 
         # create gripper sensor for the right hand
-        self._gripper_sensor_right = GripperSensor.NaoGripperSensorRight(self._gripper_field_size)
+        self._gripper_sensor_right = GripperSensor.NaoGripperSensorRight(self._gripper_field_size, motion_io=self._motion_io)
         gripper_sensor_right_weight = DynamicField.Weight(4.0)
         DynamicField.connect(self._gripper_sensor_right, self._gripper_right_open.get_cos_field(), [gripper_sensor_right_weight])
 
         # create gripper sensor for the left hand
-        self._gripper_sensor_left = GripperSensor.NaoGripperSensorLeft(self._gripper_field_size)
+        self._gripper_sensor_left = GripperSensor.NaoGripperSensorLeft(self._gripper_field_size, motion_io=self._motion_io)
         gripper_sensor_left_weight = DynamicField.Weight(4.0)
         DynamicField.connect(self._gripper_sensor_left, self._gripper_left_open.get_cos_field(), [gripper_sensor_left_weight])
 
@@ -694,51 +735,103 @@ class GraspArchitecture():
         connect_to_task(self._task_node_point, self._visual_servoing_right)
         connect_to_task(self._task_node_point, self._visual_servoing_left)
 
+        ###############################################################################################################
+        # STEP SCHEDULE
+        ###############################################################################################################
+
+        connectables = self._get_connectables_in_step_order()
+        self._step_schedule = DynamicField.StepSchedule(connectables,
+                                                       use_node_bank=use_node_bank,
+                                                       number_of_threads=number_of_threads,
+                                                       synchronous=synchronous)
+
+        # derive the random streams of all fields from the seed of the
+        # architecture and the position of the field in the step order (not
+        # its ID, which depends on what was built before in the process)
+        if (seed is not None):
+            fields = []
+            for connectable in connectables:
+                if (isinstance(connectable, DynamicField.DynamicField) and connectable not in fields):
+                    fields.append(connectable)
+            for i in range(len(fields)):
+                fields[i].set_random_seed(seed, i)
+
+        # let fields that have converged sleep until their input changes
+        if (quiescence):
+            for connectable in self._step_schedule.get_connectables():
+                if (connectable.__class__ is DynamicField.DynamicField):
+                    connectable.set_quiescence(True)
+
+        # only log when the nodes cross their threshold
+        for connectable in self._step_schedule.get_connectables():
+            for node in connectable.get_stepped_connectables():
+                if (node.__class__ is DynamicField.DynamicField and node.get_dimensionality() == 0):
+                    node.set_activation_log_mode("threshold")
+
     ###################################################################################################################
     # STEPPING
     ###################################################################################################################
 
+    def _get_connectables_in_step_order(self):
+        connectables = [self._task_node_grasp,
+                        self._task_node_point,
+                        self._camera_field]
+        connectables.extend(self._find_color.get_connectables())
+        connectables.extend(self._find_color_ee.get_connectables())
+        connectables.extend([self._color_space_field,
+                             self._color_space_ee_field,
+                             self._spatial_target_field,
+                             self._gripper_left_intention_field,
+                             self._gripper_left_cos_field])
+        connectables.extend(self._gripper_left_open.get_connectables())
+        connectables.extend(self._gripper_left_close.get_connectables())
+        connectables.extend([self._gripper_right_intention_field,
+                             self._gripper_right_cos_field])
+        connectables.extend(self._gripper_right_open.get_connectables())
+        connectables.extend(self._gripper_right_close.get_connectables())
+        connectables.extend(self._move_head.get_connectables())
+        connectables.append(self._head_control)
+
+        connectables.extend(self._move_right_arm.get_connectables())
+        connectables.extend(self._move_left_arm.get_connectables())
+        connectables.extend(self._visual_servoing_right.get_connectables())
+        connectables.extend(self._visual_servoing_left.get_connectables())
+
+        connectables.extend([self._head_sensor_field,
+                             self._side_left,
+                             self._side_right,
+                             self._gripper_sensor_right,
+                             self._gripper_sensor_left,
+                             self._end_effector_control_right,
+                             self._end_effector_control_left])
+
+        connectables.extend(self._preconditions)
+        connectables.extend(self._competitions)
+
+        return connectables
+
+    def get_step_schedule(self):
+        return self._step_schedule
+
+    def save_checkpoint(self, directory):
+        "Saves the state of the whole architecture (see Checkpoint.save_checkpoint())."
+        Checkpoint.save_checkpoint(self._step_schedule.get_connectables(), directory)
+
+    def restore_checkpoint(self, directory):
+        "Restores the state saved by save_checkpoint() into the existing buffers of the architecture."
+        Checkpoint.restore_checkpoint(self._step_schedule.get_connectables(), directory)
+
+    def get_motion_io(self):
+        return self._motion_io
+
     def step(self):
-        self._task_node_grasp.step()
-        self._task_node_point.step()
-        self._camera_field.step()
-        self._find_color.step()
-        self._find_color_ee.step()
-        self._color_space_field.step()
-        self._color_space_ee_field.step()
-#        print("color_space max: ", self._color_space_ee_field.get_activation().max())
-        self._spatial_target_field.step()
-        self._gripper_left_intention_field.step()
-        self._gripper_left_cos_field.step()
-        self._gripper_left_open.step()
-        self._gripper_left_close.step()
-        self._gripper_right_intention_field.step()
-        self._gripper_right_cos_field.step()
-        self._gripper_right_open.step()
-        self._gripper_right_close.step()
-        self._move_head.step()
-        self._head_control.step()
-
-        self._move_right_arm.step()
-        self._move_left_arm.step()
-        self._visual_servoing_right.step()
-        self._visual_servoing_left.step()
-
-        self._head_sensor_field.step()
-        self._side_left.step()
-        self._side_right.step()
-
-        self._gripper_sensor_right.step()
-        self._gripper_sensor_left.step()
-
-        self._end_effector_control_right.step()
-        self._end_effector_control_left.step()
-
-        for node in self._preconditions:
-            node.step() 
-
-        for node in self._competitions:
-            node.step() 
+        # the modules that talk to the robot read the sensors once per step and
+        # their motor commands are sent together at the end of the step
+        self._motion_io.begin_tick()
+        try:
+            self._step_schedule.step()
+        finally:
+            self._motion_io.end_tick()
 
 
 
@@ -841,7 +934,8 @@ class ElementaryBehavior:
                  reactivating = False,
                  log_activation = False,
                  step_fields = False,
-                 name = ""):
+                 name = "",
+                 fuse_connections = False):
 
         if (int_node_to_cos_node_weight is None):
             int_node_to_cos_node_weight = 2.0
@@ -873,6 +967,9 @@ class ElementaryBehavior:
         # does the node reactivate its intention, when the CoS node gets deactivated?
         self._reactivating = reactivating
 
+        # should chains of processing steps be fused (see DynamicField.connect())?
+        self._fuse_connections = fuse_connections
+
         # should the intention and CoS field be stepped, when the elementary
         # behavior is stepped?
         # if the fields belong to other elementary behaviors as well, make sure
@@ -914,7 +1011,8 @@ class ElementaryBehavior:
                              int_inhibition_weight = None,
                              reactivating = False,
                              log_activation = False,
-                             name = ""):
+                             name = "",
+                             fuse_connections = False):
 
         if (int_field_to_cos_field_weight is None):
             int_field_to_cos_field_weight = 4.0
@@ -945,7 +1043,8 @@ class ElementaryBehavior:
                    reactivating,
                    log_activation,
                    step_fields=True,
-                   name=name)
+                   name=name,
+                   fuse_connections=fuse_connections)
  
     def get_intention_node(self):
         return self._intention_node
@@ -969,14 +1068,14 @@ class ElementaryBehavior:
         # connect intention node to intention field
         self._intention_projection = DynamicField.Projection(0, self._intention_field.get_dimensionality(), set([]), [])
         intention_processing_steps = [self._intention_projection, self._int_node_to_int_field_weight]
-        DynamicField.connect(self._intention_node, self._intention_field, intention_processing_steps)
+        DynamicField.connect(self._intention_node, self._intention_field, intention_processing_steps, fuse=self._fuse_connections)
 
         # connect intention node to cos node
         DynamicField.connect(self._intention_node, self._cos_node, [self._int_node_to_cos_node_weight])
 
         # connect cos field to cos node
         self._cos_projection = DynamicField.Projection(self._cos_field.get_dimensionality(), 0, set([]), [])
-        DynamicField.connect(self._cos_field, self._cos_node, [self._cos_projection, self._cos_field_to_cos_node_weight])
+        DynamicField.connect(self._cos_field, self._cos_node, [self._cos_projection, self._cos_field_to_cos_node_weight], fuse=self._fuse_connections)
 
         # connect cos node to cos memory node
         DynamicField.connect(self._cos_node, self._cos_memory_node, [self._cos_node_to_cos_memory_node_weight])
@@ -987,7 +1086,8 @@ class ElementaryBehavior:
             intention_inhibition_node = self._cos_node
         DynamicField.connect(intention_inhibition_node, self._intention_node, [self._int_inhibition_weight])
 
-    def step(self):
+    def get_connectables(self):
+        "Returns the connectables that are stepped with this behavior, in step order."
         connectables = [self._intention_node,
                         self._cos_node,
                         self._cos_memory_node]
@@ -996,6 +1096,9 @@ class ElementaryBehavior:
             connectables.insert(1, self._intention_field)
             connectables.insert(2, self._cos_field)
 
-        for connectable in connectables:
+        return connectables
+
+    def step(self):
+        for connectable in self.get_connectables():
             connectable.step()
 
@@ -1,17 +1,101 @@
-import naoqi
-from naoqi import ALProxy
 import numpy
 import DynamicField
 import math_tools
+import ActivationRecorder
+import FrameGrabber
+
+class HueSaturationEncoder:
+    """Encodes the hue and saturation of an interleaved three channel image
+    (e.g., HSY, as delivered by ALVideoDevice) into the activation of a
+    three-dimensional field (two image dimensions and one hue dimension).
+
+    The image is rotated by 90 degrees (its columns become the first field
+    dimension) and sampled at the positions of the field cells. Each cell gets
+    its saturation, scaled to [-max_activation_level, max_activation_level],
+    in the hue bin of its pixel and -max_activation_level everywhere else; with
+    a hue_tuning_sigma, the saturation is spread over the neighboring hue bins
+    with a Gaussian profile instead. The cells at the border of the image
+    are always set to -max_activation_level.
+
+    Everything that does not depend on the image (the pixel indices of the
+    cells, lookup tables for all 256 hue and saturation values, and the
+    border mask) is computed once in the constructor."""
+
+    def __init__(self, image_width, image_height, field_sizes, max_activation_level=5.0, hue_tuning_sigma=None):
+        self._field_sizes = list(field_sizes)
+        self._max_activation_level = max_activation_level
+        self._hue_tuning_sigma = hue_tuning_sigma
+
+        # position of the pixel of each cell in the rotated image, at the
+        # same positions linear_interpolation_2d_custom() samples (pixels are
+        # taken as they are if the image size is a multiple of the field size;
+        # otherwise the nearest pixel is taken, as hue cannot be interpolated)
+        rotated_rows = self._sample_positions(image_width, field_sizes[0])
+        rotated_columns = self._sample_positions(image_height, field_sizes[1])
+
+        # rotating the image by 270 degrees maps the pixel (row, column) of the
+        # rotated image to the pixel (height - 1 - column, row) of the image
+        rows = (image_height - 1) - rotated_columns[numpy.newaxis, :]
+        columns = rotated_rows[:, numpy.newaxis]
+        self._hue_indices = 3 * (rows * image_width + columns)
+        self._saturation_indices = self._hue_indices + 1
+
+        values = numpy.arange(256)
+        number_of_hue_bins = field_sizes[2]
+        self._hue_bins = numpy.round(values * ((number_of_hue_bins - 1) / 255.)).astype(numpy.intp)
+        self._saturations = values * (2 * max_activation_level / 255.) - max_activation_level
+
+        if (hue_tuning_sigma is not None):
+            # Gaussian tuning curve over the hue bins for each hue value
+            centers = values * ((number_of_hue_bins - 1) / 255.)
+            distances = numpy.arange(number_of_hue_bins)[numpy.newaxis, :] - centers[:, numpy.newaxis]
+            self._hue_tuning = numpy.exp(- distances ** 2 / (2 * hue_tuning_sigma ** 2))
+
+        self._border_mask = numpy.zeros(field_sizes[0:2], dtype=bool)
+        self._border_mask[0, :] = True
+        self._border_mask[-1, :] = True
+        self._border_mask[:, 0] = True
+        self._border_mask[:, -1] = True
+
+    def _sample_positions(self, image_size, field_size):
+        positions = numpy.arange(field_size) * (float(image_size) / field_size)
+        return numpy.minimum(numpy.round(positions).astype(numpy.intp), image_size - 1)
+
+    def encode(self, image, activation):
+        """Writes the encoding of the image (a flat uint8 array of interleaved
+        channels) into activation (of the field sizes) and returns it."""
+        saturation = self._saturations.take(image.take(self._saturation_indices))
+        saturation[self._border_mask] = -self._max_activation_level
+
+        if (self._hue_tuning_sigma is None):
+            hue_bins = self._hue_bins.take(image.take(self._hue_indices))
+            activation.fill(-self._max_activation_level)
+            numpy.put_along_axis(activation, hue_bins[:, :, numpy.newaxis], saturation[:, :, numpy.newaxis], axis=2)
+        else:
+            self._hue_tuning.take(image.take(self._hue_indices), axis=0, out=activation)
+            saturation += self._max_activation_level
+            activation *= saturation[:, :, numpy.newaxis]
+            activation -= self._max_activation_level
+
+        return activation
+
 
 class NaoCameraField(DynamicField.DynamicField):
-    "Camera field"
+    """Camera field. By default, the frames are pulled by a frame grabber in a
+    background thread and each step encodes the newest frame (steps without a
+    new frame keep the activation). Otherwise, each step requests an image.
+    A video_proxy (e.g., a FrameGrabber.RecordedVideoDevice) may be given
+    instead of the connection to the robot."""
 
-    def __init__(self):
+    def __init__(self, hue_tuning_sigma=None, acquire_in_background=True, video_proxy=None):
         "Constructor"
         DynamicField.DynamicField.__init__(self, dimension_bounds = [[40],[30],[15]])
 
-        self._vision_proxy = ALProxy("ALVideoDevice", "nao.ini.rub.de", 9559)
+        if (video_proxy is None):
+            # the NAOqi SDK is only needed to talk to a real robot
+            from naoqi import ALProxy
+            video_proxy = ALProxy("ALVideoDevice", "nao.ini.rub.de", 9559)
+        self._vision_proxy = video_proxy
         self._gvm_name = "nao vision"
         self._gvm_name = self._vision_proxy.subscribe(self._gvm_name, 0, 12, 30)
         # switch off auto white balance
@@ -21,34 +105,46 @@ class NaoCameraField(DynamicField.DynamicField):
 
         self._name = "nao_camera_field"
 
+        # the subscription delivers 160x120 images (resolution 0) in HSY (color space 12)
+        self._encoder = HueSaturationEncoder(160, 120, self.get_input_dimension_sizes(), hue_tuning_sigma=hue_tuning_sigma)
+
+        self._frame_grabber = None
+        if (acquire_in_background):
+            self._frame_grabber = FrameGrabber.FrameGrabber(self._vision_proxy, self._gvm_name)
+        # timestamp and sequence number of the frame that was encoded last
+        self._frame_timestamp = None
+        self._frame_sequence_number = -1
+
     def __del__(self):
+        if (self._frame_grabber is not None):
+            self._frame_grabber.stop()
         self._gvm_name = self._vision_proxy.unsubscribe(self._gvm_name)
 
+    def get_frame_grabber(self):
+        return self._frame_grabber
+
+    def get_frame_timestamp(self):
+        "Returns the time at which the frame that is encoded in the activation was taken."
+        return self._frame_timestamp
+
+    def get_frame_sequence_number(self):
+        return self._frame_sequence_number
+
     def _step_computation(self):
-        naoimage = self._vision_proxy.getImageRemote(self._gvm_name)
-        hsv_image = numpy.fromstring(naoimage[6], dtype=numpy.uint8)
-        hue = hsv_image[::3].reshape(120,160)
-        saturation = hsv_image[1::3].reshape(120,160)
-        hue = numpy.rot90(hue, 3)
-        saturation = numpy.rot90(saturation, 3)
-
-        sizes = self.get_input_dimension_sizes()
-        max_activation_level = 5.0
-
-        hue = math_tools.linear_interpolation_2d_custom(hue, [sizes[0], sizes[1]])
-        saturation = math_tools.linear_interpolation_2d_custom(saturation, [sizes[0], sizes[1]])
-        hue = numpy.round(hue * ((sizes[2] - 1)/255.)).astype(numpy.int)
-        saturation = saturation * (2 * max_activation_level / 255.) - max_activation_level
-
-        for i in range(sizes[0]):
-            for j in range(sizes[1]):
-                color = hue[i][j]
-                self._activation[i][j] = -max_activation_level
-                self._activation[i][j][color] = saturation[i][j]
-        self._activation[0,:,:] = -max_activation_level
-        self._activation[sizes[0]-1,:,:] = -max_activation_level
-        self._activation[:,0,:] = -max_activation_level
-        self._activation[:,sizes[1]-1,:] = -max_activation_level
+        if (self._frame_grabber is None):
+            frame = FrameGrabber.frame_from_naoqi_image(self._vision_proxy.getImageRemote(self._gvm_name),
+                                                        self._frame_sequence_number + 1)
+        else:
+            frame = self._frame_grabber.get_latest_frame()
+            if (frame is None and self._frame_sequence_number < 0):
+                # there is nothing to perceive before the first frame
+                frame = self._frame_grabber.wait_for_frame()
+            if (frame is None or frame.get_sequence_number() == self._frame_sequence_number):
+                return
+
+        self._encoder.encode(frame.get_image(), self._activation)
+        self._frame_timestamp = frame.get_timestamp()
+        self._frame_sequence_number = frame.get_sequence_number()
 
         self._output_buffer = self.compute_thresholded_activation(self._activation)
 
@@ -71,11 +167,7 @@ class DummyCameraField(DynamicField.DynamicField):
     def __init__(self):
         "Constructor"
         DynamicField.DynamicField.__init__(self, dimension_bounds = [[40],[30],[15]])
-        camera_field_file = open("snapshots/camera_field.txt", 'r')
-        activation = numpy.fromfile(camera_field_file, sep=', ')
-        camera_field_file.close()
-
-        activation = activation.reshape(160,120,50)
+        activation = ActivationRecorder.load_snapshot("snapshots/camera_field.txt", (160,120,50))
         self._activation = math_tools.linear_interpolation_nd(activation, [40, 30, 15])
         self._output_buffer = self.compute_thresholded_activation(self._activation)
 
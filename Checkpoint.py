@@ -0,0 +1,181 @@
+import os
+import json
+import random
+import numpy
+import DynamicField
+
+# offsets of the arrays in the data file are multiples of this many bytes
+ARRAY_ALIGNMENT = 16
+
+class CheckpointError(Exception):
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+def collect_connectables(connectables):
+    """Returns the given connectables and every connectable that is connected
+    to them (directly or indirectly), including the nodes of node banks and
+    the processing steps inside fused connections, in a fixed order."""
+    collected = []
+    visited = set()
+    queue = list(connectables)
+    while (len(queue) > 0):
+        connectable = queue.pop(0)
+        if (connectable in visited):
+            continue
+        visited.add(connectable)
+        collected.append(connectable)
+
+        queue.extend(connectable.get_stepped_connectables())
+        queue.extend(connectable.get_incoming_connectables())
+        queue.extend(connectable.get_outgoing_connectables())
+        if (isinstance(connectable, DynamicField.FusedConnection)):
+            queue.extend(connectable.get_processing_steps())
+
+    return collected
+
+def save_checkpoint(connectables, directory):
+    """Saves the state of the given connectables and of everything connected to
+    them (activations, outputs, parameters, kernel parameters), together with
+    the state of the random number generators, into the given directory.
+    All arrays are written back to back into one binary file (state.dat); the
+    manifest (manifest.json) holds the plain values and the offset, shape and
+    dtype of each array for each connectable, in the order of
+    collect_connectables()."""
+    if (not os.path.isdir(directory)):
+        os.makedirs(directory)
+
+    manifest = {"version": 2, "connectables": []}
+    data_file = open(os.path.join(directory, "state.dat"), 'wb')
+    offset = 0
+
+    for connectable in collect_connectables(connectables):
+        entry = {"name": connectable.get_name(),
+                 "id": connectable.get_id(),
+                 "class": connectable.__class__.__name__,
+                 "arrays": {},
+                 "values": {}}
+
+        for key, value in connectable.get_checkpoint_state().items():
+            if (isinstance(value, numpy.ndarray)):
+                array = numpy.ascontiguousarray(value)
+                padding = (-offset) % ARRAY_ALIGNMENT
+                data_file.write(b"\0" * padding)
+                offset += padding
+
+                entry["arrays"][key] = {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+                array.tofile(data_file)
+                offset += array.nbytes
+            else:
+                entry["values"][key] = _to_json(value)
+
+        manifest["connectables"].append(entry)
+
+    data_file.close()
+
+    numpy_state = numpy.random.get_state()
+    manifest["random_state"] = {"numpy": [numpy_state[0], numpy_state[1].tolist()] + [_to_json(value) for value in numpy_state[2:]],
+                                "python": _to_json(random.getstate())}
+
+    manifest_file = open(os.path.join(directory, "manifest.json"), 'w')
+    json.dump(manifest, manifest_file, sort_keys=True)
+    manifest_file.close()
+
+def restore_checkpoint(connectables, directory):
+    """Restores the state saved by save_checkpoint() into the given connectables
+    and everything connected to them, writing the arrays into their existing
+    buffers. Connectables are matched to the manifest by their position in
+    the order of collect_connectables(), so the architecture has to be built
+    the same way as the saved one (its IDs may differ, e.g., if it was built
+    after other architectures in the same process); the class and the name
+    of each connectable are checked."""
+    manifest = _read_manifest(directory)
+    if (manifest.get("version") != 2):
+        raise CheckpointError("The checkpoint has an unsupported version.")
+    entries = manifest["connectables"]
+
+    collected = collect_connectables(connectables)
+    if (len(collected) != len(entries)):
+        raise CheckpointError("The checkpoint contains " + str(len(entries)) + " connectables, but the architecture contains " + str(len(collected)) + ".")
+
+    data = numpy.fromfile(os.path.join(directory, "state.dat"), dtype=numpy.uint8)
+
+    for connectable, entry in zip(collected, entries):
+        if (entry["class"] != connectable.__class__.__name__ or not _names_match(entry, connectable)):
+            raise CheckpointError("The connectable " + connectable.get_name() + " does not match the connectable " +
+                                  entry["name"] + " at its position in the checkpoint.")
+
+        state = dict(entry["values"])
+        for key, array_entry in entry["arrays"].items():
+            state[key] = _get_array(data, array_entry)
+
+        connectable.set_checkpoint_state(state)
+
+    random_state = manifest["random_state"]
+    numpy_state = random_state["numpy"]
+    numpy.random.set_state((str(numpy_state[0]), numpy.array(numpy_state[1], dtype=numpy.uint32)) + tuple(numpy_state[2:]))
+    random.setstate(_to_tuple(random_state["python"]))
+
+def load_checkpoint_array(directory, name, key="activation"):
+    """Returns an array of the connectable with the given name (e.g., its
+    activation) from a checkpoint, memory mapped and in its original shape."""
+    manifest = _read_manifest(directory)
+    for entry in manifest["connectables"]:
+        if (entry["name"] == name and key in entry["arrays"]):
+            array_entry = entry["arrays"][key]
+            return numpy.memmap(os.path.join(directory, "state.dat"),
+                                dtype=numpy.dtype(str(array_entry["dtype"])),
+                                mode='r',
+                                offset=array_entry["offset"],
+                                shape=tuple(array_entry["shape"]))
+
+    raise CheckpointError("The checkpoint does not contain the array " + key + " of " + name + ".")
+
+def _read_manifest(directory):
+    manifest_file = open(os.path.join(directory, "manifest.json"), 'r')
+    manifest = json.load(manifest_file)
+    manifest_file.close()
+
+    return manifest
+
+def _names_match(entry, connectable):
+    """Returns whether the connectable has the name saved in the manifest
+    entry. Default names end with the ID (e.g., weight12), so for them only
+    the part before the ID is compared."""
+    name = connectable.get_name()
+    saved_name = entry["name"]
+    connectable_id = str(connectable.get_id())
+    saved_id = str(entry["id"])
+    if (name.endswith(connectable_id) and saved_name.endswith(saved_id)):
+        return name[:-len(connectable_id)] == saved_name[:-len(saved_id)]
+
+    return name == saved_name
+
+def _get_array(data, array_entry):
+    "Returns a view of the array described by the manifest entry into the data."
+    dtype = numpy.dtype(str(array_entry["dtype"]))
+    shape = tuple(array_entry["shape"])
+    size = dtype.itemsize
+    for dimension_size in shape:
+        size *= dimension_size
+
+    offset = array_entry["offset"]
+    return data[offset:offset + size].view(dtype).reshape(shape)
+
+def _to_json(value):
+    "Converts numpy scalars (and the tuples of random states) into plain values."
+    if (isinstance(value, (list, tuple))):
+        return [_to_json(element) for element in value]
+    if (isinstance(value, dict)):
+        return dict([(key, _to_json(element)) for key, element in value.items()])
+    if (isinstance(value, numpy.generic)):
+        return value.item()
+
+    return value
+
+def _to_tuple(value):
+    if (isinstance(value, list)):
+        return tuple([_to_tuple(element) for element in value])
+
+    return value
@@ -1,10 +1,16 @@
 import math
-import random
+import multiprocessing.pool
 import Kernel
 import numpy
 import copy
 import scipy.interpolate
+import scipy.sparse
 import math_tools
+import ActivationRecorder
+
+# noise is generated in blocks of at most this many values (but at least one
+# step), which the steps of a field consume one after another
+NOISE_BLOCK_SIZE = 65536
 
 class ConnectError(Exception):
     def __init__(self, value):
@@ -12,7 +18,13 @@ class ConnectError(Exception):
     def __str__(self):
         return repr(self.value)
 
-def connect(source, target, processing_steps=[]):
+def connect(source, target, processing_steps=[], fuse=False):
+    """Connects the source to the target through the given processing steps.
+    If fuse is True, a chain of at least two weights, projections, and scalers
+    is replaced by a single FusedConnection, which computes the whole chain
+    in one step. The processing steps themselves are then no longer part of
+    the graph (their outputs are not updated; see
+    FusedConnection.get_processing_steps())."""
     # get dimensionality and dimension sizes of source
     source_output_dimensionality = source.get_output_dimensionality()
     source_output_dimension_sizes = source.get_output_dimension_sizes()
@@ -98,10 +110,6 @@ def connect(source, target, processing_steps=[]):
                 raise ConnectError("The dimensionality of the connectables " + connectables[i].get_name()
                                    + " and " + connectables[i+1].get_name() + " do not match.")
 
-        # connect this connectable and the next
-        connectables[i].add_outgoing_connectable(connectables[i+1])
-        connectables[i+1].add_incoming_connectable(connectables[i])
-
 
     i = 0
     j = len(connectables) - 1
@@ -128,10 +136,300 @@ def connect(source, target, processing_steps=[]):
             if (current_input_dimension_sizes is not None):
                 connectables[j-1].set_output_dimension_sizes(current_input_dimension_sizes)       
                 j = j - 1
+
+    # the processing steps process all copies of a batched source at once; an
+    # input without batch axis is shared by all copies of a batched target
+    source_batch_size = source.get_batch_size()
+    if (source_batch_size is not None and source_batch_size != target.get_batch_size()):
+        raise ConnectError("The batch sizes of the connectables " + source.get_name()
+                           + " and " + target.get_name() + " do not match.")
+    for processing_step in processing_steps:
+        processing_step.set_batch_size(source_batch_size)
+
+    # replace chains of processing steps by a single operator
+    if (fuse and can_fuse(processing_steps)):
+        fused_connection = FusedConnection(processing_steps)
+        fused_connection.set_batch_size(source_batch_size)
+        fused_connection.set_input_dimension_sizes(processing_steps[0].get_input_dimension_sizes())
+        fused_connection.set_output_dimension_sizes(processing_steps[-1].get_output_dimension_sizes())
+        connectables = [source, fused_connection, target]
+
+    for i in range(len(connectables)-1):
+        # connect this connectable and the next
+        connectables[i].add_outgoing_connectable(connectables[i+1])
+        connectables[i+1].add_incoming_connectable(connectables[i])
    
 def disconnect(source, target):
     source.get_outgoing_connectables().remove(target)
     target.get_incoming_connectables().remove(source)
+    Connectable._graph_revision += 1
+
+def can_fuse(processing_steps):
+    "Returns whether the given processing steps can be fused into a single FusedConnection."
+    if (len(processing_steps) < 2):
+        return False
+
+    for processing_step in processing_steps:
+        if (processing_step.__class__ not in (Weight, Projection, Scaler)):
+            return False
+
+    return True
+
+def compile_step_schedule(connectables):
+    """Compiles a flat execution plan for the given connectables. The plan
+    contains every given connectable and every connectable that is stepped by
+    new input from them (processing steps, controls), each exactly once.
+    Connectables that are stepped by new input are placed after all of their
+    incoming connectables that are part of the plan, the remaining ones keep
+    the order in which they were given. Dynamic fields are not stepped by new
+    input, so connections into a field never constrain the order."""
+    roots = []
+    for connectable in connectables:
+        if connectable not in roots:
+            roots.append(connectable)
+
+    # collect all connectables that are stepped by input from the roots
+    members = set(roots)
+    stack = list(roots)
+    while (len(stack) > 0):
+        connectable = stack.pop()
+        for target in connectable.get_outgoing_connectables():
+            if (target not in members and target.is_stepped_by_input()):
+                members.add(target)
+                stack.append(target)
+
+    # map everything that is computed by a member to that member (e.g., the
+    # nodes of a node bank to the bank)
+    owners = {}
+    for connectable in members:
+        for stepped_connectable in connectable.get_stepped_connectables():
+            owners[stepped_connectable] = connectable
+
+    # count the incoming members each member has to wait for
+    pending = {}
+    for connectable in members:
+        sources = set()
+        if (connectable.is_stepped_by_input()):
+            for source in connectable.get_incoming_connectables():
+                if (source in owners):
+                    sources.add(owners[source])
+        pending[connectable] = len(sources)
+
+    schedule = []
+    scheduled = set()
+    for root in roots:
+        if (root in scheduled or pending[root] > 0):
+            continue
+
+        # depth first, so that a chain of processing steps directly follows
+        # its source (like the recursive new_input() propagation)
+        stack = [root]
+        while (len(stack) > 0):
+            connectable = stack.pop()
+            schedule.append(connectable)
+            scheduled.add(connectable)
+
+            ready = []
+            for target in set(connectable.get_outgoing_connectables()):
+                if (target in members and target.is_stepped_by_input()):
+                    pending[target] -= 1
+                    if (pending[target] == 0):
+                        ready.append(target)
+
+            ready.sort(key=connectable.get_outgoing_connectables().index, reverse=True)
+            stack.extend(ready)
+
+    if (len(schedule) != len(members)):
+        raise ConnectError("""The connectables contain a cycle that does not pass
+                           through a dynamic field. Cannot compile a step schedule.""")
+
+    return schedule
+
+
+def compile_dependency_levels(schedule):
+    """Groups the connectables of a compiled step schedule into levels. A
+    connectable is placed in a later level than every connectable before it in
+    the schedule whose output it reads or that reads its output, so the
+    connectables within a level can be stepped in any order (or concurrently)
+    and stepping the levels one after another gives the same result as
+    stepping the schedule in order."""
+    owners = {}
+    for connectable in schedule:
+        for stepped_connectable in connectable.get_stepped_connectables():
+            owners[stepped_connectable] = connectable
+
+    # collect the members of the schedule that each member reads from
+    sources = {}
+    for connectable in schedule:
+        sources[connectable] = set()
+        for source in connectable.get_incoming_connectables():
+            if (source in owners and owners[source] is not connectable):
+                sources[connectable].add(owners[source])
+
+    levels = []
+    level_indices = {}
+    for i in range(len(schedule)):
+        connectable = schedule[i]
+        level_index = 0
+        for earlier_connectable in schedule[:i]:
+            if (earlier_connectable in sources[connectable] or connectable in sources[earlier_connectable]):
+                level_index = max(level_index, level_indices[earlier_connectable] + 1)
+
+        if (level_index == len(levels)):
+            levels.append([])
+        levels[level_index].append(connectable)
+        level_indices[connectable] = level_index
+
+    return levels
+
+def _step_scheduled_connectable(connectable):
+    connectable._scheduled_step()
+
+def _restore_array(buffer, value):
+    """Copies the value into the buffer if it is a writeable array of the same
+    shape and returns it, otherwise returns a copy of the value."""
+    if (isinstance(buffer, numpy.ndarray) and buffer.flags.writeable and numpy.shape(value) == buffer.shape):
+        buffer[...] = value
+        return buffer
+
+    return copy.copy(value)
+
+
+class StepSchedule:
+    """Flat execution plan that steps a graph of connectables without recursion.
+    If use_node_bank is True, all plain zero-dimensional dynamic fields among
+    the given connectables are stepped together by a single NodeBank, which
+    also computes the scalar weights between them (these weights are not
+    part of the schedule, even if they are given). Note that this changes
+    the dynamics: the bank updates all nodes at once from the outputs of the
+    previous step (Jacobi), while the schedule steps them one after another,
+    each seeing the new outputs of the nodes before it.
+
+    If number_of_threads is larger than one, the schedule is split into
+    dependency levels and the connectables within a level that can be stepped
+    concurrently (see Connectable.can_step_concurrently()) are stepped on a
+    pool of threads, while the others are stepped in schedule order by the
+    calling thread. Because connectables within a level never read each
+    other's output, the result does not depend on the order in which the
+    threads finish and equals that of the sequential schedule.
+
+    If synchronous is True, the schedule uses synchronous (Jacobi) updates
+    instead: all connectables that are not stepped by input (fields, node
+    banks) are double buffered and compute their step from the outputs of the
+    previous step. Afterwards, all of them publish their new output at once and
+    the processing steps and controls are stepped on the published outputs.
+    The result does not depend on the order of the connectables, and with
+    more than one thread, all fields are stepped in a single level. Fields of a
+    synchronous schedule should only be stepped through the schedule."""
+
+    def __init__(self, connectables, use_node_bank=False, number_of_threads=1, synchronous=False):
+        self._roots = list(connectables)
+        self._node_bank = None
+        self._synchronous = synchronous
+        self._levels = None
+        self._thread_pool = None
+        if (number_of_threads > 1):
+            self._thread_pool = multiprocessing.pool.ThreadPool(number_of_threads)
+
+        if (use_node_bank):
+            nodes = [connectable for connectable in self._roots
+                     if (connectable.__class__ is DynamicField and
+                         connectable.get_dimensionality() == 0 and
+                         connectable.get_batch_size() is None)]
+            if (len(nodes) > 0):
+                self._node_bank = NodeBank(nodes)
+                self._roots.insert(self._roots.index(nodes[0]), self._node_bank)
+                # the weights between the nodes are computed by the bank
+                coupling_weights = self._node_bank.get_coupling_weights()
+                self._roots = [connectable for connectable in self._roots
+                               if connectable not in nodes and connectable not in coupling_weights]
+
+        self._compile()
+
+    def _compile(self):
+        self._connectables = compile_step_schedule(self._roots)
+
+        if (self._synchronous):
+            # the fields are stepped first and then publish their outputs, the
+            # processing steps follow in schedule order
+            self._levels = [[connectable for connectable in self._connectables if not connectable.is_stepped_by_input()],
+                            [connectable for connectable in self._connectables if connectable.is_stepped_by_input()]]
+            for connectable in self._levels[0]:
+                connectable.set_double_buffering(True)
+        elif (self._thread_pool is not None):
+            self._levels = compile_dependency_levels(self._connectables)
+        self._revision = Connectable._graph_revision
+
+    def get_connectables(self):
+        return self._connectables
+
+    def get_node_bank(self):
+        return self._node_bank
+
+    def get_levels(self):
+        """Returns the levels of the schedule (only if it is synchronous or
+        stepped by threads)."""
+        return self._levels
+
+    def is_synchronous(self):
+        return self._synchronous
+
+    def close(self):
+        "Stops the threads of the schedule; afterwards, it is stepped by the calling thread."
+        if (self._thread_pool is not None):
+            self._thread_pool.close()
+            self._thread_pool.join()
+            self._thread_pool = None
+            if (not self._synchronous):
+                self._levels = None
+
+    def step(self):
+        if (self._revision != Connectable._graph_revision):
+            self._compile()
+
+        if (self._synchronous):
+            self._step_synchronously()
+            return
+
+        if (self._thread_pool is None):
+            for connectable in self._connectables:
+                connectable._scheduled_step()
+            return
+
+        for level in self._levels:
+            self._step_level(level)
+
+    def _step_synchronously(self):
+        fields = self._levels[0]
+        output_revisions = [connectable.get_output_revision() for connectable in fields]
+        self._step_level(fields)
+
+        # publish the outputs of all fields that have been recomputed (sleeping
+        # fields keep their output)
+        for i in range(len(fields)):
+            if (fields[i].get_output_revision() != output_revisions[i]):
+                fields[i]._publish_output()
+
+        for connectable in self._levels[1]:
+            connectable._scheduled_step()
+
+    def _step_level(self, level):
+        "Steps connectables that do not read each other's output, on the threads if possible."
+        concurrent_connectables = []
+        if (self._thread_pool is not None):
+            concurrent_connectables = [connectable for connectable in level if connectable.can_step_concurrently()]
+
+        if (len(concurrent_connectables) < 2):
+            for connectable in level:
+                connectable._scheduled_step()
+            return
+
+        result = self._thread_pool.map_async(_step_scheduled_connectable, concurrent_connectables)
+        for connectable in level:
+            if (connectable not in concurrent_connectables):
+                connectable._scheduled_step()
+        # wait for the threads (and pass on their exceptions)
+        result.get()
 
 
 class Connectable:
@@ -139,6 +437,12 @@ class Connectable:
 
     # count the number of connectables, to have a unique ID number for each instance
     _instance_counter = 0
+    # incremented on every change of the connections between connectables, so
+    # that compiled step schedules know when they are outdated
+    _graph_revision = 0
+    # incremented on every change of a parameter that processing steps or
+    # fields depend on (e.g., a weight), so that skipped steps are recomputed
+    _parameter_revision = 0
 
     def __init__(self):
         # unique ID of the connectable
@@ -163,18 +467,37 @@ class Connectable:
         self._input_dimension_sizes = None
         # dimension sizes of the output
         self._output_dimension_sizes = None
+        # number of independent copies in the leading batch axis of the output
+        # (None if the output has no batch axis)
+        self._batch_size = None
+
+        # compiled schedule of the connectables that are stepped along with
+        # this one and the graph revision it was compiled for
+        self._propagation_schedule = None
+        self._propagation_schedule_revision = None
+
+        # incremented every time the output is recomputed
+        self._output_revision = 0
+        # revisions of the parameters and incoming outputs at the last step
+        self._input_revision = None
+
+        # if the connectable is double buffered, other connectables read this
+        # front buffer, while the output buffer is recomputed (see set_double_buffering())
+        self._front_output_buffer = None
 
     def get_incoming_connectables(self):
         return self._incoming_connectables
     
     def add_incoming_connectable(self, source):
         self._incoming_connectables.append(source)
+        Connectable._graph_revision += 1
 
     def get_outgoing_connectables(self):
         return self._outgoing_connectables
 
     def add_outgoing_connectable(self, target):
         self._outgoing_connectables.append(target)
+        Connectable._graph_revision += 1
     
     def set_name(self, name):
         self._name = name
@@ -182,9 +505,32 @@ class Connectable:
     def get_name(self):
         return self._name
 
+    def get_id(self):
+        return self._id
+
     def get_output(self):
+        if (self._front_output_buffer is not None):
+            return self._front_output_buffer
+
         return self._output_buffer
 
+    def is_double_buffered(self):
+        return self._front_output_buffer is not None
+
+    def set_double_buffering(self, double_buffering):
+        """If double buffering is switched on, get_output() returns a front
+        buffer that only changes when the output is published, so connectables
+        that read the output during a step all see the output of the previous
+        step. Used by synchronous step schedules."""
+        if (not double_buffering):
+            self._front_output_buffer = None
+        elif (self._front_output_buffer is None):
+            self._front_output_buffer = numpy.array(self._output_buffer, dtype=float)
+
+    def _publish_output(self):
+        "Copies the recomputed output into the front buffer."
+        self._front_output_buffer[...] = self._output_buffer
+
     def get_input_dimensionality(self):
         return self._input_dimensionality
 
@@ -215,23 +561,116 @@ class Connectable:
     def determine_input_dimension_sizes(self):
         self._input_dimension_sizes = self._output_dimension_sizes
 
+    def get_checkpoint_state(self):
+        """Returns the state of the connectable as a dictionary of arrays and
+        plain values (e.g., for checkpoints). Arrays are not copied."""
+        state = {"output": self._output_buffer}
+        if (self._front_output_buffer is not None):
+            state["front_output"] = self._front_output_buffer
+
+        return state
+
+    def set_checkpoint_state(self, state):
+        """Restores a state returned by get_checkpoint_state(), writing the
+        arrays into the existing buffers where possible."""
+        self._output_buffer = _restore_array(self._output_buffer, state["output"])
+        if (self._front_output_buffer is not None and "front_output" in state):
+            self._front_output_buffer[...] = state["front_output"]
+
+        # everything that depends on the output is recomputed in the next step
+        self._output_revision += 1
+        self._input_revision = None
+
+    def get_batch_size(self):
+        return self._batch_size
+
+    def set_batch_size(self, batch_size):
+        "Sets the batch size of the input and output (set for processing steps by connect())."
+        self._batch_size = batch_size
+
+    def is_stepped_by_input(self):
+        "Returns whether new input triggers a step of this connectable."
+        return True
+
+    def get_stepped_connectables(self):
+        "Returns the connectables that are computed when this connectable is stepped."
+        return [self]
+
+    def get_output_revision(self):
+        "Returns a number that changes whenever the output of the connectable is recomputed."
+        return self._output_revision
+
+    def can_step_concurrently(self):
+        """Returns whether the connectable may be stepped on another thread, at
+        the same time as connectables that it does not share any output with.
+        This is not the case for connectables that use shared state, like the
+        global random number generator or a connection to the robot."""
+        return False
+
+    def depends_only_on_input(self):
+        """Returns whether the output is a pure function of the incoming outputs
+        and the parameters. Such connectables are not recomputed by step schedules
+        as long as neither changes."""
+        return False
+
+    def _input_changed(self):
+        """Returns whether a parameter or the output of an incoming connectable
+        has changed since the last call."""
+        input_revision = [Connectable._parameter_revision]
+        for connectable in self._incoming_connectables:
+            input_revision.append(connectable.get_output_revision())
+
+        if (input_revision == self._input_revision):
+            return False
+
+        self._input_revision = input_revision
+        return True
+
+    def _scheduled_step(self):
+        "Steps the connectable as part of a step schedule."
+        if (self.depends_only_on_input() and not self._input_changed()):
+            return
+
+        self._step_computation()
+        self._output_revision += 1
+
     def new_input(self):
         self.step()
 
+    def get_propagation_schedule(self):
+        """Returns the compiled schedule of this connectable and all
+        connectables that are stepped by its output."""
+        if (self._propagation_schedule_revision != Connectable._graph_revision):
+            self._propagation_schedule = StepSchedule([self])
+            self._propagation_schedule_revision = Connectable._graph_revision
+
+        return self._propagation_schedule
+
     def step(self):
-        self._step_computation()
-        for connectable in self._outgoing_connectables:
-            connectable.new_input()
+        self.get_propagation_schedule().step()
 
 class DynamicField(Connectable):
     "Dynamic field"
 
-    def __init__(self, dimension_bounds=[], dimension_resolutions=[], interaction_kernels=None, name=""):
-        "Constructor"
+    def __init__(self, dimension_bounds=[], dimension_resolutions=[], interaction_kernels=None, name="", batch_size=None):
+        """Constructor. If a batch size is given, the field holds that many
+        independent copies, which are stepped together. The activation then has
+        a leading batch axis and each parameter (e.g., the boost) is either a
+        single value or a sequence with one value per copy."""
         Connectable.__init__(self)
 
-        # seed the random number generator to have pseudo-random noise
-        random.seed()
+        # seed of the random stream of the field (None for an unpredictable
+        # seed); the stream itself is created on first use
+        self._random_seed = None
+        self._random_stream_index = 0
+        self._random_state = None
+        # block of pre-generated standard normal noise (one entry per step) and
+        # the index of the entry for the next step
+        self._noise_block = None
+        self._noise_index = 0
+
+        # node bank that steps this field (only for zero-dimensional fields)
+        self._node_bank = None
 
         # name of the field
         if (name == ""):
@@ -277,9 +716,16 @@ class DynamicField(Connectable):
 
         self._input_dimension_sizes = dimension_sizes
         self._output_dimension_sizes = dimension_sizes
+
+        # number of independent copies of the field (None if the field is not batched)
+        self._batch_size = batch_size
+        # shape of the activation (with the batch axis in front)
+        self._activation_shape = list(self._output_dimension_sizes)
+        if (batch_size is not None):
+            self._activation_shape.insert(0, batch_size)
          
         # amount of self excitation of the system
-        self._lateral_interaction = numpy.zeros(shape=self._output_dimension_sizes)
+        self._lateral_interaction = numpy.zeros(shape=self._activation_shape)
         # convolution kernel used to generate lateral interaction
         self._lateral_interaction_kernels = interaction_kernels
 
@@ -314,8 +760,39 @@ class DynamicField(Connectable):
         # initialize the output buffer with an ndarray
         self._output_buffer = self.compute_thresholded_activation(self._activation)
 
-        # file handle for the activation log
-        self._activation_log_file = None
+        # if True, each step reuses the output buffer and the work buffers
+        # below instead of allocating new arrays
+        self._in_place_update = True
+        self._change_buffer = numpy.zeros(shape=self._activation_shape)
+        self._convolution_buffer = numpy.zeros(shape=self._activation_shape)
+        self._sigmoid_buffer = numpy.zeros(shape=self._activation_shape)
+
+        # if True, the field goes to sleep when its activation has converged and its
+        # input is constant; a sleeping field is not integrated until its input changes
+        # (requires in-place updates, not used for nodes in a node bank)
+        self._quiescence = False
+        # largest change of the activation and of the input that still counts as converged
+        self._quiescence_tolerance = 1e-6
+        self._sleeping = False
+        # summed input of the current step and of the previous step (or, while the
+        # field is sleeping, of the step in which it fell asleep)
+        self._input_buffer = None
+        self._previous_input_buffer = None
+
+        # activation recorder and column that the activation is logged to
+        self._activation_recorder = None
+        self._activation_log = None
+        # "full" records the activation in every step, "threshold" only records an
+        # event when the output crosses the threshold level, and "change" records
+        # the activation when it has changed by more than the change tolerance
+        # since the last record
+        self._activation_log_mode = "full"
+        self._activation_log_threshold = 0.5
+        self._activation_log_change_tolerance = 0.1
+        # step index of the next log entry and the state at the last record
+        self._activation_log_step = 0
+        self._output_above_threshold = None
+        self._last_logged_activation = None
 
         # TODO only for experiments
         self.start_activation_log()
@@ -354,42 +831,97 @@ class DynamicField(Connectable):
 
     def set_lateral_interaction_kernel(self, kernel, index):
         self._lateral_interaction_kernels[index] = kernel
+        self._parameters_changed()
 
     def add_lateral_interaction_kernel(self, kernel):
         self._lateral_interaction_kernels.append(kernel)
+        self._parameters_changed()
+
+    def lateral_interaction_kernels_changed(self):
+        "Has to be called after a lateral interaction kernel of the field was changed in place."
+        self._parameters_changed()
 
     def get_noise_strength(self):
         return self._noise_strength
 
     def set_noise_strength(self, noise_strength):
         self._noise_strength = noise_strength
+        self._parameters_changed()
+
+    def get_random_seed(self):
+        return self._random_seed
+
+    def get_random_stream_index(self):
+        return self._random_stream_index
+
+    def set_random_seed(self, seed, stream_index=0):
+        """Seeds the random stream of the field. The stream is derived from the
+        given seed (e.g., the seed of an architecture) and the stream index
+        (e.g., the position of the field in the architecture), so that fields
+        with the same seed and different stream indices draw different noise
+        and rebuilding the same network in the same process draws the same
+        noise again."""
+        self._random_seed = seed
+        self._random_stream_index = stream_index
+        self._random_state = None
+        self._noise_block = None
+
+    def _get_random_state(self):
+        if (self._random_state is None):
+            if (self._random_seed is None):
+                self._random_state = numpy.random.RandomState()
+            else:
+                self._random_state = numpy.random.RandomState([self._random_seed, self._random_stream_index])
+
+        return self._random_state
+
+    def _next_noise(self):
+        """Returns standard normal noise of the shape of the activation, sliced
+        from a pre-generated block. The caller may modify it."""
+        if (self._noise_block is None or self._noise_index == len(self._noise_block)):
+            number_of_steps = max(1, NOISE_BLOCK_SIZE // math_tools.product(self._activation_shape))
+            self._noise_block = self._get_random_state().standard_normal([number_of_steps] + self._activation_shape)
+            self._noise_index = 0
+
+        noise = self._noise_block[self._noise_index]
+        self._noise_index += 1
+        return noise
 
     def get_noise_standard_deviation(self):
         return self._noise_standard_deviation
 
     def set_noise_standard_deviation(self, noise_standard_deviation):
         self._noise_standard_deviation = noise_standard_deviation
+        self._parameters_changed()
 
     def get_resting_level(self):
         return self._resting_level
 
     def set_resting_level(self, resting_level):
         self._resting_level = resting_level
+        self._parameters_changed()
 
     def set_initial_activation(self, initial_activation):
-        self._activation = numpy.zeros(shape=self._output_dimension_sizes) + initial_activation
+        if (self._node_bank is not None):
+            # keep the view into the activation of the node bank
+            self._activation[...] = initial_activation
+        else:
+            self._activation = numpy.zeros(shape=self._activation_shape) + self._per_copy(initial_activation)
+        self.wake_up()
 
     def get_boost(self):
         return self._boost
 
     def set_boost(self, boost):
         self._boost = boost
+        self._parameters_changed()
 
     def get_global_inhibition(self):
         return self._global_inhibition
 
     def set_global_inhibition(self, global_inhibition):
         self._global_inhibition = global_inhibition
+        self._parameters_changed()
 
     def get_activation(self):
         return self._activation
@@ -399,34 +931,171 @@ class DynamicField(Connectable):
 
     def set_relaxation_time(self, relaxation_time):
         self._relaxation_time = relaxation_time
+        self._parameters_changed()
 
     def get_sigmoid_steepness(self):
         return self._sigmoid_steepness
 
     def set_sigmoid_steepness(self, steepness):
         self._sigmoid_steepness = steepness
+        self._parameters_changed()
 
     def get_sigmoid_shift(self):
         return self._sigmoid_shift
 
     def set_sigmoid_shift(self, shift):
         self._sigmoid_shift = shift
+        self._parameters_changed()
+
+    def get_in_place_update(self):
+        return self._in_place_update
+
+    def set_in_place_update(self, in_place_update):
+        self._in_place_update = in_place_update
+        self.wake_up()
+
+    def get_quiescence(self):
+        return self._quiescence
+
+    def set_quiescence(self, quiescence):
+        self._quiescence = quiescence
+        self.wake_up()
+
+    def get_quiescence_tolerance(self):
+        return self._quiescence_tolerance
+
+    def set_quiescence_tolerance(self, tolerance):
+        self._quiescence_tolerance = tolerance
+        self.wake_up()
+
+    def is_sleeping(self):
+        return self._sleeping
+
+    def wake_up(self):
+        "Makes a sleeping field integrate again in the next step."
+        self._sleeping = False
+        self._previous_input_buffer = None
 
     def set_normalization_factor(self, factor):
         self._normalization_factor = factor
+        self._parameters_changed()
 
     def get_normalization_factor(self):
         return self._normalization_factor
 
+    def get_node_bank(self):
+        return self._node_bank
+
+    def get_checkpoint_state(self):
+        state = Connectable.get_checkpoint_state(self)
+        state.update({"activation": self._activation,
+                      "resting_level": self._resting_level,
+                      "boost": self._boost,
+                      "global_inhibition": self._global_inhibition,
+                      "noise_strength": self._noise_strength,
+                      "noise_standard_deviation": self._noise_standard_deviation,
+                      "relaxation_time": self._relaxation_time,
+                      "sigmoid_steepness": self._sigmoid_steepness,
+                      "sigmoid_shift": self._sigmoid_shift,
+                      "normalization_factor": self._normalization_factor,
+                      "kernels": [kernel.get_parameters() for kernel in (self._lateral_interaction_kernels or [])],
+                      "sleeping": self._sleeping,
+                      "input": self._input_buffer,
+                      "previous_input": self._previous_input_buffer,
+                      "activation_log_step": self._activation_log_step,
+                      "output_above_threshold": self._output_above_threshold,
+                      "random_seed": self._random_seed,
+                      "random_stream_index": self._random_stream_index,
+                      "noise_block": self._noise_block,
+                      "noise_index": self._noise_index})
+
+        if (self._random_state is not None):
+            random_state = self._random_state.get_state()
+            state["random_state_keys"] = random_state[1]
+            state["random_state"] = [random_state[0]] + list(random_state[2:])
+
+        return state
+
+    def set_checkpoint_state(self, state):
+        self._resting_level = state["resting_level"]
+        self._boost = state["boost"]
+        self._global_inhibition = state["global_inhibition"]
+        self._noise_strength = state["noise_strength"]
+        self._noise_standard_deviation = state["noise_standard_deviation"]
+        self._relaxation_time = state["relaxation_time"]
+        self._sigmoid_steepness = state["sigmoid_steepness"]
+        self._sigmoid_shift = state["sigmoid_shift"]
+        self._normalization_factor = state["normalization_factor"]
+        for kernel, parameters in zip(self._lateral_interaction_kernels or [], state["kernels"]):
+            kernel.set_parameters(parameters)
+        self._parameters_changed()
+
+        Connectable.set_checkpoint_state(self, state)
+        self._activation[...] = state["activation"]
+
+        self._sleeping = state["sleeping"]
+        self._input_buffer = _restore_array(self._input_buffer, state["input"])
+        self._previous_input_buffer = _restore_array(self._previous_input_buffer, state["previous_input"])
+        self._activation_log_step = state["activation_log_step"]
+        self._output_above_threshold = state["output_above_threshold"]
+
+        self.set_random_seed(state["random_seed"], state["random_stream_index"])
+        if ("random_state" in state):
+            random_state = state["random_state"]
+            self._get_random_state().set_state((str(random_state[0]), state["random_state_keys"]) + tuple(random_state[1:]))
+        self._noise_block = _restore_array(self._noise_block, state["noise_block"])
+        self._noise_index = state["noise_index"]
+
+    def _per_copy(self, parameter):
+        """Adds singleton axes to a parameter that holds one value per copy of
+        a batched field, so that it broadcasts along the batch axis."""
+        if (self._batch_size is None or numpy.ndim(parameter) == 0):
+            return parameter
+
+        return numpy.reshape(parameter, [self._batch_size] + [1] * len(self._output_dimension_sizes))
+
+    def _has_noise(self):
+        return bool(numpy.any(numpy.asarray(self._noise_strength) != 0.))
+
+    def _sum_per_copy(self, array):
+        "Sums up the array (of the shape of the activation) for each copy."
+        if (self._batch_size is None):
+            return array.sum()
+
+        return self._per_copy(array.reshape(self._batch_size, -1).sum(axis=1))
+
+    def get_output_revision(self):
+        # the output of a node in a node bank is recomputed by the bank
+        if (self._node_bank is not None):
+            return self._node_bank.get_output_revision()
+
+        return self._output_revision
+
+    def _set_node_bank(self, node_bank, activation, output_buffer):
+        """Hands the activation and output of this (zero-dimensional) field over
+        to a node bank. The supplied arrays are views into the arrays of the bank."""
+        activation[...] = self._activation
+        output_buffer[...] = self._output_buffer
+        self._activation = activation
+        self._output_buffer = output_buffer
+        self._node_bank = node_bank
+
+    def _parameters_changed(self):
+        self.wake_up()
+        if (self._node_bank is not None):
+            self._node_bank.invalidate_parameters()
+
     def compute_thresholded_activation(self, activation):
         "Applies the sigmoidal function to the given activation."
-        return math_tools.sigmoid(activation, self._sigmoid_steepness, self._sigmoid_shift)
+        return math_tools.sigmoid(activation, self._per_copy(self._sigmoid_steepness), self._per_copy(self._sigmoid_shift))
 
     def get_output(self, activation=None):
         """Returns the output of the dynamical field. By default, the current
         output buffer is returned. If an specific activation is given, it is
         run through the nonlinearity and returned."""
         thresholded_activation = self._output_buffer
+        if (self._front_output_buffer is not None):
+            thresholded_activation = self._front_output_buffer
 
         if (activation is not None):
             thresholded_activation = self.compute_thresholded_activation(activation)
@@ -452,7 +1121,7 @@ class DynamicField(Connectable):
         # if the time scale is to be used..
         if use_time_scale is True:
             # ..compute the inverse of the time scale to have a factor..
-            relaxation_time_factor = 1. / self._relaxation_time
+            relaxation_time_factor = 1. / self._per_copy(self._relaxation_time)
         else:
             # ..otherwise, set the factor to one
             relaxation_time_factor = 1.
@@ -461,71 +1130,428 @@ class DynamicField(Connectable):
         lateral_interaction = 0.
         if self._lateral_interaction_kernels is not None:
             for kernel in self._lateral_interaction_kernels:
-                lateral_interaction += Kernel.convolve(current_output, kernel)
+                lateral_interaction += Kernel.convolve(current_output, kernel, batched=self._batch_size is not None)
 
         # sum up the input coming in from all connected fields
         field_interaction = 0
         for connectable in self.get_incoming_connectables():
             field_interaction += connectable.get_output()
 
-        global_inhibition = self._global_inhibition * current_output.sum() / math_tools.product(self._output_dimension_sizes)
+        global_inhibition = (self._per_copy(self._global_inhibition) * self._sum_per_copy(current_output)
+                             / math_tools.product(self._output_dimension_sizes))
 
-        # generate the noise term
-        noise = self._noise_strength * numpy.random.normal(0.0, self._noise_standard_deviation, self._output_dimension_sizes)
+        # generate the noise term (of the shape of the activation in any case,
+        # callers index into the change)
+        noise = numpy.zeros(self._activation_shape)
+        if (self._has_noise()):
+            noise = (self._per_copy(self._noise_strength) * self._per_copy(self._noise_standard_deviation)
+                     * self._next_noise())
 
         # compute the change of the system
-        change = relaxation_time_factor * (- self._normalization_factor * activation
-                     + self._resting_level
-                     + self._boost
+        change = relaxation_time_factor * (- self._per_copy(self._normalization_factor) * activation
+                     + self._per_copy(self._resting_level)
+                     + self._per_copy(self._boost)
                      - global_inhibition
                      + lateral_interaction
                      + field_interaction
                      + noise)
 
         return change
+
+    def _compute_change_in_place(self):
+        """Computes the change of the system like get_change(), but into the
+        work buffers of the field. Returns the change buffer."""
+        current_output = self._output_buffer
+        change = self._change_buffer
+
+        numpy.multiply(self._activation, -self._per_copy(self._normalization_factor), out=change)
+        change += self._per_copy(self._resting_level)
+        change += self._per_copy(self._boost)
+        change -= (self._per_copy(self._global_inhibition) * self._sum_per_copy(current_output)
+                   / math_tools.product(self._output_dimension_sizes))
+
+        # compute the lateral interaction
+        if self._lateral_interaction_kernels is not None:
+            lateral_interaction = self._lateral_interaction
+            lateral_interaction.fill(0.)
+            for kernel in self._lateral_interaction_kernels:
+                lateral_interaction += Kernel.convolve(current_output, kernel, self._convolution_buffer,
+                                                       batched=self._batch_size is not None)
+            change += lateral_interaction
+
+        # sum up the input coming in from all connected fields
+        if (self._quiescence):
+            change += self._sum_input()
+        else:
+            for connectable in self.get_incoming_connectables():
+                change += connectable.get_output()
+
+        # the noise term is only generated if it has an effect
+        if self._has_noise():
+            noise = self._next_noise()
+            noise *= self._per_copy(self._noise_strength)
+            noise *= self._per_copy(self._noise_standard_deviation)
+            change += noise
+
+        change *= 1. / self._per_copy(self._relaxation_time)
+
+        return change
     
     def _step_computation(self):
         """Compute the current change of the system and change to current value
-        accordingly."""
-        self._activation += self.get_change(self._activation)
-        self._output_buffer = self.compute_thresholded_activation(self._activation)
+        accordingly. Fields that belong to a node bank are stepped by the bank."""
+        if (self._node_bank is not None):
+            return
+
+        if (self._in_place_update):
+            change = self._compute_change_in_place()
+            self._activation += change
+            math_tools.sigmoid(self._activation, self._per_copy(self._sigmoid_steepness), self._per_copy(self._sigmoid_shift),
+                               out=self._output_buffer, work=self._sigmoid_buffer)
+            if (self._quiescence):
+                self._detect_quiescence(change)
+        else:
+            self._activation += self.get_change(self._activation)
+            self._output_buffer = self.compute_thresholded_activation(self._activation)
         self.write_activation_log()
 
-    def start_activation_log(self, file_name=""):
-        """Opens the file with the supplied file name. Once there is an open
-        file handle, the _step_computation() method will write the current
-        activation of the field to the file."""
-        # if no filename was supplied ..
-        if (file_name == ""):
-            # .. set the name of the field as the filename, but replace spaces
-            # with underscores.
-            file_name = self._name.replace(" ", "_")
-            file_name = "logs/" + file_name + ".txt"
+    def _sum_input(self):
+        "Sums up the output of all incoming connectables into the input buffer."
+        if (self._input_buffer is None):
+            self._input_buffer = numpy.zeros(shape=self._activation_shape)
+
+        input = self._input_buffer
+        input.fill(0.)
+        for connectable in self.get_incoming_connectables():
+            input += connectable.get_output()
+
+        return input
+
+    def _input_is_steady(self):
+        "Returns whether the summed input is within tolerance of the previous (or sleeping) input."
+        if (self._previous_input_buffer is None):
+            return False
+
+        return numpy.abs(self._input_buffer - self._previous_input_buffer).max() < self._quiescence_tolerance
+
+    def _detect_quiescence(self, change):
+        """Puts the field to sleep if the last change of the activation and the
+        change of the input are both within the quiescence tolerance."""
+        if (not self._has_noise() and
+            self._input_is_steady() and
+            numpy.abs(change).max() < self._quiescence_tolerance):
+            self._sleeping = True
+            # remember the revisions of the input the field fell asleep with
+            self._input_changed()
+
+        # keep the input of this step for the next comparison
+        if (self._previous_input_buffer is None):
+            self._previous_input_buffer = numpy.empty(shape=self._activation_shape)
+        self._previous_input_buffer[...] = self._input_buffer
+
+    def _scheduled_step(self):
+        """Steps the field as part of a step schedule. A sleeping field only
+        checks whether its input has changed and wakes up if it has."""
+        if (self._sleeping):
+            if (not self._input_changed()):
+                self.write_activation_log()
+                return
+
+            self._sum_input()
+            if (self._input_is_steady()):
+                self.write_activation_log()
+                return
+
+            self._sleeping = False
+
+        Connectable._scheduled_step(self)
+
+    def start_activation_log(self, recorder=None):
+        """Starts logging the activation of the field to the supplied activation
+        recorder (by default, the default recorder). Once the log is started,
+        the _step_computation() method logs the activation in every step,
+        according to the activation log mode."""
+        if (recorder is None):
+            recorder = ActivationRecorder.get_default_recorder()
 
-        self._activation_log_file = open(file_name, 'a')
+        self.stop_activation_log()
+        self._activation_recorder = recorder
+        self._activation_log_step = 0
+        self._output_above_threshold = None
+        self._last_logged_activation = None
+
+        if (self._activation_log_mode == "threshold"):
+            recorder.add_event_source(self._id, self._name)
+            self._activation_log = recorder.get_event_column()
+        else:
+            self._activation_log = recorder.add_column(self._name, self._activation.shape, self._activation.dtype)
 
     def stop_activation_log(self):
-        "Closes the file handle of the activation log (if it's open)."
-        if self._activation_log_file != None:
-            self._activation_log_file.close()
-            self._activation_log_file = None
+        "Stops logging the activation (if it is logged)."
+        if self._activation_log != None:
+            # the event column is shared by all fields of the recorder
+            if (self._activation_log_mode != "threshold"):
+                self._activation_log.close()
+            self._activation_log = None
+            self._activation_recorder = None
+
+    def get_activation_log(self):
+        return self._activation_log
+
+    def get_activation_log_mode(self):
+        return self._activation_log_mode
+
+    def set_activation_log_mode(self, mode):
+        """Sets what is logged in each step: "full" (the activation), "threshold"
+        (an event when the output crosses the threshold level), or "change" (the
+        activation when it has changed by more than the change tolerance)."""
+        if (mode not in ("full", "threshold", "change")):
+            raise ConnectError("Unknown activation log mode \"" + str(mode) + "\".")
+
+        recorder = self._activation_recorder
+        self.stop_activation_log()
+        self._activation_log_mode = mode
+        if (recorder is not None):
+            self.start_activation_log(recorder)
+
+    def get_activation_log_threshold(self):
+        return self._activation_log_threshold
+
+    def set_activation_log_threshold(self, threshold):
+        self._activation_log_threshold = threshold
+
+    def get_activation_log_change_tolerance(self):
+        return self._activation_log_change_tolerance
+
+    def set_activation_log_change_tolerance(self, tolerance):
+        self._activation_log_change_tolerance = tolerance
 
     def write_activation_log(self):
-        "Writes the current activation of the field to file."
-        if self._activation_log_file != None:
+        "Logs the current activation of the field according to the activation log mode."
+        if self._activation_log == None:
+            return
+
+        step = self._activation_log_step
+        self._activation_log_step += 1
+
+        if (self._activation_log_mode == "full"):
+            self._activation_log.record(self._activation, step)
+
+        elif (self._activation_log_mode == "threshold"):
+            above_threshold = bool(self._output_buffer.max() > self._activation_log_threshold)
+            if (self._output_above_threshold is not None and above_threshold != self._output_above_threshold):
+                direction = 1 if above_threshold else -1
+                self._activation_log.record((self._id, direction, self._activation.max()), step)
+            self._output_above_threshold = above_threshold
+
+        else:
+            if (self._last_logged_activation is None):
+                self._last_logged_activation = self._activation.copy()
+            elif (numpy.abs(self._activation - self._last_logged_activation).max() <= self._activation_log_change_tolerance):
+                return
+            else:
+                self._last_logged_activation[...] = self._activation
+
+            self._activation_log.record(self._activation, step)
+
+    def is_stepped_by_input(self):
+        return False
+
+    def can_step_concurrently(self):
+        # subclasses talk to the robot and threshold events go to the shared
+        # event column (noise comes from the stream of the field)
+        return (self.__class__ is DynamicField and
+                self._activation_log_mode != "threshold")
+
+    def new_input(self):
+        pass
+
+
+class NodeBank(Connectable):
+    """Steps a set of zero-dimensional dynamic fields (nodes) with one
+    vectorized update. The activations and outputs of all nodes are stored in
+    one contiguous array each and the nodes keep views into them. Scalar
+    weights that connect two nodes of the bank are collected in a sparse
+    coupling matrix (together with the self-excitation and global inhibition
+    of each node), all other input into the nodes is summed up per node.
+
+    All nodes are updated at once from the outputs of the previous step
+    (Jacobi), not one after another as in a step schedule, so a network of
+    nodes may evolve differently (e.g., competitions may be decided later).
+
+    Parameter changes made through the setters of the nodes and of weights
+    are picked up automatically; after changing a kernel of a node in place,
+    call update_parameters()."""
+
+    def __init__(self, nodes, name=""):
+        Connectable.__init__(self)
+
+        if (name == ""):
+            self._name = "node bank" + str(self._id)
+        else:
+            self._name = name
+
+        self._nodes = []
+        for node in nodes:
+            if (node.get_dimensionality() != 0 or node.get_batch_size() is not None):
+                raise ConnectError("Only zero-dimensional dynamic fields without batch axis can be added to a node bank.")
+            if (node.get_node_bank() is not None):
+                raise ConnectError("The node " + node.get_name() + " already belongs to a node bank.")
+            if (node not in self._nodes):
+                self._nodes.append(node)
+
+        number_of_nodes = len(self._nodes)
+        self._activation = numpy.zeros(number_of_nodes)
+        self._output_buffer = numpy.zeros(number_of_nodes)
+
+        for i in range(number_of_nodes):
+            self._nodes[i]._set_node_bank(self, self._activation[i:i+1], self._output_buffer[i:i+1])
+
+        self._compile_connections()
+
+    def get_nodes(self):
+        return self._nodes
+
+    def get_activation(self):
+        return self._activation
 
-#            tmp = numpy.array([-1])
-#            if (self._input_dimensionality == 0):
-#                if (self._output_buffer[0] > 0.5):
-#                    tmp[0] = 1
+    def get_stepped_connectables(self):
+        return self._nodes
 
-            self._activation.tofile(self._activation_log_file, sep=', ')
-#            tmp.tofile(self._activation_log_file, sep=', ')
-            self._activation_log_file.write('\n')
+    def get_coupling_weights(self):
+        "Returns the weights between nodes of the bank, which the bank computes itself."
+        return self._coupling_weights
+
+    def set_double_buffering(self, double_buffering):
+        # the nodes read their front buffers from the front buffer of the bank
+        Connectable.set_double_buffering(self, double_buffering)
+        for i in range(len(self._nodes)):
+            if (double_buffering):
+                self._nodes[i]._front_output_buffer = self._front_output_buffer[i:i+1]
+            else:
+                self._nodes[i]._front_output_buffer = None
+
+    def get_incoming_connectables(self):
+        return self._external_connectables
+
+    def get_outgoing_connectables(self):
+        return self._outgoing_connectables
+
+    def is_stepped_by_input(self):
+        return False
 
     def new_input(self):
         pass
 
+    def _compile_connections(self):
+        "Sorts the connections of all nodes into coupling weights and external input."
+        node_indices = {}
+        for i in range(len(self._nodes)):
+            node_indices[self._nodes[i]] = i
+
+        self._coupling_weights = []
+        self._coupling_rows = []
+        self._coupling_columns = []
+        self._external_connectables = []
+        self._external_indices = []
+
+        for i in range(len(self._nodes)):
+            for source in self._nodes[i].get_incoming_connectables():
+                if (isinstance(source, Weight) and
+                    len(source.get_incoming_connectables()) == 1 and
+                    len(source.get_outgoing_connectables()) == 1 and
+                    source.get_incoming_connectables()[0] in node_indices and
+                    numpy.size(source.get_weight()) == 1):
+                    self._coupling_weights.append(source)
+                    self._coupling_rows.append(i)
+                    self._coupling_columns.append(node_indices[source.get_incoming_connectables()[0]])
+                else:
+                    self._external_connectables.append(source)
+                    self._external_indices.append(i)
+
+        # everything the nodes connect to, except for the weights inside the bank
+        self._outgoing_connectables = []
+        for node in self._nodes:
+            for target in node.get_outgoing_connectables():
+                if (target not in self._coupling_weights and target not in self._outgoing_connectables):
+                    self._outgoing_connectables.append(target)
+
+        self._external_indices = numpy.array(self._external_indices, dtype=int)
+        self._connections_revision = Connectable._graph_revision
+        self.update_parameters()
+
+    def invalidate_parameters(self):
+        self._parameters_valid = False
+
+    def update_parameters(self):
+        "Reads the parameters of all nodes and of the weights inside the bank."
+        nodes = self._nodes
+        number_of_nodes = len(nodes)
+
+        self._relaxation_time_factors = numpy.array([1. / node.get_relaxation_time() for node in nodes])
+        self._normalization_factors = numpy.array([float(node.get_normalization_factor()) for node in nodes])
+        self._constant_input = numpy.array([float(node.get_resting_level() + node.get_boost()) for node in nodes])
+        self._sigmoid_steepnesses = numpy.array([float(node.get_sigmoid_steepness()) for node in nodes])
+        self._sigmoid_shifts = numpy.array([float(node.get_sigmoid_shift()) for node in nodes])
+        self._noise_strengths = numpy.array([float(node.get_noise_strength()) for node in nodes])
+        self._noise_standard_deviations = numpy.array([float(node.get_noise_standard_deviation()) for node in nodes])
+        self._has_noise = bool(numpy.any(self._noise_strengths != 0.))
+        # each node draws its noise from its own stream, as if it was stepped alone
+        self._noisy_nodes = [node for node in nodes if node.get_noise_strength() != 0.]
+        self._noisy_node_indices = numpy.array([i for i in range(number_of_nodes) if nodes[i].get_noise_strength() != 0.], dtype=int)
+
+        # on a single element, a convolution with wrapped borders multiplies the
+        # element with the sum of the kernel, so the lateral interaction and the
+        # global inhibition of a node only couple it to itself
+        self_coupling = numpy.zeros(number_of_nodes)
+        for i in range(number_of_nodes):
+            self_coupling[i] = -nodes[i].get_global_inhibition()
+            if (nodes[i]._lateral_interaction_kernels is not None):
+                for kernel in nodes[i]._lateral_interaction_kernels:
+                    for kernel_parts in kernel.get_separable_components():
+                        kernel_sum = 1.
+                        for kernel_part in kernel_parts:
+                            kernel_sum *= kernel_part.sum()
+                        self_coupling[i] += kernel_sum
+
+        # weights only announce changes through the global parameter revision
+        self._parameters_revision = Connectable._parameter_revision
+        weights = [float(numpy.ravel(weight.get_weight())[0]) for weight in self._coupling_weights]
+        coupling = scipy.sparse.coo_matrix((weights, (self._coupling_rows, self._coupling_columns)),
+                                           shape=(number_of_nodes, number_of_nodes))
+        self._coupling = (coupling + scipy.sparse.diags(self_coupling, 0)).tocsr()
+
+        self._parameters_valid = True
+
+    def _step_computation(self):
+        if (self._connections_revision != Connectable._graph_revision):
+            self._compile_connections()
+        if (self._parameters_valid is False or self._parameters_revision != Connectable._parameter_revision):
+            self.update_parameters()
+
+        activation = self._activation
+        number_of_nodes = len(activation)
+
+        change = self._coupling.dot(self._output_buffer)
+        change += self._constant_input
+        change -= self._normalization_factors * activation
+
+        if (len(self._external_connectables) > 0):
+            external_input = [float(connectable.get_output()) for connectable in self._external_connectables]
+            change += numpy.bincount(self._external_indices, weights=external_input, minlength=number_of_nodes)
+
+        if (self._has_noise):
+            noise = numpy.zeros(number_of_nodes)
+            noise[self._noisy_node_indices] = [node._next_noise()[0] for node in self._noisy_nodes]
+            change += self._noise_strengths * self._noise_standard_deviations * noise
+
+        change *= self._relaxation_time_factors
+        activation += change
+        self._output_buffer[...] = math_tools.sigmoid(activation, self._sigmoid_steepnesses, self._sigmoid_shifts)
+
+        for node in self._nodes:
+            node.write_activation_log()
+
 
 class ProcessingGroup(Connectable):
     "A group of processing steps"
@@ -563,7 +1589,9 @@ class ProcessingGroup(Connectable):
 
 
 class Weight(Connectable):
-    "Each input is multiplied with a weight and stored in the corresponding output buffer."
+    """Each input is multiplied with a weight and stored in the corresponding output buffer.
+    For batched input, a weight with a leading batch axis (e.g., of shape
+    (batch size, 1) for one scalar weight per copy) gives each copy its own weight."""
 
     def __init__(self, weight):
         Connectable.__init__(self)
@@ -573,58 +1601,119 @@ class Weight(Connectable):
         self._name = "weight" + str(self._id)
 
     def _step_computation(self):
-        self._output_buffer = self._incoming_connectables[0].get_output() * self._weight
+        self._output_buffer = self._compute(self._incoming_connectables[0].get_output())
+
+    def _compute(self, input):
+        return input * self._weight
     
     def get_weight(self):
         return self._weight
     
     def set_weight(self, weight):
         self._weight = weight
+        Connectable._parameter_revision += 1
+
+    def get_checkpoint_state(self):
+        state = Connectable.get_checkpoint_state(self)
+        state["weight"] = self._weight
+        return state
+
+    def set_checkpoint_state(self, state):
+        Connectable.set_checkpoint_state(self, state)
+        self._weight = _restore_array(self._weight, state["weight"])
+        Connectable._parameter_revision += 1
+
+    def depends_only_on_input(self):
+        return True
 
 
 class Scaler(Connectable):
     """The input is somehow mapped onto an output with different dimension sizes but the same dimensionality.
     This can be done by interpolation, cropping, or padding."""
 
-    def __init__(self):
+    def __init__(self, interpolation_method="linear"):
         Connectable.__init__(self)
 
+        if (interpolation_method not in ("linear", "spline")):
+            raise ConnectError("Unknown interpolation method \"" + str(interpolation_method) + "\" for the scaler.")
+
         # name of the scaler
         self._name = "scaler" + str(self._id)
 
-    def _step_computation(self):
-        input = copy.copy(self._incoming_connectables[0].get_output())
+        # either "linear" or "spline"
+        self._interpolation_method = interpolation_method
 
-        if (input.ndim == 0):
-            self._interpolate_0d(input)
-        elif (input.ndim == 1):
-            self._interpolate_1d(input)
-        else:
-            self._interpolate_nd_linear(input)
+        # one interpolation matrix per axis (None for axes that are not rescaled),
+        # built as soon as input and output dimension sizes are known
+        self._interpolation_matrices = None
+
+    def get_interpolation_method(self):
+        return self._interpolation_method
+
+    def set_interpolation_method(self, interpolation_method):
+        if (interpolation_method not in ("linear", "spline")):
+            raise ConnectError("Unknown interpolation method \"" + str(interpolation_method) + "\" for the scaler.")
 
-    def _interpolate_0d(self, activation):
-        self._output_buffer = activation
+        self._interpolation_method = interpolation_method
+        self._build_interpolation_matrices()
+        Connectable._parameter_revision += 1
 
-    def _interpolate_1d(self, activation):
-        self._output_buffer = math_tools.linear_interpolation_1d(activation, self._output_dimension_sizes[0])
+    def depends_only_on_input(self):
+        return True
 
-    def _interpolate_2d_spline(self, activation):
-        x, y = numpy.mgrid[0:activation.shape[0], 0:activation.shape[1]]
-        spline_rep = scipy.interpolate.bisplrep(x, y, activation, s=0)
+    def get_checkpoint_state(self):
+        state = Connectable.get_checkpoint_state(self)
+        state["interpolation_method"] = self._interpolation_method
+        return state
 
-        number_of_steps = [complex(0, self._output_dimension_sizes[0]),
-                           complex(0, self._output_dimension_sizes[1])]
+    def set_checkpoint_state(self, state):
+        Connectable.set_checkpoint_state(self, state)
+        if (state["interpolation_method"] != self._interpolation_method):
+            self.set_interpolation_method(state["interpolation_method"])
 
-        x_new, y_new = numpy.mgrid[0:activation.shape[0]-1:number_of_steps[0],
-                                   0:activation.shape[1]-1:number_of_steps[1]]
+    def set_input_dimension_sizes(self, dimension_sizes):
+        Connectable.set_input_dimension_sizes(self, dimension_sizes)
+        self._build_interpolation_matrices()
+
+    def set_output_dimension_sizes(self, dimension_sizes):
+        Connectable.set_output_dimension_sizes(self, dimension_sizes)
+        self._build_interpolation_matrices()
+
+    def _build_interpolation_matrices(self):
+        self._interpolation_matrices = None
+
+        input_sizes = self._input_dimension_sizes
+        output_sizes = self._output_dimension_sizes
+        if (input_sizes is None or output_sizes is None or len(input_sizes) != len(output_sizes)):
+            return
+
+        matrices = []
+        for input_size, output_size in zip(input_sizes, output_sizes):
+            if (input_size == output_size):
+                matrices.append(None)
+            elif (self._interpolation_method == "spline"):
+                matrices.append(math_tools.spline_interpolation_matrix(input_size, output_size))
+            else:
+                matrices.append(math_tools.linear_interpolation_matrix(input_size, output_size))
+
+        self._interpolation_matrices = matrices
 
-        self._output_buffer = scipy.interpolate.bisplev(x_new[:,0], y_new[0,:], spline_rep)
+    def _step_computation(self):
+        self._output_buffer = self._compute(self._incoming_connectables[0].get_output())
+
+    def _compute(self, input):
+        if (self._interpolation_matrices is None or numpy.ndim(input) == 0):
+            output = copy.copy(input)
+        elif (self._batch_size is not None):
+            # the batch axis is not rescaled
+            output = math_tools.interpolate_separable(input, [None] + self._interpolation_matrices)
+        else:
+            output = math_tools.interpolate_separable(input, self._interpolation_matrices)
 
-    def _interpolate_2d_linear_custom(self, activation):
-        self._output_buffer = math_tools.linear_interpolation_2d_custom(activation, self._output_dimension_sizes)
+        if (output is input):
+            output = input.copy()
 
-    def _interpolate_nd_linear(self, activation):
-        self._output_buffer = math_tools.linear_interpolation_nd(activation, self._output_dimension_sizes)
+        return output
 
     def determine_output_dimension_sizes(self):
         pass
@@ -690,59 +1779,40 @@ class Projection(Connectable):
         if (self._projection_compresses):
             self._dimensions_to_compress = list(set(range(input_dimensionality)).difference(set(input_dimensions)))
 
-        self._expand_method = None
-        self._transpose_permutation = None
-        self._inverse_transpose_permutation = None
+        # for expansions, the input axes are transposed into the order of the output axes they are
+        # mapped onto, and then broadcast along all remaining output axes
+        self._expand_permutation = None
         if (self._projection_expands):
-            if (self._input_dimensionality == 0):
-                self._expand_method = self._expand_0D
-            elif (self._input_dimensionality == 1):
-                if (self._output_dimensionality == 2):
-                    self._expand_method = self._expand_1D_2D
-                elif (self._output_dimensionality == 3):
-                    self._expand_method = self._expand_1D_3D
-
-                    indeces = range(self._output_dimensionality)
-                    for d in self._output_dimensions:
-                        indeces.remove(d)
-
-                    third_dimension_index = indeces[0]
-                    second_dimension_index = indeces[1]
-                    first_dimension_index = self._output_dimensions[0]
-                    self._transpose_permutation = (third_dimension_index, second_dimension_index, first_dimension_index)
-                    self._inverse_transpose_permutation = self._invert_permutation(self._transpose_permutation)
-                else:
-                    raise ConnectError("""You are trying to expand a 1D input to
-                                       something other than 2D or 3D. This is not yet supported.""")
-            elif (self._input_dimensionality == 2):
-                if (self._output_dimensionality == 3):
-                    self._expand_method = self._expand_2D_3D
-
-                    indeces = range(self._output_dimensionality)
-                    for d in self._output_dimensions:
-                        indeces.remove(d)
-
-                    third_dimension_index = indeces[0]
-                    self._transpose_permutation = copy.copy(self._output_dimensions)
-                    self._transpose_permutation.insert(0, third_dimension_index)
-                    self._inverse_transpose_permutation = self._invert_permutation(self._transpose_permutation)
-                else:
-                    raise ConnectError("""You are trying to expand a 2D input to
-                                       something other than 3D. This is not yet supported.""")
-        
+            self._expand_permutation = sorted(range(len(self._output_dimensions)),
+                                              key=lambda i: self._output_dimensions[i])
 
     def _step_computation(self):
-        input = self._incoming_connectables[0].get_output()
+        self._output_buffer = self._compute(self._incoming_connectables[0].get_output())
+
+    def _compute(self, input):
+        if (self._projection_expands):
+            return self._expand(input)
+
+        if (self._batch_size is not None):
+            return self._compute_batch(input)
 
         if (self._projection_compresses):
             for i in range(len(self._dimensions_to_compress)):
                 input = input.max(self._dimensions_to_compress[i] - i)
-                
-        elif (self._projection_expands):
-            self._output_buffer = self._expand_method(input)
 
-        if (self._projection_expands is not True):
-            self._output_buffer = numpy.transpose(input, self._output_dimensions)
+        return numpy.transpose(input, self._output_dimensions)
+
+    def _compute_batch(self, input):
+        "Compresses or transposes an input with a leading batch axis, which is kept in front."
+        if (self._projection_compresses):
+            for i in range(len(self._dimensions_to_compress)):
+                input = input.max(self._dimensions_to_compress[i] - i + 1)
+
+        # a zero-dimensional output keeps a dimension of size one
+        if (len(self._output_dimensions) == 0):
+            return input.reshape(self._batch_size, 1)
+
+        return numpy.transpose(input, [0] + [dimension + 1 for dimension in self._output_dimensions])
     
     def determine_output_dimension_sizes(self):
         if (self._projection_expands):
@@ -776,68 +1846,109 @@ class Projection(Connectable):
     def projection_expands(self):
         return self._projection_expands
 
+    def depends_only_on_input(self):
+        return True
+
     def projection_compresses(self):
         return self._projection_compresses
 
-    def _expand_0D(self, input):
-        return numpy.zeros(self._output_dimension_sizes) + input
-
-    def _expand_1D_2D(self, input):
-        output = numpy.zeros(self._output_dimension_sizes)
-
-        transpose = False
-        if (self._output_dimensions[0] == 0):
-            transpose = True
-            output = numpy.transpose(output)
+    def _expand(self, input):
+        """Returns a read-only view of the input, broadcast to the output dimension sizes.
+        The expanded array is never materialized."""
+        input = numpy.asarray(input)
+        batch_shape = []
+        if (self._batch_size is not None):
+            batch_shape = [self._batch_size]
 
-        for i in range(len(output)):
-            output[i] = input
+        if (self._input_dimensionality > 0):
+            permutation = self._expand_permutation
+            if (self._batch_size is not None):
+                permutation = [0] + [axis + 1 for axis in permutation]
+            input = numpy.transpose(input, permutation)
 
-        if (transpose):
-            output = numpy.transpose(output)
-
-        return output
+        broadcast_shape = [1] * self._output_dimensionality
+        for output_dimension in self._output_dimensions:
+            broadcast_shape[output_dimension] = self._output_dimension_sizes[output_dimension]
 
-    def _expand_1D_3D(self, input):
-        output = numpy.zeros(self._output_dimension_sizes)
+        return numpy.broadcast_to(input.reshape(batch_shape + broadcast_shape),
+                                  batch_shape + list(self._output_dimension_sizes))
 
-        if (self._transpose_permutation is not None):
-            output = numpy.transpose(output, self._transpose_permutation)
 
-        second_dimension_size = self._output_dimension_sizes[self._transpose_permutation[1]]
-        first_dimension_size = self._output_dimension_sizes[self._transpose_permutation[2]]
+class FusedConnection(Connectable):
+    """A chain of weights, projections, and scalers that is computed as a single operator.
+    Scalar weights are combined into one factor, which is applied where the data is smallest
+    (after compressions and before expansions). Expansions stay broadcast views and array
+    weights write into preallocated buffers, so no intermediate arrays are kept per step.
+    The processing steps keep their parameters, so changing a weight takes effect immediately."""
 
-        two_dim_activation = numpy.zeros((second_dimension_size, first_dimension_size))
-        for i in range(len(two_dim_activation)):
-            two_dim_activation[i] = input
+    def __init__(self, processing_steps):
+        Connectable.__init__(self)
 
-        for i in range(len(output)):
-            output[i] = two_dim_activation
+        if (not can_fuse(processing_steps)):
+            raise ConnectError("Only chains of at least two weights, projections, and scalers can be fused.")
 
-        if (self._transpose_permutation is not None):
-            output = numpy.transpose(output, self._inverse_transpose_permutation)
+        # name of the fused connection
+        self._name = "fused_connection" + str(self._id)
 
-        return output
+        self._processing_steps = list(processing_steps)
+        self._input_dimensionality = processing_steps[0].get_input_dimensionality()
+        self._output_dimensionality = processing_steps[-1].get_output_dimensionality()
 
-    def _expand_2D_3D(self, input):
-        output = numpy.zeros(self._output_dimension_sizes)
+        # preallocated results of the array weights, one per step index
+        self._result_buffers = {}
 
-        if (self._transpose_permutation is not None):
-            output = numpy.transpose(output, self._transpose_permutation)
+    def get_processing_steps(self):
+        return self._processing_steps
 
-        for i in range(len(output)):
-            output[i] = input
+    def depends_only_on_input(self):
+        return True
 
-        if (self._transpose_permutation is not None):
-            output = numpy.transpose(output, self._inverse_transpose_permutation)
+    def _get_result_buffer(self, index, shape):
+        buffer = self._result_buffers.get(index)
+        if (buffer is None or buffer.shape != shape):
+            buffer = numpy.empty(shape)
+            self._result_buffers[index] = buffer
 
-        return output
+        return buffer
 
-    def _invert_permutation(self, permutation):
-        inverse_permutation = []
-        for i in range(len(permutation)):
-            inverse_permutation.append(permutation.index(i))
+    def _step_computation(self):
+        self._output_buffer = self._compute(self._incoming_connectables[0].get_output())
+
+    def _compute(self, input):
+        value = input
+        factor = 1.
+
+        for index, processing_step in enumerate(self._processing_steps):
+            if (processing_step.__class__ is Weight):
+                weight = processing_step.get_weight()
+                if (numpy.ndim(weight) == 0):
+                    # scalar weights commute with all other processing steps
+                    factor *= weight
+                    continue
+
+                shape = numpy.broadcast(value, weight).shape
+                value = numpy.multiply(value, weight, out=self._get_result_buffer(index, shape))
+                if (factor != 1.):
+                    value *= factor
+                    factor = 1.
+
+            elif (processing_step.__class__ is Projection and processing_step.projection_expands()):
+                if (factor != 1.):
+                    value = value * factor
+                    factor = 1.
+                value = processing_step._compute(value)
+
+            elif (processing_step.__class__ is Projection and processing_step.projection_compresses()):
+                # the maximum only commutes with non-negative factors
+                if (factor < 0.):
+                    value = value * factor
+                    factor = 1.
+                value = processing_step._compute(value)
 
-        return inverse_permutation
+            else:
+                value = processing_step._compute(value)
 
+        if (factor != 1.):
+            value = value * factor
 
+        return value
@@ -1,14 +1,14 @@
-import naoqi
-from naoqi import ALProxy
 import numpy
 import DynamicField
 import math_tools
 import math
+import BackgroundWriter
+import MotionIO
 
 class EndEffectorControlRight(DynamicField.Connectable):
     "End effector control"
 
-    def __init__(self, head_sensor_field, move_arm_intention_field, visual_servoing_intention_field, input_dimension_sizes, end_effector_speed_fraction = 0.02, use_robot_sensors = True):
+    def __init__(self, head_sensor_field, move_arm_intention_field, visual_servoing_intention_field, input_dimension_sizes, end_effector_speed_fraction = 0.02, use_robot_sensors = True, motion_io = None):
         "Constructor"
         DynamicField.Connectable.__init__(self)
 
@@ -21,10 +21,15 @@ class EndEffectorControlRight(DynamicField.Connectable):
         self._move_arm_intention_field = move_arm_intention_field
         self._visual_servoing_intention_field = visual_servoing_intention_field
 
-        self._file = open("right_ee_pos_0.dat", 'w')
+        # positions of the end effector, written in the background
+        self._position_log = BackgroundWriter.TextLog("right_ee_pos_0.dat")
 
-        # naoqi proxy to talk to the motion module
-        self._motion_proxy = ALProxy("ALMotion", "nao.ini.rub.de", 9559)
+        # shared connection to the motion module
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
+        self._motion_proxy = motion_io.get_motion_proxy()
+        self._motion_io.register_position("RArm", 2, True)
         # set the stiffness of the arm to 1.0, so it will move
         self._motion_proxy.setStiffnesses("RArm", 1.0)
 
@@ -38,7 +43,7 @@ class EndEffectorControlRight(DynamicField.Connectable):
 
     def __del__(self):
         self._motion_proxy.setStiffnesses("RArm", 0.0)
-        self._file.close()
+        self._position_log.close()
 
     def get_intention_node(self):
         return self._intention_node
@@ -102,13 +107,13 @@ class EndEffectorControlRight(DynamicField.Connectable):
 
 
         # STEP
-        current_pos = self._motion_proxy.getPosition("RArm", 2, True)
+        current_pos = self._motion_io.get_position("RArm", 2, True)
         current_x = current_pos[0]
         current_y = current_pos[1]
         current_z = current_pos[2]
         current_alpha = current_pos[3]
 
-        self._file.write("" + str(current_y) + "\t" + str(current_x) + "\n")
+        self._position_log.write(current_y, current_x)
 
         relaxation_time = 0.025
         x_dot = self._intention_node.get_output()[0] * (relaxation_time * (-1 * normalization_factor_x * current_x + move_arm_boost_x + vis_arm_boost_x))
@@ -124,13 +129,13 @@ class EndEffectorControlRight(DynamicField.Connectable):
         # (the last parameter is the axis mask and determines, what should be
         # controlled: 7 for position only, 56 for orientation only, and 63
         # for position and orientation
-        self._motion_proxy.changePosition("RArm", 2, end_effector_change, self._end_effector_speed_fraction, 15)
+        self._motion_io.change_position("RArm", 2, end_effector_change, self._end_effector_speed_fraction, 15)
 
 
 class EndEffectorControlLeft(DynamicField.Connectable):
     "End effector control"
 
-    def __init__(self, head_sensor_field, move_arm_intention_field, visual_servoing_intention_field, input_dimension_sizes, end_effector_speed_fraction = 0.02, use_robot_sensors = True):
+    def __init__(self, head_sensor_field, move_arm_intention_field, visual_servoing_intention_field, input_dimension_sizes, end_effector_speed_fraction = 0.02, use_robot_sensors = True, motion_io = None):
         "Constructor"
         DynamicField.Connectable.__init__(self)
 
@@ -143,10 +148,15 @@ class EndEffectorControlLeft(DynamicField.Connectable):
         self._move_arm_intention_field = move_arm_intention_field
         self._visual_servoing_intention_field = visual_servoing_intention_field
 
-        self._file = open("left_ee_pos_0.dat", 'w')
+        # positions of the end effector, written in the background
+        self._position_log = BackgroundWriter.TextLog("left_ee_pos_0.dat")
 
-        # naoqi proxy to talk to the motion module
-        self._motion_proxy = ALProxy("ALMotion", "nao.ini.rub.de", 9559)
+        # shared connection to the motion module
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
+        self._motion_proxy = motion_io.get_motion_proxy()
+        self._motion_io.register_position("LArm", 2, True)
         # set the stiffness of the arm to 1.0, so it will move
         self._motion_proxy.setStiffnesses("LArm", 1.0)
 
@@ -160,7 +170,7 @@ class EndEffectorControlLeft(DynamicField.Connectable):
 
     def __del__(self):
         self._motion_proxy.setStiffnesses("LArm", 0.0)
-        self._file.close()
+        self._position_log.close()
 
     def get_intention_node(self):
         return self._intention_node
@@ -219,13 +229,13 @@ class EndEffectorControlLeft(DynamicField.Connectable):
 
 
         # STEP
-        current_pos = self._motion_proxy.getPosition("LArm", 2, True)
+        current_pos = self._motion_io.get_position("LArm", 2, True)
         current_x = current_pos[0]
         current_y = current_pos[1]
         current_z = current_pos[2]
         current_alpha = current_pos[3]
 
-        self._file.write("" + str(current_y) + "\t" + str(current_x) + "\n")
+        self._position_log.write(current_y, current_x)
 
         relaxation_time = 0.025
         x_dot = self._intention_node.get_output()[0] * (relaxation_time * (-1 * normalization_factor_x * current_x + move_arm_boost_x + vis_arm_boost_x))
@@ -241,6 +251,6 @@ class EndEffectorControlLeft(DynamicField.Connectable):
         # (the last parameter is the axis mask and determines, what should be
         # controlled: 7 for position only, 56 for orientation only, and 63
         # for position and orientation
-        self._motion_proxy.changePosition("LArm", 2, end_effector_change, self._end_effector_speed_fraction, 15)
+        self._motion_io.change_position("LArm", 2, end_effector_change, self._end_effector_speed_fraction, 15)
 
 
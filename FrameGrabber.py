@@ -0,0 +1,270 @@
+import time
+import atexit
+import weakref
+import threading
+import numpy
+
+class Frame:
+    """Image delivered by ALVideoDevice. The pixels are a read-only uint8 view
+    (numpy.frombuffer) into the byte string of the remote call, so they are
+    never copied. The timestamp is the time at which the camera took the
+    image (as reported by NAOqi), the sequence number counts the frames of
+    a frame grabber."""
+
+    def __init__(self, image, width, height, number_of_layers, timestamp, sequence_number):
+        self._image = image
+        self._width = width
+        self._height = height
+        self._number_of_layers = number_of_layers
+        self._timestamp = timestamp
+        self._sequence_number = sequence_number
+        self._acquisition_time = time.time()
+
+    def get_image(self):
+        "Returns the pixels as a flat array of interleaved channels."
+        return self._image
+
+    def get_width(self):
+        return self._width
+
+    def get_height(self):
+        return self._height
+
+    def get_number_of_layers(self):
+        return self._number_of_layers
+
+    def get_timestamp(self):
+        return self._timestamp
+
+    def get_sequence_number(self):
+        return self._sequence_number
+
+    def get_acquisition_time(self):
+        "Returns the (local) time at which the frame grabber received the frame."
+        return self._acquisition_time
+
+
+def frame_from_naoqi_image(naoimage, sequence_number):
+    "Wraps an image as returned by ALVideoDevice.getImageRemote() into a frame."
+    image = numpy.frombuffer(naoimage[6], dtype=numpy.uint8)
+    timestamp = naoimage[4] + naoimage[5] * 1e-6
+    return Frame(image, naoimage[0], naoimage[1], naoimage[2], timestamp, sequence_number)
+
+
+class FrameGrabber:
+    """Pulls frames from a subscription of ALVideoDevice in a background thread,
+    so that the steps of the architecture never wait for the network. The
+    last number_of_buffers frames are kept in a ring; consumers take the newest
+    complete frame with get_latest_frame() (or wait for a new one with
+    wait_for_frame()). Failing remote calls are counted and retried after
+    retry_interval seconds."""
+
+    def __init__(self, video_proxy, subscriber_name, number_of_buffers=3, retry_interval=0.1):
+        if (number_of_buffers < 1):
+            raise ValueError("A frame grabber needs at least one buffer.")
+
+        self._video_proxy = video_proxy
+        self._subscriber_name = subscriber_name
+        self._retry_interval = retry_interval
+        self._frames = [None] * number_of_buffers
+        self._latest_frame = None
+        self._number_of_frames = 0
+        self._number_of_failed_requests = 0
+        self._condition = threading.Condition()
+        self._running = True
+
+        self._thread = threading.Thread(target=self._run, name="frame grabber")
+        self._thread.daemon = True
+        self._thread.start()
+        _running_frame_grabbers.add(self)
+
+    def get_number_of_frames(self):
+        "Returns the number of frames grabbed so far."
+        return self._number_of_frames
+
+    def get_number_of_failed_requests(self):
+        return self._number_of_failed_requests
+
+    def is_running(self):
+        return self._running
+
+    def get_latest_frame(self):
+        "Returns the newest frame (None before the first frame arrived) without waiting."
+        return self._latest_frame
+
+    def get_frames(self):
+        "Returns the frames in the ring, oldest first."
+        self._condition.acquire()
+        try:
+            frames = [frame for frame in self._frames if frame is not None]
+        finally:
+            self._condition.release()
+
+        frames.sort(key=lambda frame: frame.get_sequence_number())
+        return frames
+
+    def wait_for_frame(self, newer_than=-1, timeout=None):
+        """Waits until there is a frame with a sequence number larger than
+        newer_than and returns the newest frame (None if the timeout passed
+        or the grabber was stopped before)."""
+        if (timeout is not None):
+            end_time = time.time() + timeout
+
+        self._condition.acquire()
+        try:
+            while (self._running and
+                   (self._latest_frame is None or self._latest_frame.get_sequence_number() <= newer_than)):
+                if (timeout is None):
+                    # waiting with a timeout keeps the thread responsive to interrupts
+                    self._condition.wait(1.0)
+                else:
+                    remaining_time = end_time - time.time()
+                    if (remaining_time <= 0.):
+                        break
+                    self._condition.wait(remaining_time)
+
+            frame = self._latest_frame
+        finally:
+            self._condition.release()
+
+        if (frame is None or frame.get_sequence_number() <= newer_than):
+            return None
+
+        return frame
+
+    def stop(self):
+        "Stops the grabber thread (after the request that is running)."
+        if (not self._running):
+            return
+
+        self._condition.acquire()
+        self._running = False
+        self._condition.notify_all()
+        self._condition.release()
+        _running_frame_grabbers.discard(self)
+
+        if (self._thread is not threading.current_thread()):
+            self._thread.join()
+
+    def _run(self):
+        while (self._running):
+            try:
+                naoimage = self._video_proxy.getImageRemote(self._subscriber_name)
+                if (naoimage is None):
+                    raise RuntimeError("No image was delivered.")
+                frame = frame_from_naoqi_image(naoimage, self._number_of_frames)
+            except Exception as exception:
+                self._number_of_failed_requests += 1
+                print("Error. The frame grabber could not get an image: " + str(exception))
+                time.sleep(self._retry_interval)
+                continue
+
+            self._condition.acquire()
+            self._frames[frame.get_sequence_number() % len(self._frames)] = frame
+            self._latest_frame = frame
+            self._number_of_frames += 1
+            self._condition.notify_all()
+            self._condition.release()
+
+
+# frame grabbers whose threads are running; they are stopped on exit, before
+# the interpreter shuts down underneath them
+_running_frame_grabbers = weakref.WeakSet()
+
+def _stop_frame_grabbers():
+    for frame_grabber in list(_running_frame_grabbers):
+        frame_grabber.stop()
+
+atexit.register(_stop_frame_grabbers)
+
+
+class RecordedVideoDevice:
+    """Local stand-in for ALVideoDevice that serves recorded frames (e.g., from
+    record_frames()) in a loop at the given frame rate, so that the camera
+    field and the frame grabber can be run without a robot. Only the methods
+    the camera field uses are provided."""
+
+    def __init__(self, frames, width=160, height=120, number_of_layers=3, color_space=12, frame_rate=30.0):
+        self._frames = [numpy.asarray(frame, dtype=numpy.uint8).tostring() for frame in frames]
+        if (len(self._frames) == 0):
+            raise ValueError("A recorded video device needs at least one frame.")
+        for frame in self._frames:
+            if (len(frame) != width * height * number_of_layers):
+                raise ValueError("The recorded frames do not have the given size.")
+
+        self._width = width
+        self._height = height
+        self._number_of_layers = number_of_layers
+        self._color_space = color_space
+        self._frame_period = 1. / frame_rate
+        self._parameters = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, name, resolution, color_space, fps):
+        self._lock.acquire()
+        subscriber_name = name
+        suffix = 0
+        while (subscriber_name in self._subscribers):
+            suffix += 1
+            subscriber_name = name + "_" + str(suffix)
+        self._subscribers[subscriber_name] = time.time()
+        self._lock.release()
+
+        return subscriber_name
+
+    def unsubscribe(self, name):
+        self._lock.acquire()
+        removed = self._subscribers.pop(name, None) is not None
+        self._lock.release()
+
+        return removed
+
+    def setParam(self, parameter, value):
+        self._parameters[parameter] = value
+
+    def getParam(self, parameter):
+        return self._parameters.get(parameter)
+
+    def getImageRemote(self, name):
+        """Returns the next frame in the format of NAOqi (width, height,
+        number of layers, color space, seconds, microseconds, pixels), waiting
+        for it like a camera running at the frame rate."""
+        self._lock.acquire()
+        start_time = self._subscribers.get(name)
+        self._lock.release()
+        if (start_time is None):
+            return None
+
+        # frames are taken at fixed times after the subscription
+        elapsed_time = time.time() - start_time
+        frame_index = int(elapsed_time / self._frame_period) + 1
+        frame_time = start_time + frame_index * self._frame_period
+        delay = frame_time - time.time()
+        if (delay > 0.):
+            time.sleep(delay)
+
+        seconds = int(frame_time)
+        microseconds = int((frame_time - seconds) * 1e6)
+        return [self._width,
+                self._height,
+                self._number_of_layers,
+                self._color_space,
+                seconds,
+                microseconds,
+                self._frames[frame_index % len(self._frames)]]
+
+    def releaseImage(self, name):
+        pass
+
+
+def record_frames(video_proxy, subscriber_name, number_of_frames):
+    """Returns the pixels of the next number_of_frames frames of the
+    subscription as an array (one row per frame), e.g., to be saved with
+    numpy.save() and served by a RecordedVideoDevice later."""
+    frames = []
+    for i in range(number_of_frames):
+        naoimage = video_proxy.getImageRemote(subscriber_name)
+        frames.append(numpy.frombuffer(naoimage[6], dtype=numpy.uint8))
+
+    return numpy.array(frames)
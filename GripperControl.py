@@ -1,14 +1,13 @@
-import naoqi
-from naoqi import ALProxy
 import numpy
 import DynamicField
 import math_tools
 import math
+import MotionIO
 
 class NaoGripperControlRight(DynamicField.Connectable):
     "Gripper control right"
 
-    def __init__(self, input_dimension_size, gripper_speed_fraction = 0.2, use_robot_sensors = True):
+    def __init__(self, input_dimension_size, gripper_speed_fraction = 0.2, use_robot_sensors = True, motion_io = None):
         "Constructor"
         DynamicField.Connectable.__init__(self)
         self._gripper_speed_fraction = gripper_speed_fraction
@@ -26,8 +25,12 @@ class NaoGripperControlRight(DynamicField.Connectable):
         self._gripper_x.set_relaxation_time(5.)
 
 
-        # naoqi proxy to talk to the motion module
-        self._motion_proxy = ALProxy("ALMotion", "nao.ini.rub.de", 9559)
+        # shared connection to the motion module
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
+        self._motion_proxy = motion_io.get_motion_proxy()
+        self._motion_io.register_angle("RHand", True)
         # set the stiffness of the hand to 1.0, so it will move
         self._motion_proxy.setStiffnesses("RHand", 1.0)
 
@@ -54,7 +57,7 @@ class NaoGripperControlRight(DynamicField.Connectable):
 
         #print("boost x: ", str(gripper_x_boost))
 
-        current_x = self._motion_proxy.getAngles("RHand", True)[0]
+        current_x = self._motion_io.get_angle("RHand", True)
         self._gripper_x.set_boost(gripper_x_boost)
 
         x_dot = self._gripper_x.get_change(current_x)[0]
@@ -63,12 +66,12 @@ class NaoGripperControlRight(DynamicField.Connectable):
         #print("x dot: ", str(x_dot))
 
         # move the hand towards the peak
-        self._motion_proxy.changeAngles("RHand", x_dot, self._gripper_speed_fraction)
+        self._motion_io.change_angle("RHand", x_dot, self._gripper_speed_fraction)
 
 class NaoGripperControlLeft(DynamicField.Connectable):
     "Gripper control left"
 
-    def __init__(self, input_dimension_size, gripper_speed_fraction = 0.2, use_robot_sensors = True):
+    def __init__(self, input_dimension_size, gripper_speed_fraction = 0.2, use_robot_sensors = True, motion_io = None):
         "Constructor"
         DynamicField.Connectable.__init__(self)
         self._gripper_speed_fraction = gripper_speed_fraction
@@ -86,8 +89,12 @@ class NaoGripperControlLeft(DynamicField.Connectable):
         self._gripper_x.set_relaxation_time(5.)
 
 
-        # naoqi proxy to talk to the motion module
-        self._motion_proxy = ALProxy("ALMotion", "nao.ini.rub.de", 9559)
+        # shared connection to the motion module
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
+        self._motion_proxy = motion_io.get_motion_proxy()
+        self._motion_io.register_angle("LHand", True)
         # set the stiffness of the hand to 1.0, so it will move
         self._motion_proxy.setStiffnesses("LHand", 1.0)
 
@@ -114,7 +121,7 @@ class NaoGripperControlLeft(DynamicField.Connectable):
 
         #print("boost x: ", str(gripper_x_boost))
 
-        current_x = self._motion_proxy.getAngles("LHand", True)[0]
+        current_x = self._motion_io.get_angle("LHand", True)
         self._gripper_x.set_boost(gripper_x_boost)
 
         x_dot = self._gripper_x.get_change(current_x)[0]
@@ -123,4 +130,4 @@ class NaoGripperControlLeft(DynamicField.Connectable):
         #print("x dot: ", str(x_dot))
 
         # move the hand towards the peak
-        self._motion_proxy.changeAngles("LHand", x_dot, self._gripper_speed_fraction)
+        self._motion_io.change_angle("LHand", x_dot, self._gripper_speed_fraction)
@@ -1,28 +1,34 @@
-from naoqi import ALProxy
 import numpy
 import math
 import DynamicField
 import math_tools
+import MotionIO
 
 class NaoGripperSensorRight(DynamicField.DynamicField):
     "Nao gripper sensor"
 
-    def __init__(self, gripper_field_size, use_robot_sensors=True):
+    def __init__(self, gripper_field_size, use_robot_sensors=True, motion_io=None):
         "Constructor"
         DynamicField.DynamicField.__init__(self, dimension_bounds = [[gripper_field_size]])
 
-        self._motion_proxy = ALProxy("ALMotion", "nao.ini.rub.de", 9559)
+        # shared connection to the motion module
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
         self._name = "nao_gripper_sensor_right"
         self._use_robot_sensors = use_robot_sensors
+        self._motion_io.register_angle("RHand", use_robot_sensors)
 
     def _step_computation(self):
         # get the current position of the gripper
-        gripper_pos = self._motion_proxy.getAngles("RHand", self._use_robot_sensors)[0]
+        gripper_pos = self._motion_io.get_angle("RHand", self._use_robot_sensors)
 
         gripper_field_pos = gripper_pos * (self._output_dimension_sizes[0] - 1)
 
         # create a Gaussian activation pattern at the target location
-        activation = math_tools.gauss_1d(self._output_dimension_sizes[0], 6.0, 1.0, gripper_field_pos) - 5.0
+        activation = math_tools.gauss_nd(self._output_dimension_sizes, 6.0, [1.0], [gripper_field_pos],
+                                         shift_resolution=math_tools.GAUSS_SHIFT_RESOLUTION)
+        activation -= 5.0
         self._activation = activation
 
         # compute the thresholded activation of the field
@@ -31,22 +37,28 @@ class NaoGripperSensorRight(DynamicField.DynamicField):
 class NaoGripperSensorLeft(DynamicField.DynamicField):
     "Nao gripper sensor"
 
-    def __init__(self, gripper_field_size, use_robot_sensors=True):
+    def __init__(self, gripper_field_size, use_robot_sensors=True, motion_io=None):
         "Constructor"
         DynamicField.DynamicField.__init__(self, dimension_bounds = [[gripper_field_size]])
 
-        self._motion_proxy = ALProxy("ALMotion", "nao.ini.rub.de", 9559)
+        # shared connection to the motion module
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
         self._name = "nao_gripper_sensor_left"
         self._use_robot_sensors = use_robot_sensors
+        self._motion_io.register_angle("LHand", use_robot_sensors)
 
     def _step_computation(self):
         # get the current position of the gripper
-        gripper_pos = self._motion_proxy.getAngles("LHand", self._use_robot_sensors)[0]
+        gripper_pos = self._motion_io.get_angle("LHand", self._use_robot_sensors)
 
         gripper_field_pos = gripper_pos * (self._output_dimension_sizes[0] - 1)
 
         # create a Gaussian activation pattern at the target location
-        activation = math_tools.gauss_1d(self._output_dimension_sizes[0], 6.0, 1.0, gripper_field_pos) - 5.0
+        activation = math_tools.gauss_nd(self._output_dimension_sizes, 6.0, [1.0], [gripper_field_pos],
+                                         shift_resolution=math_tools.GAUSS_SHIFT_RESOLUTION)
+        activation -= 5.0
         self._activation = activation
 
         # compute the thresholded activation of the field
@@ -1,14 +1,13 @@
-import naoqi
-from naoqi import ALProxy
 import numpy
 import DynamicField
 import math_tools
 import math
+import MotionIO
 
 class HeadControl(DynamicField.Connectable):
     "Head control"
 
-    def __init__(self, input_dimension_sizes, head_speed_fraction = 0.2, head_time_scale = 0.01, use_robot_sensors = False):
+    def __init__(self, input_dimension_sizes, head_speed_fraction = 0.2, head_time_scale = 0.01, use_robot_sensors = False, motion_io = None):
         "Constructor"
         DynamicField.Connectable.__init__(self)
         self._head_speed_fraction = head_speed_fraction
@@ -17,8 +16,11 @@ class HeadControl(DynamicField.Connectable):
         self._input_dimension_sizes = input_dimension_sizes
         self._head_time_scale = head_time_scale
 
-        # naoqi proxy to talk to the motion module
-        self._motion_proxy = ALProxy("ALMotion", "nao.ini.rub.de", 9559)
+        # shared connection to the motion module
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
+        self._motion_proxy = motion_io.get_motion_proxy()
         # set the stiffness of the head to 1.0, so it will move
         self._motion_proxy.setStiffnesses("Head", 1.0)
 
@@ -54,5 +56,5 @@ class HeadControl(DynamicField.Connectable):
         head_tilt_change = -1 * self._head_time_scale * head_force_y * (opening_angle_y / length_y)
 
         # move the head towards the peak
-        self._motion_proxy.changeAngles("HeadYaw", head_pan_change, self._head_speed_fraction)
-        self._motion_proxy.changeAngles("HeadPitch", head_tilt_change, self._head_speed_fraction)
+        self._motion_io.change_angle("HeadYaw", head_pan_change, self._head_speed_fraction)
+        self._motion_io.change_angle("HeadPitch", head_tilt_change, self._head_speed_fraction)
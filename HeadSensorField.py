@@ -1,22 +1,27 @@
-from naoqi import ALProxy
 import numpy
 import math
 import DynamicField
 import math_tools
+import MotionIO
 
 class NaoHeadSensorField(DynamicField.DynamicField):
     "Nao head sensor"
 
-    def __init__(self, camera_id = "CameraBottom", use_robot_sensors=True):
+    def __init__(self, camera_id = "CameraBottom", use_robot_sensors=True, motion_io=None):
         "Constructor"
         DynamicField.DynamicField.__init__(self, dimension_bounds = [[40],[40]])
 
         # 2: nao space (origin in feet, x is front, y is left, z is up)
         self._robot_space_id = 2
         self._camera_id = camera_id
-        self._motion_proxy = ALProxy("ALMotion", "nao.ini.rub.de", 9559)
+        # shared connection to the motion module
+        if (motion_io is None):
+            motion_io = MotionIO.get_default_motion_io()
+        self._motion_io = motion_io
+        self._motion_proxy = motion_io.get_motion_proxy()
         self._name = "nao_head_sensor"
         self._use_robot_sensors = use_robot_sensors
+        self._motion_io.register_position(self._camera_id, self._robot_space_id, use_robot_sensors)
         self._min_x = 0.0
         self._max_x = 0.0
         self._min_y = 0.0
@@ -45,7 +50,7 @@ class NaoHeadSensorField(DynamicField.DynamicField):
 
     def _step_computation(self):
         # get the current pan and tilt angles of the camera
-        camera_pos = self._motion_proxy.getPosition(self._camera_id, self._robot_space_id, self._use_robot_sensors)
+        camera_pos = self._motion_io.get_position(self._camera_id, self._robot_space_id, self._use_robot_sensors)
         cam_x = camera_pos[0]
         cam_y = camera_pos[1]
         cam_z = camera_pos[2]
@@ -82,7 +87,9 @@ class NaoHeadSensorField(DynamicField.DynamicField):
         end_effector_target_y = ((current_y - self._min_y) / length_y) * self._output_dimension_sizes[1]
 
         # create a Gaussian activation pattern at the target location
-        activation = math_tools.gauss_2d(self._output_dimension_sizes, 6.0, [2.0, 2.0], [end_effector_target_y, end_effector_target_x]) - 5.0
+        activation = math_tools.gauss_nd(self._output_dimension_sizes, 6.0, [2.0, 2.0], [end_effector_target_y, end_effector_target_x],
+                                         shift_resolution=math_tools.GAUSS_SHIFT_RESOLUTION)
+        activation -= 5.0
         self._activation = activation
 
         # compute the thresholded activation of the field
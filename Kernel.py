@@ -3,17 +3,96 @@ import random
 from scipy import ndimage
 import numpy
 import copy
+import collections
+
+# the FFT is used for convolutions of inputs with at least this many elements ..
+FFT_MINIMUM_INPUT_SIZE = 1024
+# .. if the summed length of the kernel parts exceeds this factor times the
+# binary logarithm of the input size (the cost of direct convolution grows
+# with the kernel length, the cost of FFT convolution does not)
+FFT_KERNEL_LENGTH_FACTOR = 3.5
+
+# singular values below this fraction of the largest one are dropped when
+# decomposing a kernel into separable components
+LOW_RANK_TOLERANCE = 1e-6
+
+# number of kernel parts kept in the process-wide kernel part cache
+KERNEL_PART_CACHE_SIZE = 256
+# least recently used kernel parts, by (amplitude, width, shift, limit, scaled)
+_kernel_part_cache = collections.OrderedDict()
+
+def convolve(input, kernel, output=None, method="auto", batched=False):
+    """Convolves the input with all separated parts of the kernel (with
+    wrapped borders). If an output array is supplied, the result is written
+    into it instead of a new array. The method is either "direct" (separated
+    one-dimensional convolutions), "fft" (multiplication with the cached
+    spectrum of the kernel) or "auto", which selects the faster of the two
+    based on the kernel and input size. If batched is True, the first axis of
+    the input holds independent copies, which are convolved separately."""
+    shape = numpy.shape(input)
+    axis_offset = 0
+    if (batched):
+        shape = shape[1:]
+        axis_offset = 1
+
+    if (method == "auto"):
+        method = select_convolution_method(shape, kernel)
+
+    if (method == "fft"):
+        axes = range(axis_offset, axis_offset + len(shape))
+        convolution_result = numpy.fft.irfftn(numpy.fft.rfftn(input, axes=axes) * kernel.get_spectrum(shape),
+                                              s=shape, axes=axes)
+        if (output is not None):
+            output[...] = convolution_result
+            convolution_result = output
+        return convolution_result
+
+    separable_components = kernel.get_separable_components()
+
+    if (output is None):
+        convolution_result = copy.copy(input)
+    else:
+        convolution_result = output
+        convolution_result[...] = input
+
+    _convolve_separable(convolution_result, separable_components[0], axis_offset)
+
+    # kernels that are not separable are convolved component by component
+    for kernel_parts in separable_components[1:]:
+        component_result = copy.copy(input)
+        _convolve_separable(component_result, kernel_parts, axis_offset)
+        convolution_result += component_result
 
-def convolve(input, kernel):
-    convolution_result = copy.copy(input)
-    for dimension_index in range(kernel.get_dimensionality()):
-        ndimage.convolve1d(convolution_result, \
-                           kernel.get_separated_kernel_part(dimension_index), \
-                           axis = dimension_index, \
-                           output = convolution_result, \
+    return convolution_result
+
+def _convolve_separable(input, kernel_parts, axis_offset=0):
+    """Convolves the input in place with one kernel part per dimension (the
+    first axis_offset axes of the input are not convolved)."""
+    for dimension_index in range(len(kernel_parts)):
+        ndimage.convolve1d(input, \
+                           kernel_parts[dimension_index], \
+                           axis = dimension_index + axis_offset, \
+                           output = input, \
                            mode = 'wrap')
 
-    return convolution_result
+def select_convolution_method(input_shape, kernel):
+    "Returns the faster convolution method (\"direct\" or \"fft\") for the given input shape and kernel."
+    input_size = 1
+    for dimension_size in input_shape:
+        input_size *= dimension_size
+
+    if (input_size < FFT_MINIMUM_INPUT_SIZE):
+        return "direct"
+
+    kernel_length = 0
+    for kernel_parts in kernel.get_separable_components():
+        for kernel_part in kernel_parts:
+            kernel_length += len(kernel_part)
+
+    if (kernel_length > FFT_KERNEL_LENGTH_FACTOR * math.log(input_size, 2)):
+        return "fft"
+
+    return "direct"
 
 
 class Kernel:
@@ -22,6 +101,8 @@ class Kernel:
     def __init__(self, amplitude):
         self._dimensionality = None
         self._amplitude = amplitude
+        # spectra of the kernel for FFT convolution, by input shape
+        self._spectra = {}
 
     def get_amplitude(self):
         return self._amplitude
@@ -33,6 +114,12 @@ class Kernel:
     def get_separated_kernel_parts(self):
         return self._separated_kernel_parts
 
+    def get_separable_components(self):
+        """Returns the kernel as a list of separable components, each of which
+        is a list of kernel parts (one per dimension). The kernel is the sum of
+        its components."""
+        return [[self.get_separated_kernel_part(dimension_index) for dimension_index in range(self._dimensionality)]]
+
     def get_dimension_size(self, dimension_index):
         return self._dimension_sizes[dimension_index]
 
@@ -46,6 +133,59 @@ class Kernel:
         self._amplitude = amplitude
         self._calculate_kernel()
 
+    def get_parameters(self):
+        "Returns the parameters of the kernel as a dictionary (e.g., for checkpoints)."
+        return {"amplitude": self._amplitude}
+
+    def set_parameters(self, parameters):
+        "Sets parameters returned by get_parameters(); the kernel is only recalculated if they differ."
+        if (parameters["amplitude"] != self._amplitude):
+            self.set_amplitude(parameters["amplitude"])
+
+    def get_spectrum(self, input_shape):
+        """Returns the spectrum (as computed by numpy.fft.rfftn) of the kernel,
+        wrapped around the borders of an input of the given shape. Spectra are
+        cached until the kernel changes."""
+        input_shape = tuple(input_shape)
+        if (input_shape not in self._spectra):
+            self._spectra[input_shape] = self._calculate_spectrum(input_shape)
+
+        return self._spectra[input_shape]
+
+    def _calculate_spectrum(self, input_shape):
+        spectrum = 0.
+        for kernel_parts in self.get_separable_components():
+            spectrum = spectrum + self._calculate_component_spectrum(kernel_parts, input_shape)
+
+        return spectrum
+
+    def _calculate_component_spectrum(self, kernel_parts, input_shape):
+        spectrum = numpy.ones([1] * len(input_shape))
+
+        for dimension_index in range(len(kernel_parts)):
+            kernel_part = kernel_parts[dimension_index]
+            dimension_size = input_shape[dimension_index]
+
+            # place the kernel part on a ring of the size of the dimension, with
+            # its center at index zero
+            offsets = numpy.arange(len(kernel_part)) - len(kernel_part) // 2
+            wrapped_kernel_part = numpy.zeros(dimension_size)
+            numpy.add.at(wrapped_kernel_part, offsets % dimension_size, kernel_part)
+
+            if (dimension_index == len(input_shape) - 1):
+                part_spectrum = numpy.fft.rfft(wrapped_kernel_part)
+            else:
+                part_spectrum = numpy.fft.fft(wrapped_kernel_part)
+
+            spectrum_shape = [1] * len(input_shape)
+            spectrum_shape[dimension_index] = len(part_spectrum)
+            spectrum = spectrum * part_spectrum.reshape(spectrum_shape)
+
+        return spectrum
+
+    def _clear_spectra(self):
+        self._spectra = {}
+
     def _check_dimension_index(self, dimension_index):
         if not (dimension_index >= 0 and dimension_index < self._dimensionality):
             print("Error. Kernel only has", self._dimensionality, "dimensions.")
@@ -56,58 +196,106 @@ class Kernel:
 
 
 class GaussKernel(Kernel):
-    "n-dimensional Gauss kernel"
-
-    def __init__(self, amplitude, widths, shifts=None):
-        Kernel.__init__(self, amplitude)
-        self._widths = widths
-        self._shifts = None
-        self._dimensionality = len(self._widths)
+    """n-dimensional Gauss kernel that consists of one or more modes (e.g.,
+    local excitation plus broader inhibition). GaussKernel(amplitude, widths,
+    shifts) creates a kernel with a single mode. GaussKernel(dimensionality)
+    creates a kernel without modes; add modes with add_mode() and call
+    calculate() afterwards. All modes are summed into one kernel, so that a
+    field convolves only once per step. Amplitude, width and shift getters and
+    setters refer to the first mode, unless a mode index is given."""
+
+    def __init__(self, amplitude, widths=None, shifts=None):
+        Kernel.__init__(self, None)
         self._dimension_sizes = None
         self._limit = 0.1
         self._separated_kernel_parts = None
+        self._separable_components = None
+        # each mode is a list [amplitude, widths, shifts]
+        self._modes = []
+
+        if (widths is None):
+            self._dimensionality = amplitude
+        else:
+            self._dimensionality = len(widths)
+            self.add_mode(amplitude, widths, shifts)
+            self.calculate()
+
+    def add_mode(self, amplitude, widths, shifts=None):
+        "Adds a mode to the kernel. Call calculate() after adding all modes."
+        if (len(widths) != self._dimensionality):
+            print("Error. Number of width values does not match the dimensionality of the kernel.")
 
         if (shifts is None):
-            self._shifts = [0.0] * self._dimensionality
+            shifts = [0.0] * self._dimensionality
         else:
-            if (len(self._widths) != len(self._shifts)):
+            if (len(widths) != len(shifts)):
                 print("Error. Number of shift and width values does not match.")
 
-        self._calculate_separated_kernel_parts()
+        self._modes.append([amplitude, widths, shifts])
+
+    def get_number_of_modes(self):
+        return len(self._modes)
+
+    def get_parameters(self):
+        return {"limit": self._limit, "modes": copy.deepcopy(self._modes)}
+
+    def set_parameters(self, parameters):
+        if (parameters["limit"] != self._limit or parameters["modes"] != self._modes):
+            self._limit = parameters["limit"]
+            self._modes = copy.deepcopy(parameters["modes"])
+            self.calculate()
 
-    def get_width(self, dimension_index):
+    def get_amplitude(self, mode_index=0):
+        return self._modes[mode_index][0]
+
+    def set_amplitude(self, amplitude, mode_index=0):
+        self._modes[mode_index][0] = amplitude
+        self.calculate()
+
+    def get_width(self, dimension_index, mode_index=0):
         self._check_dimension_index(dimension_index)
-        return self._widths[dimension_index]
+        return self._modes[mode_index][1][dimension_index]
 
-    def get_widths(self):
-        return self._widths
+    def get_widths(self, mode_index=0):
+        return self._modes[mode_index][1]
 
-    def get_shift(self, dimension_index):
+    def get_shift(self, dimension_index, mode_index=0):
         self._check_dimension_index(dimension_index)
-        return self._shifts[dimension_index]
+        return self._modes[mode_index][2][dimension_index]
 
-    def get_shifts(self):
-        return self._shifts
+    def get_shifts(self, mode_index=0):
+        return self._modes[mode_index][2]
     
-    def set_width(self, width, dimension_index):
+    def set_width(self, width, dimension_index, mode_index=0):
         self._check_dimension_index(dimension_index)
-        self._widths[dimension_index] = width
-        self._calculate_separated_kernel_parts()
+        self._modes[mode_index][1][dimension_index] = width
+        self.calculate()
 
-    def set_shift(self, shift, dimension_index):
+    def set_shift(self, shift, dimension_index, mode_index=0):
         self._check_dimension_index(dimension_index)
-        self._shifts = shifts
-        self._calculate_separated_kernel_parts()
+        self._modes[mode_index][2][dimension_index] = shift
+        self.calculate()
 
-    def _calculate_dimension_size(self, dimension_index):
-        if not (dimension_index >= 0 and dimension_index < self._dimensionality):
-            print("Error. Kernel only supports ", self._dimensionality, " dimensions.")
-        
-        dimension_width = self._widths[dimension_index]
+    def get_separated_kernel_part(self, dimension_index):
+        self._check_dimension_index(dimension_index)
+        self._check_separable()
+        return self._separated_kernel_parts[dimension_index]
 
+    def get_separated_kernel_parts(self):
+        self._check_separable()
+        return self._separated_kernel_parts
+
+    def get_separable_components(self):
+        return self._separable_components
+
+    def _check_separable(self):
+        if (len(self._separable_components) > 1):
+            print("Error. The kernel consists of several modes and is not separable. Use get_separable_components().")
+
+    def _calculate_dimension_size(self, amplitude, dimension_width):
         if (dimension_width < 10000 and dimension_width > 0):
             dimension_size = int(round(math.sqrt(2.0 * math.pow(dimension_width, 2.0) \
-                                 * math.log(math.fabs(self._amplitude) / self._limit))) + 1)
+                                 * math.log(math.fabs(amplitude) / self._limit))) + 1)
         else:
             print("Error. Selected mode with is not in the proper bounds (0 < width < 10000).")
 
@@ -117,35 +305,104 @@ class GaussKernel(Kernel):
         return dimension_size
 
     def _calculate_kernel(self):
-        self._calculate_separated_kernel_parts()
+        self.calculate()
+
+    def calculate(self):
+        "Calculates the kernel from all of its modes."
+        self._clear_spectra()
+
+        # modes with the same widths and shifts only differ in amplitude and
+        # are merged into a single separable component
+        merged_modes = []
+        for amplitude, widths, shifts in self._modes:
+            for merged_mode in merged_modes:
+                if (merged_mode[1] == list(widths) and merged_mode[2] == list(shifts)):
+                    merged_mode[0] += amplitude
+                    break
+            else:
+                merged_modes.append([amplitude, list(widths), list(shifts)])
+
+        separable_components = []
+        for amplitude, widths, shifts in merged_modes:
+            separable_components.append(self._calculate_separated_kernel_parts(amplitude, widths, shifts))
+
+        if (self._dimensionality == 2 and len(separable_components) > 1):
+            separable_components = self._decompose_low_rank(separable_components)
 
-    def _calculate_separated_kernel_parts(self):
         if (self._separated_kernel_parts is not None):
             del(self._separated_kernel_parts[:])
         else:
             self._separated_kernel_parts = []
+        self._separated_kernel_parts.extend(separable_components[0])
+        self._separable_components = separable_components
+
+    def _calculate_separated_kernel_parts(self, amplitude, widths, shifts):
+        separated_kernel_parts = []
 
         for dimension_index in range(self._dimensionality):
-            dimension_size = self._calculate_dimension_size(dimension_index)
+            # multiply the first kernel part with the amplitude.
+            # when convolving with all separated kernel parts, this will lead
+            # to the correct amplitude value for the "whole kernel"
+            scaled = (dimension_index == 0)
+            separated_kernel_parts.append(self._get_kernel_part(amplitude,
+                                                                widths[dimension_index],
+                                                                shifts[dimension_index],
+                                                                scaled))
 
-            center = (dimension_size / 2.0) + self._shifts[dimension_index]
+        return separated_kernel_parts
 
-            kernel_part = numpy.zeros(shape=dimension_size)
-            ramp = numpy.linspace(0, dimension_size, dimension_size) 
-            for i in range(dimension_size):
-                kernel_part[i] = math.exp(-math.pow(ramp[i] - center, 2.0) / \
-                                         (2.0 * math.pow(self._widths[dimension_index], 2.0)))
+    def _get_kernel_part(self, amplitude, width, shift, scaled):
+        """Returns a kernel part from the process-wide cache, which is shared by
+        all kernels with the same parameters (and is therefore read-only)."""
+        key = (amplitude, width, shift, self._limit, scaled)
 
-            # normalize kernel part
-            kernel_part *= 1.0 / kernel_part.sum()
+        kernel_part = _kernel_part_cache.pop(key, None)
+        if (kernel_part is None):
+            kernel_part = self._calculate_kernel_part(amplitude, width, shift, scaled)
+            kernel_part.flags.writeable = False
+            if (len(_kernel_part_cache) >= KERNEL_PART_CACHE_SIZE):
+                _kernel_part_cache.popitem(last=False)
+        _kernel_part_cache[key] = kernel_part
 
-            # multiply the first kernel part with the amplitude.
-            # when convolving with all separated kernel parts, this will lead
-            # to the correct amplitude value for the "whole kernel"
-            if (dimension_index == 0):
-                kernel_part *= self._amplitude
+        return kernel_part
+
+    def _calculate_kernel_part(self, amplitude, width, shift, scaled):
+        dimension_size = self._calculate_dimension_size(amplitude, width)
+
+        center = (dimension_size / 2.0) + shift
+
+        ramp = numpy.linspace(0, dimension_size, dimension_size) 
+        kernel_part = numpy.exp(-numpy.square(ramp - center) / (2.0 * math.pow(width, 2.0)))
+
+        # normalize kernel part
+        kernel_part *= 1.0 / kernel_part.sum()
+
+        if (scaled):
+            kernel_part *= amplitude
+
+        return kernel_part
+
+    def _decompose_low_rank(self, separable_components):
+        """Decomposes the summed two-dimensional kernel into as few separable
+        components as possible (singular value decomposition). Returns the
+        given components if the decomposition does not need fewer."""
+        sizes = [max([len(kernel_parts[i]) for kernel_parts in separable_components]) for i in range(2)]
+
+        summed_kernel = numpy.zeros(sizes)
+        for kernel_parts in separable_components:
+            padded_parts = []
+            for i in range(2):
+                padding = (sizes[i] - len(kernel_parts[i])) // 2
+                padded_parts.append(numpy.concatenate((numpy.zeros(padding), kernel_parts[i], numpy.zeros(padding))))
+            summed_kernel += numpy.outer(padded_parts[0], padded_parts[1])
+
+        u, singular_values, v = numpy.linalg.svd(summed_kernel)
+        rank = int((singular_values > LOW_RANK_TOLERANCE * singular_values[0]).sum())
+
+        if (rank >= len(separable_components)):
+            return separable_components
 
-            self._separated_kernel_parts.append(kernel_part)
+        return [[u[:, i] * singular_values[i], v[i]] for i in range(rank)]
 
 class BoxKernel(Kernel):
     "n-dimensional box kernel"
@@ -159,4 +416,5 @@ class BoxKernel(Kernel):
         return self._kernel
         
     def _calculate_kernel(self):
+        self._clear_spectra()
         self._kernel = numpy.ones(shape=(1)) * self._amplitude
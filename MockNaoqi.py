@@ -0,0 +1,296 @@
+import sys
+import time
+import random
+import threading
+import multiprocessing
+import xmlrpclib
+import SocketServer
+import SimpleXMLRPCServer
+import numpy
+import FrameGrabber
+import MotionIO
+
+class MockMotion:
+    """Stand-in for the methods of ALMotion that the architecture uses. Joint
+    angles and effector positions simply follow the commanded changes."""
+
+    def __init__(self):
+        self._angles = {"RHand": 0.5, "LHand": 0.5}
+        self._positions = {"CameraBottom": [0.05, 0.0, 0.45, 0.0, 0.5, 0.0],
+                           "RArm": [0.15, -0.1, 0.35, 1.57, 0.0, 0.0],
+                           "LArm": [0.15, 0.1, 0.35, -1.57, 0.0, 0.0]}
+        self._stiffnesses = {}
+        self._lock = threading.Lock()
+
+    def getAngles(self, names, use_sensors):
+        if (not isinstance(names, list)):
+            names = [names]
+
+        self._lock.acquire()
+        angles = [self._angles.get(name, 0.0) for name in names]
+        self._lock.release()
+
+        return angles
+
+    def changeAngles(self, names, changes, speed_fraction):
+        if (not isinstance(names, list)):
+            names = [names]
+            changes = [changes]
+
+        self._lock.acquire()
+        for name, change in zip(names, changes):
+            self._angles[name] = self._angles.get(name, 0.0) + change
+        self._lock.release()
+
+    def getPosition(self, name, space, use_sensors):
+        self._lock.acquire()
+        position = list(self._positions.get(name, [0.0] * 6))
+        self._lock.release()
+
+        return position
+
+    def changePosition(self, name, space, change, speed_fraction, axis_mask):
+        self._lock.acquire()
+        position = self._positions.get(name, [0.0] * 6)
+        self._positions[name] = [value + value_change for value, value_change in zip(position, change)]
+        self._lock.release()
+
+    def setStiffnesses(self, names, stiffnesses):
+        self._lock.acquire()
+        self._stiffnesses[str(names)] = stiffnesses
+        self._lock.release()
+
+
+class _ThreadingXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer.SimpleXMLRPCServer):
+    daemon_threads = True
+    # every call opens a connection, many of them at the same time
+    request_queue_size = 64
+
+
+class MockNaoqiServer:
+    """Local server that mimics the ALMotion and ALVideoDevice methods the
+    architecture uses (see MockMotion and FrameGrabber.RecordedVideoDevice),
+    so that the robot I/O can be benchmarked without a NAO. Every call is
+    answered after latency seconds plus normally distributed jitter (with
+    the given standard deviation, in seconds). Calls are served
+    concurrently. If no frames are given, the video device serves random
+    frames. Use MockALProxy to connect to it; e.g., a GraspArchitecture runs
+    on a motion I/O with the proxy of ALMotion and on the proxy of
+    ALVideoDevice as its video_proxy."""
+
+    def __init__(self, host="localhost", port=0, latency=0.0, jitter=0.0, frames=None, frame_rate=30.0, seed=None):
+        if (frames is None):
+            frames = numpy.random.RandomState(seed).randint(0, 256, (10, 160 * 120 * 3))
+
+        self._latency = latency
+        self._jitter = jitter
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._modules = {"ALMotion": MockMotion(),
+                         "ALVideoDevice": FrameGrabber.RecordedVideoDevice(frames, frame_rate=frame_rate)}
+        self._number_of_calls = 0
+
+        self._server = _ThreadingXMLRPCServer((host, port), logRequests=False, allow_none=True)
+        self._server.register_instance(self)
+        self._thread = None
+
+    def get_host(self):
+        return self._server.server_address[0]
+
+    def get_port(self):
+        return self._server.server_address[1]
+
+    def get_module(self, module_name):
+        return self._modules[module_name]
+
+    def get_number_of_calls(self):
+        return self._number_of_calls
+
+    def set_latency(self, latency, jitter=0.0):
+        self._latency = latency
+        self._jitter = jitter
+
+    def start(self):
+        "Serves calls in a background thread."
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock naoqi server")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if (self._thread is not None):
+            self._thread.join()
+
+    def _dispatch(self, method, arguments):
+        module_name, method_name = method.split(".", 1)
+        if (module_name not in self._modules or method_name.startswith("_")):
+            raise AttributeError("Unknown method " + method + ".")
+
+        self._random_lock.acquire()
+        delay = self._latency + self._random.gauss(0.0, self._jitter)
+        self._number_of_calls += 1
+        self._random_lock.release()
+        if (delay > 0.):
+            time.sleep(delay)
+
+        result = getattr(self._modules[module_name], method_name)(*arguments)
+        return _to_xmlrpc(result)
+
+
+class MockALProxy:
+    """Client of a MockNaoqiServer with the interface of ALProxy: calls of
+    module methods are forwarded to the server, and calls through post are
+    sent in a separate thread without waiting for the answer. Each thread
+    uses its own connection, so the proxy can be called concurrently."""
+
+    def __init__(self, module_name, host, port):
+        self._module_name = module_name
+        self._url = "http://" + host + ":" + str(port)
+        self._local = threading.local()
+        self.post = _PostProxy(self)
+
+    def __getattr__(self, method_name):
+        if (method_name.startswith("_")):
+            raise AttributeError(method_name)
+
+        def call(*arguments):
+            return self._call(method_name, arguments)
+
+        return call
+
+    def _call(self, method_name, arguments):
+        server_proxy = getattr(self._local, "server_proxy", None)
+        if (server_proxy is None):
+            server_proxy = xmlrpclib.ServerProxy(self._url, allow_none=True)
+            self._local.server_proxy = server_proxy
+
+        result = getattr(server_proxy, self._module_name + "." + method_name)(*_to_plain(arguments))
+        return _from_xmlrpc(result)
+
+
+class _PostProxy:
+    def __init__(self, proxy):
+        self._proxy = proxy
+
+    def __getattr__(self, method_name):
+        if (method_name.startswith("_")):
+            raise AttributeError(method_name)
+
+        def post(*arguments):
+            thread = threading.Thread(target=self._proxy._call, args=(method_name, arguments))
+            thread.daemon = True
+            thread.start()
+
+        return post
+
+
+def _to_plain(value):
+    "Converts numpy scalars and arrays (e.g., the commands of the architecture) into plain values."
+    if (isinstance(value, (list, tuple))):
+        return [_to_plain(element) for element in value]
+    if (isinstance(value, (numpy.generic, numpy.ndarray))):
+        return value.tolist()
+
+    return value
+
+def _to_xmlrpc(value):
+    "Wraps byte strings (e.g., the pixels of an image) so that they are sent as binary data."
+    if (isinstance(value, (list, tuple))):
+        return [_to_xmlrpc(element) for element in value]
+    if (isinstance(value, str)):
+        return xmlrpclib.Binary(value)
+
+    return value
+
+def _from_xmlrpc(value):
+    if (isinstance(value, list)):
+        return [_from_xmlrpc(element) for element in value]
+    if (isinstance(value, xmlrpclib.Binary)):
+        return value.data
+
+    return value
+
+
+def benchmark_motion_io(motion_io, number_of_ticks=100, computation_time=0.01):
+    """Runs ticks with the reads and commands of the grasp architecture
+    (head and gripper sensors, gripper, head and end effector control) and
+    computation_time seconds of computation in each, and returns the mean
+    duration of a tick."""
+    motion_io.register_angle("RHand", True)
+    motion_io.register_angle("LHand", True)
+    motion_io.register_position("CameraBottom", 2, True)
+    motion_io.register_position("RArm", 2, True)
+    motion_io.register_position("LArm", 2, True)
+
+    start_time = time.time()
+    for i in range(number_of_ticks):
+        motion_io.begin_tick()
+
+        # the computation of the fields that do not depend on the robot
+        time.sleep(computation_time / 2.)
+
+        camera_position = motion_io.get_position("CameraBottom", 2, True)
+        right_hand = motion_io.get_angle("RHand", True)
+        left_hand = motion_io.get_angle("LHand", True)
+        right_arm = motion_io.get_position("RArm", 2, True)
+        left_arm = motion_io.get_position("LArm", 2, True)
+
+        time.sleep(computation_time / 2.)
+
+        motion_io.change_angle("HeadYaw", 0.001 * camera_position[5], 0.01)
+        motion_io.change_angle("HeadPitch", 0.001 * camera_position[4], 0.01)
+        motion_io.change_angle("RHand", 0.001 * (0.5 - right_hand), 1.0)
+        motion_io.change_angle("LHand", 0.001 * (0.5 - left_hand), 1.0)
+        motion_io.change_position("RArm", 2, [0.001 * (0.15 - right_arm[0]), 0.0, 0.0, 0.0, 0.0, 0.0], 0.02, 15)
+        motion_io.change_position("LArm", 2, [0.001 * (0.15 - left_arm[0]), 0.0, 0.0, 0.0, 0.0, 0.0], 0.02, 15)
+
+        motion_io.end_tick()
+
+    if (isinstance(motion_io, MotionIO.ConcurrentMotionIO)):
+        motion_io.wait_for_commands()
+
+    return (time.time() - start_time) / number_of_ticks
+
+
+def _serve(latency, jitter, port_queue):
+    server = MockNaoqiServer(latency=latency, jitter=jitter, seed=0)
+    port_queue.put(server.get_port())
+    server._server.serve_forever()
+
+def main():
+    latency = 0.005
+    jitter = 0.001
+    if (len(sys.argv) > 1):
+        latency = float(sys.argv[1])
+    if (len(sys.argv) > 2):
+        jitter = float(sys.argv[2])
+
+    # the server runs in its own process, like the robot
+    port_queue = multiprocessing.Queue()
+    server_process = multiprocessing.Process(target=_serve, args=(latency, jitter, port_queue))
+    server_process.daemon = True
+    server_process.start()
+    port = port_queue.get()
+
+    def create_proxy():
+        return MockALProxy("ALMotion", "localhost", port)
+
+    motion_ios = [("sequential", MotionIO.MotionIO(create_proxy())),
+                  ("concurrent", MotionIO.ConcurrentMotionIO(create_proxy())),
+                  ("concurrent, prefetch", MotionIO.ConcurrentMotionIO(create_proxy(), prefetch=True))]
+
+    print("latency " + str(latency) + " s, jitter " + str(jitter) + " s")
+    for name, motion_io in motion_ios:
+        tick_duration = benchmark_motion_io(motion_io)
+        print(name + ": " + str(round(tick_duration * 1000., 2)) + " ms per tick, " +
+              str(motion_io.get_number_of_calls()) + " calls")
+        if (isinstance(motion_io, MotionIO.ConcurrentMotionIO)):
+            motion_io.close()
+
+    server_process.terminate()
+    server_process.join()
+
+
+if __name__ == "__main__":
+    main()
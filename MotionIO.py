@@ -0,0 +1,289 @@
+import multiprocessing.pool
+
+# address of the robot
+NAO_HOST = "nao.ini.rub.de"
+NAO_PORT = 9559
+
+class MotionIO:
+    """Shared access to ALMotion for all modules of an architecture (one
+    connection instead of one proxy per module).
+
+    Between begin_tick() and end_tick(), sensor values are read once and
+    cached: the joint angles and effector positions the modules registered
+    are fetched in begin_tick() (all joint angles in a single getAngles()
+    call), and everything else is fetched on first use. Commands are
+    collected and sent in end_tick(): changes of the same joint (or
+    effector) are added up, and all joints that are moved with the same
+    speed are moved with a single changeAngles() call. Outside of a tick,
+    reads and commands go to the robot right away, as before.
+
+    With post_commands, commands are sent with post (the call returns
+    without waiting for the answer of the robot)."""
+
+    def __init__(self, motion_proxy=None, post_commands=False):
+        if (motion_proxy is None):
+            # the NAOqi SDK is only needed to talk to a real robot (not, e.g.,
+            # to a MockNaoqi.MockNaoqiServer)
+            from naoqi import ALProxy
+            motion_proxy = ALProxy("ALMotion", NAO_HOST, NAO_PORT)
+
+        self._motion_proxy = motion_proxy
+        self._post_commands = post_commands
+
+        # registered reads: joint names by use_sensors, (effector, space, use_sensors) tuples
+        self._registered_angles = {}
+        self._registered_positions = []
+
+        self._in_tick = False
+        self._angles = {}
+        self._positions = {}
+        # commands of the current tick
+        self._joint_names = {}
+        self._joint_changes = {}
+        self._effector_keys = []
+        self._effector_changes = {}
+
+        self._number_of_calls = 0
+
+    def get_motion_proxy(self):
+        return self._motion_proxy
+
+    def get_number_of_calls(self):
+        "Returns the number of remote calls (reads and commands) made so far."
+        return self._number_of_calls
+
+    def is_in_tick(self):
+        return self._in_tick
+
+    def register_angle(self, name, use_sensors):
+        "Registers a joint whose angle is read in every tick."
+        names = self._registered_angles.setdefault(use_sensors, [])
+        if (name not in names):
+            names.append(name)
+
+    def register_position(self, name, space, use_sensors):
+        "Registers an effector (or camera) whose position is read in every tick."
+        key = (name, space, use_sensors)
+        if (key not in self._registered_positions):
+            self._registered_positions.append(key)
+
+    def begin_tick(self):
+        "Reads all registered sensor values; they are used until end_tick()."
+        reads = self._get_registered_reads()
+        results = [self._call(method, *arguments) for method, arguments in reads]
+        self._start_tick(reads, results)
+
+    def end_tick(self):
+        "Sends the commands of the tick and forgets the sensor values."
+        for method, arguments in self._end_tick():
+            self._command(method, *arguments)
+
+    def _get_registered_reads(self):
+        "Returns the remote calls (method and arguments) that read the registered sensor values."
+        reads = []
+        for use_sensors, names in self._registered_angles.items():
+            reads.append(("getAngles", (list(names), use_sensors)))
+        for key in self._registered_positions:
+            reads.append(("getPosition", key))
+
+        return reads
+
+    def _start_tick(self, reads, results):
+        "Caches the results of the registered reads and opens the tick."
+        self._angles = {}
+        self._positions = {}
+        for (method, arguments), result in zip(reads, results):
+            if (method == "getAngles"):
+                names, use_sensors = arguments
+                for name, angle in zip(names, result):
+                    self._angles[(name, use_sensors)] = angle
+            else:
+                self._positions[arguments] = result
+
+        self._in_tick = True
+
+    def _end_tick(self):
+        """Closes the tick and returns the remote calls (method and arguments)
+        that send the collected commands."""
+        self._in_tick = False
+        self._angles = {}
+        self._positions = {}
+
+        commands = []
+        for speed_fraction, names in self._joint_names.items():
+            changes = [self._joint_changes[(name, speed_fraction)] for name in names]
+            commands.append(("changeAngles", (names, changes, speed_fraction)))
+
+        for key in self._effector_keys:
+            name, space, speed_fraction, axis_mask = key
+            commands.append(("changePosition", (name, space, self._effector_changes[key], speed_fraction, axis_mask)))
+
+        self._joint_names = {}
+        self._joint_changes = {}
+        self._effector_keys = []
+        self._effector_changes = {}
+
+        return commands
+
+    def get_angle(self, name, use_sensors):
+        "Returns the angle of the joint (read once per tick)."
+        key = (name, use_sensors)
+        if (not self._in_tick):
+            return self._call("getAngles", name, use_sensors)[0]
+
+        if (key not in self._angles):
+            self._angles[key] = self._call("getAngles", name, use_sensors)[0]
+
+        return self._angles[key]
+
+    def get_position(self, name, space, use_sensors):
+        "Returns the position of the effector (read once per tick)."
+        key = (name, space, use_sensors)
+        if (not self._in_tick):
+            return self._call("getPosition", name, space, use_sensors)
+
+        if (key not in self._positions):
+            self._positions[key] = self._call("getPosition", name, space, use_sensors)
+
+        return self._positions[key]
+
+    def change_angle(self, name, change, speed_fraction):
+        "Changes the angle of the joint (at the end of the tick)."
+        if (not self._in_tick):
+            self._command("changeAngles", name, change, speed_fraction)
+            return
+
+        key = (name, speed_fraction)
+        if (key in self._joint_changes):
+            self._joint_changes[key] += change
+        else:
+            self._joint_names.setdefault(speed_fraction, []).append(name)
+            self._joint_changes[key] = change
+
+    def change_position(self, name, space, change, speed_fraction, axis_mask):
+        "Changes the position of the effector (at the end of the tick)."
+        if (not self._in_tick):
+            self._command("changePosition", name, space, change, speed_fraction, axis_mask)
+            return
+
+        key = (name, space, speed_fraction, axis_mask)
+        if (key in self._effector_changes):
+            self._effector_changes[key] = [value + other_value for value, other_value in zip(self._effector_changes[key], change)]
+        else:
+            self._effector_keys.append(key)
+            self._effector_changes[key] = list(change)
+
+    def _call(self, method, *arguments):
+        self._number_of_calls += 1
+        return getattr(self._motion_proxy, method)(*arguments)
+
+    def _command(self, method, *arguments):
+        self._number_of_calls += 1
+        if (self._post_commands):
+            getattr(self._motion_proxy.post, method)(*arguments)
+        else:
+            getattr(self._motion_proxy, method)(*arguments)
+
+
+class ConcurrentMotionIO(MotionIO):
+    """Motion I/O that overlaps the remote calls with the computation of the
+    architecture. The reads of a tick are issued concurrently on a pool of
+    number_of_threads threads; begin_tick() returns right away and the first
+    module that needs a sensor value waits for them. The commands of a tick
+    are sent concurrently without waiting for the robot; the commands of the
+    next tick wait until they are done, so the commands of each joint still
+    arrive in order. With prefetch, the reads for the next tick are issued
+    together with the commands at the end of a tick (the sensor values may
+    then not yet reflect these commands). The motion proxy has to allow
+    concurrent calls."""
+
+    def __init__(self, motion_proxy=None, number_of_threads=8, prefetch=False):
+        MotionIO.__init__(self, motion_proxy)
+        self._prefetch = prefetch
+        self._pool = multiprocessing.pool.ThreadPool(number_of_threads)
+        # reads that are in flight (with their result) and commands that are in flight
+        self._pending_reads = None
+        self._pending_read_result = None
+        self._pending_command_results = []
+
+    def begin_tick(self):
+        # reads that were prefetched at the end of the last tick are used
+        reads = self._get_registered_reads()
+        if (not self._prefetch or self._pending_reads != reads):
+            self._issue_reads(reads)
+
+        self._angles = {}
+        self._positions = {}
+        self._in_tick = True
+
+    def end_tick(self):
+        commands = self._end_tick()
+        self.wait_for_commands()
+
+        self._number_of_calls += len(commands)
+        self._pending_command_results = [self._pool.apply_async(self._invoke, (command,)) for command in commands]
+
+        if (self._prefetch):
+            self._issue_reads(self._get_registered_reads())
+
+    def wait_for_commands(self):
+        "Waits until the commands that were sent are done (raises the errors of failed commands)."
+        command_results = self._pending_command_results
+        self._pending_command_results = []
+        for command_result in command_results:
+            command_result.get()
+
+    def close(self):
+        "Waits for all remote calls and stops the threads."
+        self.wait_for_commands()
+        if (self._pending_read_result is not None):
+            self._pending_read_result.wait()
+        self._pool.close()
+        self._pool.join()
+
+    def get_angle(self, name, use_sensors):
+        self._receive_reads()
+        return MotionIO.get_angle(self, name, use_sensors)
+
+    def get_position(self, name, space, use_sensors):
+        self._receive_reads()
+        return MotionIO.get_position(self, name, space, use_sensors)
+
+    def _issue_reads(self, reads):
+        if (self._pending_read_result is not None):
+            self._pending_read_result.wait()
+
+        self._number_of_calls += len(reads)
+        self._pending_reads = reads
+        self._pending_read_result = self._pool.map_async(self._invoke, reads)
+
+    def _receive_reads(self):
+        if (not self._in_tick or self._pending_read_result is None):
+            return
+
+        results = self._pending_read_result.get()
+        reads = self._pending_reads
+        self._pending_reads = None
+        self._pending_read_result = None
+        self._start_tick(reads, results)
+
+    def _invoke(self, call):
+        method, arguments = call
+        return getattr(self._motion_proxy, method)(*arguments)
+
+
+# motion I/O that is used by default (one connection for all modules)
+_default_motion_io = None
+
+def get_default_motion_io():
+    "Returns the default motion I/O (created on first use)."
+    global _default_motion_io
+    if (_default_motion_io is None):
+        _default_motion_io = MotionIO()
+
+    return _default_motion_io
+
+def set_default_motion_io(motion_io):
+    "Sets the motion I/O that is used by modules created without one (e.g., a ConcurrentMotionIO)."
+    global _default_motion_io
+    _default_motion_io = motion_io
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import signal
+import itertools
+import multiprocessing
+import DynamicField
+import math_tools
+import BehavioralOrganization as BehOrg
+import ActivationRecorder
+
+# parameters of the competition experiment and their default values
+COMPETITION_EXPERIMENT_PARAMETERS = {"field_size": 40,
+                                     "int_inhibition_weight": -6.0,
+                                     "cos_node_to_cos_memory_node_weight": 2.5,
+                                     "intention_node_kernel_amplitude": 2.5,
+                                     "cos_memory_node_kernel_amplitude": 4.5,
+                                     "field_kernel_amplitude": 5.0,
+                                     "field_global_inhibition": 100.0,
+                                     "competition_kernel_amplitude": 1.5}
+
+class JobTimeout(Exception):
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+def parameter_grid(parameter_values):
+    """Returns one dictionary of parameters for every combination of the given
+    values (a dictionary that maps each parameter name to a list of values)."""
+    names = sorted(parameter_values.keys())
+    parameter_sets = []
+    for values in itertools.product(*[parameter_values[name] for name in names]):
+        parameter_sets.append(dict(zip(names, values)))
+
+    return parameter_sets
+
+def get_job_key(parameters):
+    "Returns a string that identifies the job with the given parameters in the results file."
+    return json.dumps(parameters, sort_keys=True)
+
+
+class ParameterSweep:
+    """Runs an experiment once for every set of parameters in a pool of worker
+    processes. The experiment is a function experiment(parameters,
+    number_of_steps) that builds its own (headless) architecture, steps it,
+    and returns a compact summary that can be stored as JSON. It has to be
+    defined at module level, so that it can be sent to the workers.
+
+    The jobs are handed to the workers in chunks of chunk_size jobs. Each job
+    may take at most timeout seconds; a job that takes longer is stopped and
+    recorded with the status "timeout" (failing jobs get the status "error").
+    As soon as a chunk is done, its results are appended to the results file
+    (one JSON object per line). Jobs that already have a finished result in
+    the results file are not run again, so an interrupted sweep continues
+    where it stopped.
+
+    Each worker records the activations of its fields into its own directory
+    below recording_directory."""
+
+    def __init__(self,
+                 experiment,
+                 results_file_name,
+                 number_of_steps=1000,
+                 number_of_processes=None,
+                 chunk_size=1,
+                 timeout=None,
+                 recording_directory="logs/sweep"):
+        self._experiment = experiment
+        self._results_file_name = results_file_name
+        self._number_of_steps = number_of_steps
+        self._number_of_processes = number_of_processes
+        self._chunk_size = chunk_size
+        self._timeout = timeout
+        self._recording_directory = recording_directory
+
+    def get_results_file_name(self):
+        return self._results_file_name
+
+    def load_results(self):
+        "Returns the results in the results file by their job key (later results replace earlier ones)."
+        results = {}
+        if (not os.path.isfile(self._results_file_name)):
+            return results
+
+        results_file = open(self._results_file_name, 'r')
+        for line in results_file:
+            # the last line may be incomplete if the sweep was interrupted
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            results[get_job_key(result["parameters"])] = result
+        results_file.close()
+
+        return results
+
+    def run(self, parameter_sets):
+        """Runs the experiment for all parameter sets that do not have a finished
+        result yet and returns the results of all parameter sets (in their order)."""
+        results = self.load_results()
+
+        pending_parameter_sets = []
+        pending_keys = set()
+        for parameters in parameter_sets:
+            key = get_job_key(parameters)
+            if (key in pending_keys or (key in results and results[key]["status"] == "done")):
+                continue
+            pending_parameter_sets.append(parameters)
+            pending_keys.add(key)
+
+        chunks = []
+        for i in range(0, len(pending_parameter_sets), self._chunk_size):
+            chunks.append((self._experiment,
+                           pending_parameter_sets[i:i + self._chunk_size],
+                           self._number_of_steps,
+                           self._timeout))
+
+        if (len(chunks) > 0):
+            results_directory = os.path.dirname(self._results_file_name)
+            if (results_directory != "" and not os.path.isdir(results_directory)):
+                os.makedirs(results_directory)
+
+            pool = multiprocessing.Pool(self._number_of_processes,
+                                        initializer=_initialize_worker,
+                                        initargs=(self._recording_directory,))
+            results_file = open(self._results_file_name, 'a')
+            try:
+                # store the results of each chunk as soon as it is done
+                for chunk_results in pool.imap_unordered(_run_chunk, chunks):
+                    for result in chunk_results:
+                        results_file.write(json.dumps(result, sort_keys=True) + "\n")
+                        results[get_job_key(result["parameters"])] = result
+                    results_file.flush()
+                pool.close()
+            finally:
+                results_file.close()
+                pool.terminate()
+                pool.join()
+
+        return [results.get(get_job_key(parameters)) for parameters in parameter_sets]
+
+
+def _initialize_worker(recording_directory):
+    # the workers must not share the recording of the default recorder
+    directory = os.path.join(recording_directory, str(os.getpid()))
+    ActivationRecorder.set_default_recorder(ActivationRecorder.ActivationRecorder(directory))
+
+def _raise_job_timeout(signal_number, frame):
+    raise JobTimeout("The job exceeded its time limit.")
+
+def _run_chunk(arguments):
+    experiment, parameter_sets, number_of_steps, timeout = arguments
+
+    results = []
+    for parameters in parameter_sets:
+        result = {"parameters": parameters, "status": "done", "summary": None}
+        start_time = time.time()
+
+        if (timeout is not None):
+            signal.signal(signal.SIGALRM, _raise_job_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            result["summary"] = experiment(parameters, number_of_steps)
+        except JobTimeout:
+            result["status"] = "timeout"
+        except Exception as exception:
+            result["status"] = "error"
+            result["error"] = str(exception)
+        finally:
+            if (timeout is not None):
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+        result["duration"] = time.time() - start_time
+        results.append(result)
+
+    return results
+
+
+def competition_experiment(parameters, number_of_steps):
+    """Two elementary behaviors that compete for activation under a common task
+    node (as in time_courses.py), set up with the given parameters (see
+    COMPETITION_EXPERIMENT_PARAMETERS for their names and default values).
+    Returns the steps at which the nodes crossed the output threshold and the
+    final activations of the nodes and fields."""
+    values = dict(COMPETITION_EXPERIMENT_PARAMETERS)
+    values.update(parameters)
+
+    field_size = values["field_size"]
+    task_node = DynamicField.DynamicField([], [], None, name="task node")
+
+    behaviors = []
+    for i in range(2):
+        shifts = [field_size / 4, field_size / 4]
+        if (i == 1):
+            shifts = [field_size / 2, field_size * 5 / 8]
+        int_weight = math_tools.gauss_2d([field_size, field_size], amplitude=10, sigmas=[5.0, 5.0], shifts=shifts)
+
+        behavior = BehOrg.ElementaryBehavior.with_internal_fields(field_dimensionality=2,
+                                                                  field_sizes=[[field_size], [field_size]],
+                                                                  field_resolutions=[],
+                                                                  int_node_to_int_field_weight=int_weight,
+                                                                  int_node_to_cos_node_weight=2.0,
+                                                                  int_field_to_cos_field_weight=3.5,
+                                                                  cos_field_to_cos_node_weight=3.0,
+                                                                  cos_node_to_cos_memory_node_weight=values["cos_node_to_cos_memory_node_weight"],
+                                                                  int_inhibition_weight=values["int_inhibition_weight"],
+                                                                  reactivating=False,
+                                                                  name="eb" + str(i))
+
+        # the kernels are created by the elementary behavior
+        for node, amplitude in ((behavior.get_intention_node(), values["intention_node_kernel_amplitude"]),
+                                (behavior.get_cos_memory_node(), values["cos_memory_node_kernel_amplitude"])):
+            kernel = node.get_lateral_interaction_kernel(0)
+            kernel.set_amplitude(amplitude)
+            node.set_lateral_interaction_kernel(kernel, 0)
+
+        for field in (behavior.get_intention_field(), behavior.get_cos_field()):
+            kernel = field.get_lateral_interaction_kernel(0)
+            kernel.set_amplitude(values["field_kernel_amplitude"])
+            field.set_lateral_interaction_kernel(kernel, 0)
+            field.set_global_inhibition(values["field_global_inhibition"])
+
+        BehOrg.connect_to_task(task_node, behavior)
+        behaviors.append(behavior)
+
+    competition_nodes = BehOrg.competition(behaviors[0], behaviors[1], task_node, bidirectional=True)
+    for node in competition_nodes:
+        kernel = node.get_lateral_interaction_kernel(0)
+        kernel.set_amplitude(values["competition_kernel_amplitude"])
+        node.set_lateral_interaction_kernel(kernel, 0)
+
+    nodes = {"task node": task_node,
+             "competition node 01": competition_nodes[0],
+             "competition node 10": competition_nodes[1]}
+    fields = {}
+    for behavior in behaviors:
+        nodes[behavior.get_intention_node().get_name()] = behavior.get_intention_node()
+        nodes[behavior.get_cos_node().get_name()] = behavior.get_cos_node()
+        nodes[behavior.get_cos_memory_node().get_name()] = behavior.get_cos_memory_node()
+        fields[behavior.get_intention_field().get_name()] = behavior.get_intention_field()
+        fields[behavior.get_cos_field().get_name()] = behavior.get_cos_field()
+
+    connectables = [task_node]
+    connectables.extend(behaviors[0].get_connectables())
+    connectables.extend(competition_nodes)
+    connectables.extend(behaviors[1].get_connectables())
+
+    # the summary is computed here, nothing has to be recorded
+    for connectable in connectables:
+        connectable.stop_activation_log()
+
+    # the nodes are stepped one after another, as in time_courses.py (a node
+    # bank would update them at once and change the course of the competition)
+    step_schedule = DynamicField.StepSchedule(connectables)
+
+    # same stimulation as in time_courses.py, relative to 1000 steps
+    def step_index(index):
+        return index * number_of_steps / 1000
+
+    crossings = {}
+    above_threshold = {}
+    for name in nodes:
+        crossings[name] = []
+        above_threshold[name] = False
+
+    for i in range(number_of_steps):
+        if (i == step_index(2)):
+            task_node.set_boost(10)
+        if (i == step_index(201)):
+            behaviors[0].get_cos_field().set_boost(2.5)
+        if (i == step_index(351)):
+            behaviors[0].get_cos_field().set_boost(0.0)
+        if (i == step_index(551)):
+            behaviors[1].get_cos_field().set_boost(2.5)
+        if (i == step_index(651)):
+            behaviors[1].get_cos_field().set_boost(0.0)
+
+        step_schedule.step()
+
+        for name, node in nodes.items():
+            above = bool(node.get_output().max() > 0.5)
+            if (above != above_threshold[name]):
+                crossings[name].append([i, 1 if above else -1])
+                above_threshold[name] = above
+
+    final_node_activations = {}
+    for name, node in nodes.items():
+        final_node_activations[name] = float(node.get_activation().max())
+
+    final_field_activations = {}
+    for name, field in fields.items():
+        final_field_activations[name] = float(field.get_activation().max())
+
+    return {"crossings": crossings,
+            "final_node_activations": final_node_activations,
+            "final_field_activations": final_field_activations}
+
+
+def main():
+    parameter_sets = parameter_grid({"int_inhibition_weight": [-4.0, -6.0, -8.0],
+                                     "cos_node_to_cos_memory_node_weight": [2.0, 2.5, 3.0],
+                                     "field_global_inhibition": [50.0, 100.0]})
+
+    sweep = ParameterSweep(competition_experiment,
+                           "logs/sweep/competition.json",
+                           number_of_steps=1000,
+                           chunk_size=2,
+                           timeout=600)
+    results = sweep.run(parameter_sets)
+
+    for result in results:
+        print(result["status"] + "\t" + get_job_key(result["parameters"]))
+
+
+if __name__ == "__main__":
+    main()
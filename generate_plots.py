@@ -5,39 +5,26 @@ from enthought.mayavi import mlab
 from mpl_toolkits.axes_grid import ImageGrid
 from mpl_toolkits.axes_grid import make_axes_locatable
 import plot_settings
+import ActivationRecorder
 
 from matplotlib import cm
 
 def main():
 
-    fc_int_file = open("snapshots/find_color_intention_field.txt", 'r')
-    fc_int_field = numpy.fromfile(fc_int_file, sep=', ')
-    fc_cos_file = open("snapshots/find_color_cos_field.txt", 'r')
-    fc_cos_field = numpy.fromfile(fc_cos_file, sep=', ')
-
-    mee_int_file = open("snapshots/move_ee_intention_field.txt", 'r')
-    mee_int_field = numpy.fromfile(mee_int_file, sep=', ')
-    mee_int_field = mee_int_field.reshape(50,50)
-    mee_cos_file = open("snapshots/move_ee_cos_field.txt", 'r')
-    mee_cos_field = numpy.fromfile(mee_cos_file, sep=', ')
-    mee_cos_field = mee_cos_field.reshape(50,50)
-
-    gr_int_file = open("snapshots/gripper_intention_field.txt", 'r')
-    gr_int_field = numpy.fromfile(gr_int_file, sep=', ')
-    gr_cos_file = open("snapshots/gripper_cos_field.txt", 'r')
-    gr_cos_field = numpy.fromfile(gr_cos_file, sep=', ')
-
-    st_file = open("snapshots/spatial_target_field.txt", 'r')
-    st_field = numpy.fromfile(st_file, sep=', ')
-    st_field = st_field.reshape(50,50)
-
-    pe_file = open("snapshots/perception_ee_field.txt", 'r')
-    pe_field = numpy.fromfile(pe_file, sep=', ')
-    pe_field = pe_field.reshape(50,50)
-
-    color_space_file = open("snapshots/color_space_field.txt", 'r')
-    color_space_field = numpy.fromfile(color_space_file, sep=', ')
-    color_space_field = color_space_field.reshape(50,50,50)
+    fc_int_field = ActivationRecorder.load_snapshot("snapshots/find_color_intention_field.txt")
+    fc_cos_field = ActivationRecorder.load_snapshot("snapshots/find_color_cos_field.txt")
+
+    mee_int_field = ActivationRecorder.load_snapshot("snapshots/move_ee_intention_field.txt", (50,50))
+    mee_cos_field = ActivationRecorder.load_snapshot("snapshots/move_ee_cos_field.txt", (50,50))
+
+    gr_int_field = ActivationRecorder.load_snapshot("snapshots/gripper_intention_field.txt")
+    gr_cos_field = ActivationRecorder.load_snapshot("snapshots/gripper_cos_field.txt")
+
+    st_field = ActivationRecorder.load_snapshot("snapshots/spatial_target_field.txt", (50,50))
+
+    pe_field = ActivationRecorder.load_snapshot("snapshots/perception_ee_field.txt", (50,50))
+
+    color_space_field = ActivationRecorder.load_snapshot("snapshots/color_space_field.txt", (50,50,50))
 
 
     plot_settings.set_mode("mini")
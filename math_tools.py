@@ -1,6 +1,7 @@
 import math
 import numpy
 import scipy.interpolate
+import scipy.sparse
 
 def linear_interpolation_1d(input_array, output_size):
     x = range(len(input_array))
@@ -45,6 +46,53 @@ def linear_interpolation_nd(input_array, output_sizes):
     x_new = cartesian(coord_ranges_new)
     return linear_interpolator(x_new).reshape(output_sizes)
 
+def linear_interpolation_matrix(input_size, output_size):
+    """Sparse matrix (output_size x input_size) that linearly interpolates a
+    vector of input_size samples onto output_size equidistant positions
+    (same grid as linear_interpolation_1d)."""
+    if (input_size == 1):
+        return scipy.sparse.csr_matrix(numpy.ones((output_size, 1)))
+
+    positions = numpy.linspace(0, input_size - 1, num=output_size)
+    lower = numpy.minimum(numpy.floor(positions).astype(int), input_size - 2)
+    fraction = positions - lower
+
+    rows = numpy.concatenate((numpy.arange(output_size), numpy.arange(output_size)))
+    columns = numpy.concatenate((lower, lower + 1))
+    values = numpy.concatenate((1.0 - fraction, fraction))
+
+    return scipy.sparse.csr_matrix((values, (rows, columns)), shape=(output_size, input_size))
+
+def spline_interpolation_matrix(input_size, output_size, order=3):
+    """Matrix (output_size x input_size) that evaluates the interpolating
+    spline through input_size samples at output_size equidistant positions.
+    Applied along each axis, it equals a tensor product spline (like
+    scipy.interpolate.RectBivariateSpline with s=0)."""
+    order = min(order, input_size - 1)
+    if (order < 1):
+        return numpy.ones((output_size, 1))
+
+    positions = numpy.linspace(0, input_size - 1, num=output_size)
+    basis = scipy.interpolate.make_interp_spline(numpy.arange(input_size), numpy.eye(input_size), k=order)
+
+    return basis(positions)
+
+def interpolate_separable(input_array, matrices):
+    """Applies one interpolation matrix per axis of input_array. Entries that
+    are None leave the corresponding axis untouched."""
+    output = input_array
+    for axis, matrix in enumerate(matrices):
+        if (matrix is None):
+            continue
+
+        moved = numpy.rollaxis(output, axis)
+        shape = moved.shape
+        result = matrix.dot(moved.reshape(shape[0], -1))
+        result = numpy.asarray(result).reshape((matrix.shape[0],) + shape[1:])
+        output = numpy.rollaxis(result, 0, axis + 1)
+
+    return numpy.ascontiguousarray(output)
+
 def product(value_list):
     product = 1    
     for value in value_list:
@@ -55,35 +103,76 @@ def product(value_list):
 def sigmoid_slow(x, beta, x0):
     return 1./ (1. + numpy.exp(-beta * (x - x0)))
 
-def sigmoid(x, beta, x0):
-    return 0.5 * (1.0 + beta * (x - x0) / (1.0 + beta * numpy.abs(x - x0)))
+def sigmoid(x, beta, x0, out=None, work=None):
+    """Fast sigmoid. If the arrays out and work (same shape as x) are
+    supplied, the result is written to out without allocating memory."""
+    if (out is None or work is None):
+        return 0.5 * (1.0 + beta * (x - x0) / (1.0 + beta * numpy.abs(x - x0)))
+
+    numpy.subtract(x, x0, out=out)
+    numpy.abs(out, out=work)
+    work *= beta
+    work += 1.0
+    out *= beta
+    out /= work
+    out += 1.0
+    out *= 0.5
+    return out
 
 def gauss_value(position, sigma, shift):
     return math.exp(- math.pow(position - shift, 2.0) / (2 * math.pow(sigma, 2.0)))
 
-def gauss_1d(size, amplitude, sigma, shift):
-    gauss = numpy.zeros(size)
-    for i in range(size):
-        gauss[i] = amplitude * gauss_value(i, sigma, shift)
+# Gaussian profiles along single axes, by size, sigma and (quantized) shift
+_gauss_profiles = {}
+# the cache of profiles is cleared when it holds more than this many entries
+GAUSS_PROFILE_CACHE_SIZE = 4096
+# shifts that come from sensors are rounded to multiples of this resolution (in
+# field cells), so that their profiles can be looked up in the cache
+GAUSS_SHIFT_RESOLUTION = 0.01
+
+def gauss_profile(size, sigma, shift, shift_resolution=None):
+    """Returns the (read-only) Gaussian profile of the given sigma and shift
+    along an axis of the given size. If shift_resolution is given, the shift is
+    rounded to a multiple of it first."""
+    if (shift_resolution is None):
+        key = (size, sigma, shift)
+    else:
+        steps = int(round(shift / shift_resolution))
+        key = (size, sigma, steps, shift_resolution)
+        shift = steps * shift_resolution
+
+    profile = _gauss_profiles.get(key)
+    if (profile is None):
+        if (len(_gauss_profiles) >= GAUSS_PROFILE_CACHE_SIZE):
+            _gauss_profiles.clear()
+
+        profile = numpy.exp(- (numpy.arange(size) - shift) ** 2 / (2 * math.pow(sigma, 2.0)))
+        profile.flags.writeable = False
+        _gauss_profiles[key] = profile
+
+    return profile
+
+def gauss_nd(sizes, amplitude, sigmas, shifts, shift_resolution=None):
+    """N-dimensional Gaussian, computed as the outer product of the profiles
+    along its axes (see gauss_profile())."""
+    number_of_dimensions = len(sizes)
+    gauss = numpy.array(float(amplitude))
+    for axis in range(number_of_dimensions):
+        profile = gauss_profile(sizes[axis], sigmas[axis], shifts[axis], shift_resolution)
+        shape = [1] * number_of_dimensions
+        shape[axis] = sizes[axis]
+        gauss = gauss * profile.reshape(shape)
 
     return gauss
 
-def gauss_2d(sizes, amplitude, sigmas, shifts):
-    gauss = numpy.zeros(sizes)
-    for i in range(sizes[0]):
-        for j in range(sizes[1]):
-            gauss[i][j] = amplitude * (gauss_value(i, sigmas[0], shifts[0]) * gauss_value(j, sigmas[1], shifts[1]))
+def gauss_1d(size, amplitude, sigma, shift):
+    return gauss_nd([size], amplitude, [sigma], [shift])
 
-    return gauss
+def gauss_2d(sizes, amplitude, sigmas, shifts):
+    return gauss_nd(sizes, amplitude, sigmas, shifts)
 
 def gauss_3d(sizes, amplitude, sigmas, shifts):
-    gauss = numpy.zeros(sizes)
-    for i in range(sizes[0]):
-        for j in range(sizes[1]):
-            for k in range(sizes[2]):
-                gauss[i][j][k] = amplitude * gauss_value(i, sigmas[0], shifts[0]) * gauss_value(j, sigmas[1], shifts[1]) * gauss_value(k, sigmas[2], shifts[2])
-
-    return gauss
+    return gauss_nd(sizes, amplitude, sigmas, shifts)
   
 def cartesian(arrays, out=None):
     """
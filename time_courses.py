@@ -9,10 +9,17 @@ from mpl_toolkits.axes_grid import ImageGrid
 from mpl_toolkits.axes_grid import make_axes_locatable
 import plot_settings
 import math_tools
+import ActivationRecorder
+import BackgroundWriter
 
 
 def main():
-    task_node = DynamicField.DynamicField([], [], None)
+    # the time courses are plotted against the record index, so no record may
+    # be dropped: the recording waits for the writer instead
+    writer = BackgroundWriter.BackgroundWriter(policy="block")
+    ActivationRecorder.set_default_recorder(ActivationRecorder.ActivationRecorder(writer=writer))
+
+    task_node = DynamicField.DynamicField([], [], None, name="task node")
 
     field_sizes = [80, 80]
 
@@ -47,34 +54,12 @@ def main():
     BehOrg.connect_to_task(task_node, elem_behavior_1)
 
     competition_nodes = BehOrg.competition(elem_behavior_0, elem_behavior_1, task_node, bidirectional=True)
+    competition_nodes[0].set_name("competition node 01")
+    competition_nodes[1].set_name("competition node 10")
 
 
     time_steps = 1000
 
-    task_node_activation = [0] * time_steps
-    eb0_intention_node_activation = [0] * time_steps
-    eb0_intention_field_activation = [0] * time_steps
-    eb0_cos_node_activation = [0] * time_steps
-    eb0_cos_field_activation = [0] * time_steps
-    eb0_cos_memory_node_activation = [0] * time_steps
-    eb0_intention_field_activation_1d = numpy.zeros((time_steps, field_sizes[1]))
-    eb0_cos_field_activation = [0] * time_steps
-    eb0_cos_field_activation_1d = numpy.zeros((time_steps, field_sizes[1]))
-    competition_node_01_activation = [0] * time_steps
-
-    eb1_intention_node_activation = [0] * time_steps
-    eb1_intention_field_activation = [0] * time_steps
-    eb1_cos_node_activation = [0] * time_steps
-    eb1_cos_field_activation = [0] * time_steps
-    eb1_cos_memory_node_activation = [0] * time_steps
-    eb1_intention_field_activation_1d = numpy.zeros((time_steps, field_sizes[1]))
-    eb1_cos_field_activation = [0] * time_steps
-    eb1_cos_field_activation_1d = numpy.zeros((time_steps, field_sizes[1]))
-    competition_node_10_activation = [0] * time_steps
-
-
-    print_output = False
-
     for i in range(time_steps):
 
         if (i > 1):
@@ -93,89 +78,28 @@ def main():
         competition_nodes[1].step()
         elem_behavior_1.step()
 
-
-        if (print_output is True):
-            print("task node activation (boost: " + str(task_node.get_boost()) + ")")
-        task_node_activation[i] = task_node.get_activation()[0]
-        if (print_output is True):
-            print(task_node_activation[i])
-
-        if (print_output is True):
-            print("int node activation")
-        eb0_intention_node_activation[i] = elem_behavior_0.get_intention_node().get_activation()[0]
-        if (print_output is True):
-            print(eb0_intention_node_activation[i])
-        if (print_output is True):
-            print("int field activation")
-        eb0_intention_field_activation[i] = elem_behavior_0.get_intention_field().get_activation()
-        if (print_output is True):
-            print(eb0_intention_field_activation[i])
-        if (print_output is True):
-            print("int field activation 1d")
-        eb0_intention_field_activation_1d[i] = eb0_intention_field_activation[i].max(0)
-        if (print_output is True):
-            print(eb0_intention_field_activation_1d)
-        if (print_output is True):
-            print("cos field activation (boost: " + str(elem_behavior_0.get_cos_field().get_boost()) + ")")
-        eb0_cos_field_activation[i] = elem_behavior_0.get_cos_field().get_activation()
-        if (print_output is True):
-            print(eb0_cos_field_activation[i])
-        if (print_output is True):
-            print("cos field activation 1d: ")
-        eb0_cos_field_activation_1d[i] = eb0_cos_field_activation[i].max(0)
-        if (print_output is True):
-            print(eb0_cos_field_activation_1d)
-        if (print_output is True):
-            print("cos node activation")
-        eb0_cos_node_activation[i] = elem_behavior_0.get_cos_node().get_activation()[0]
-        if (print_output is True):
-            print(eb0_cos_node_activation[i])
-            print("cos mem node activation")
-        eb0_cos_memory_node_activation[i] = elem_behavior_0.get_cos_memory_node().get_activation()[0]
-        if (print_output is True):
-            print(eb0_cos_memory_node_activation[i])
-
-            print("")
-            print("competition node 01 activation")
-        competition_node_01_activation[i] = competition_nodes[0].get_activation()[0]
-        if (print_output is True):
-            print(competition_node_01_activation[i])
-            print("competition node 10 activation")
-        competition_node_10_activation[i] = competition_nodes[1].get_activation()[0]
-        if (print_output is True):
-            print(competition_nodes[1].get_activation())
-            print("")
-
-            print("int node activation 1")
-        eb1_intention_node_activation[i] = elem_behavior_1.get_intention_node().get_activation()[0]
-        if (print_output is True):
-            print(elem_behavior_1.get_intention_node().get_activation())
-            print("int field activation 1")
-        eb1_intention_field_activation[i] = elem_behavior_1.get_intention_field().get_activation()
-        if (print_output is True):
-            print(elem_behavior_1.get_intention_field().get_activation())
-            print("int field activation 1 1d")
-        eb1_intention_field_activation_1d[i] = eb1_intention_field_activation[i].max(0)
-        if (print_output is True):
-            print(eb0_intention_field_activation_1d)
-        if (print_output is True):
-            print("cos field activation 1 (boost: " + str(elem_behavior_1.get_cos_field().get_boost()) + ")")
-        eb1_cos_field_activation[i] = elem_behavior_1.get_cos_field().get_activation()
-        if (print_output is True):
-            print(elem_behavior_1.get_cos_field().get_activation())
-        eb1_cos_field_activation_1d[i] = eb1_cos_field_activation[i].max(0)
-        if (print_output is True):
-            print(eb1_cos_field_activation_1d)
-        if (print_output is True):
-            print("cos node activation 1")
-        eb1_cos_node_activation[i] = elem_behavior_1.get_cos_node().get_activation()[0]
-        if (print_output is True):
-            print(elem_behavior_1.get_cos_node().get_activation())
-            print("cos mem node activation 1")
-        eb1_cos_memory_node_activation[i] = elem_behavior_1.get_cos_memory_node().get_activation()[0]
-        if (print_output is True):
-            print(elem_behavior_1.get_cos_memory_node().get_activation())
-            print("\n----------------------------------------------------\n")
+    # read the time courses from the activation recording (memory mapped)
+    recorder = ActivationRecorder.get_default_recorder()
+    recorder.flush()
+    if (recorder.get_number_of_dropped_records() > 0):
+        raise RuntimeError("Records of the time courses were dropped.")
+    recording = ActivationRecorder.RecordingReader(recorder.get_directory())
+
+    task_node_activation = recording["task node", :, 0]
+
+    eb0_intention_node_activation = recording["eb0 intention node", :, 0]
+    eb0_cos_node_activation = recording["eb0 cos node", :, 0]
+    eb0_cos_memory_node_activation = recording["eb0 cos memory node", :, 0]
+    eb0_intention_field_activation_1d = recording["eb0 intention field"].max(1)
+    eb0_cos_field_activation_1d = recording["eb0 cos field"].max(1)
+    competition_node_01_activation = recording["competition node 01", :, 0]
+
+    eb1_intention_node_activation = recording["eb1 intention node", :, 0]
+    eb1_cos_node_activation = recording["eb1 cos node", :, 0]
+    eb1_cos_memory_node_activation = recording["eb1 cos memory node", :, 0]
+    eb1_intention_field_activation_1d = recording["eb1 intention field"].max(1)
+    eb1_cos_field_activation_1d = recording["eb1 cos field"].max(1)
+    competition_node_10_activation = recording["competition node 10", :, 0]
 
     plot_settings.set_mode("icdl")
 
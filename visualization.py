@@ -657,11 +657,13 @@ class FieldControlWidget(QtGui.QWidget):
     def set_field_kernel_amplitude(self, kernel_amplitude):
         if self.current_field is not None:
             self.current_field.get_lateral_interaction_kernel(0).set_amplitude(kernel_amplitude)
+            self.current_field.lateral_interaction_kernels_changed()
             self.value_kernel_amplitude.setNum(kernel_amplitude)
 
     def set_field_kernel_width(self, kernel_width):
         if self.current_field is not None:
             self.current_field.get_lateral_interaction_kernel(0).set_width(kernel_width, 0)
+            self.current_field.lateral_interaction_kernels_changed()
             self.value_kernel_width.setNum(kernel_width)
 
     def set_field_noise(self, noise):